@@ -14,6 +14,9 @@ function DatabaseManagement() {
   const [isInitializing, setIsInitializing] = useState(false);
   const [dbStatus, setDbStatus] = useState(null);
   const [statusLoading, setStatusLoading] = useState(true);
+  const [deltaImport, setDeltaImport] = useState(false);
+  const importMode = deltaImport ? 'delta' : 'replace';
+  const [importProgress, setImportProgress] = useState(null);
 
   // Check database status on component mount
   useEffect(() => {
@@ -60,7 +63,7 @@ function DatabaseManagement() {
     setUploadResult(null);
     
     try {
-      const result = await uploadDatabase(jsonFile);
+      const result = await uploadDatabase(jsonFile, importMode, setImportProgress);
       setUploadResult(result);
       setJsonFile(null);
       // Reset the file input
@@ -73,6 +76,7 @@ function DatabaseManagement() {
       setUploadError(error.message);
     } finally {
       setIsUploading(false);
+      setImportProgress(null);
     }
   };
 
@@ -89,7 +93,7 @@ function DatabaseManagement() {
     setUploadResult(null);
     
     try {
-      const result = await uploadExcelDatabase(excelFile);
+      const result = await uploadExcelDatabase(excelFile, importMode, setImportProgress);
       setUploadResult(result);
       setExcelFile(null);
       // Reset the file input
@@ -102,6 +106,7 @@ function DatabaseManagement() {
       setUploadError(error.message);
     } finally {
       setIsUploading(false);
+      setImportProgress(null);
     }
   };
 
@@ -138,7 +143,7 @@ function DatabaseManagement() {
     setUploadResult(null);
     
     try {
-      const result = await initializeDatabase();
+      const result = await initializeDatabase(importMode, setImportProgress);
       setUploadResult(result);
       
       // Refresh database status
@@ -148,9 +153,22 @@ function DatabaseManagement() {
       setUploadError(error.message);
     } finally {
       setIsInitializing(false);
+      setImportProgress(null);
     }
   };
 
+  const renderImportProgress = () => {
+    if (!importProgress || importProgress.status !== 'running') return null;
+    
+    const { rows_processed: processed, total_rows: total, eta_seconds: eta } = importProgress;
+    return (
+      <p className="note">
+        Processed {processed}{total ? ` of ${total}` : ''} rows
+        {eta != null && ` (about ${Math.ceil(eta)}s remaining)`}
+      </p>
+    );
+  };
+
   return (
     <div className="database-management">
       <h1>Database Management</h1>
@@ -214,6 +232,16 @@ function DatabaseManagement() {
                 </label>
               </div>
               
+              <label className="delta-option">
+                <input
+                  type="checkbox"
+                  checked={deltaImport}
+                  onChange={(e) => setDeltaImport(e.target.checked)}
+                  disabled={isUploading}
+                />
+                Only apply changes (keeps IDs and aliases of unchanged records)
+              </label>
+              
               <button 
                 type="submit" 
                 className="upload-button"
@@ -223,6 +251,8 @@ function DatabaseManagement() {
               </button>
             </form>
             
+            {isUploading && renderImportProgress()}
+            
             {uploadError && (
               <div className="error-message">
                 <p>{uploadError}</p>
@@ -232,12 +262,20 @@ function DatabaseManagement() {
             {uploadResult && !uploadError && (
               <div className="success-message">
                 <p>{uploadResult.message}</p>
-                {uploadResult.formulas_created && (
+                {uploadResult.formulas_created && !uploadResult.delta && (
                   <p>
                     Imported {uploadResult.ingredients_created} ingredients, {uploadResult.formulas_created} formulas, 
                     and {uploadResult.formula_ingredients_created} formula-ingredient relationships.
                   </p>
                 )}
+                {uploadResult.delta && (
+                  <p>
+                    Formulas: {uploadResult.delta.formulas_added} added, {uploadResult.delta.formulas_updated} updated, 
+                    {' '}{uploadResult.delta.formulas_deleted} deleted, {uploadResult.delta.formulas_rewritten} with changed ingredients.
+                    Ingredients: {uploadResult.delta.ingredients_added} added, {uploadResult.delta.ingredients_updated} updated, 
+                    {' '}{uploadResult.delta.ingredients_deleted} deleted.
+                  </p>
+                )}
               </div>
             )}
             
@@ -278,6 +316,8 @@ function DatabaseManagement() {
               {isInitializing ? 'Initializing...' : 'Initialize Database'}
             </button>
             
+            {isInitializing && renderImportProgress()}
+            
             {uploadResult && !uploadError && (
               <div className="success-message">
                 <p>{uploadResult.message}</p>
@@ -307,6 +347,16 @@ function DatabaseManagement() {
                 </label>
               </div>
               
+              <label className="delta-option">
+                <input
+                  type="checkbox"
+                  checked={deltaImport}
+                  onChange={(e) => setDeltaImport(e.target.checked)}
+                  disabled={isUploading}
+                />
+                Only apply changes (keeps IDs and aliases of unchanged records)
+              </label>
+              
               <button 
                 type="submit" 
                 className="upload-button"
@@ -316,6 +366,8 @@ function DatabaseManagement() {
               </button>
             </form>
             
+            {isUploading && renderImportProgress()}
+            
             {uploadError && activeTab === 'json' && (
               <div className="error-message">
                 <p>{uploadError}</p>
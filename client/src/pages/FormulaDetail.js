@@ -1,7 +1,7 @@
 // client/src/pages/FormulaDetail.js
 import React, { useState, useEffect } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { getFormulaById } from '../services/api';
+import { getFormulaById, getSimilarFormulas } from '../services/api';
 import '../styles/FormulaDetail.scss';
 
 function FormulaDetail() {
@@ -9,6 +9,8 @@ function FormulaDetail() {
   const [formula, setFormula] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [similarFormulas, setSimilarFormulas] = useState([]);
+  const [similarMetric, setSimilarMetric] = useState('cosine');
 
   useEffect(() => {
     const fetchFormula = async () => {
@@ -26,6 +28,20 @@ function FormulaDetail() {
     fetchFormula();
   }, [objectNumber]);
 
+  useEffect(() => {
+    const fetchSimilar = async () => {
+      try {
+        const data = await getSimilarFormulas(objectNumber, similarMetric);
+        setSimilarFormulas(data.formulas);
+      } catch (error) {
+        console.error('Error fetching similar formulas:', error);
+        setSimilarFormulas([]);
+      }
+    };
+
+    fetchSimilar();
+  }, [objectNumber, similarMetric]);
+
   // Download PDF handler
   const handleDownloadPDF = async () => {
     const url = `/api/formulas/${objectNumber}/pdf`;
@@ -215,6 +231,46 @@ function FormulaDetail() {
           </table>
         </div>
       </div>
+
+      <div className="similar-section">
+        <div className="similar-header">
+          <h2>Similar Formulas</h2>
+          <select value={similarMetric} onChange={(e) => setSimilarMetric(e.target.value)}>
+            <option value="cosine">Cosine</option>
+            <option value="jaccard">Weighted Jaccard</option>
+          </select>
+        </div>
+        {similarFormulas.length === 0 ? (
+          <p className="no-similar">No formulas share weighted ingredients with this one.</p>
+        ) : (
+          <div className="ingredients-table">
+            <table>
+              <thead>
+                <tr>
+                  <th>Formula</th>
+                  <th>Name</th>
+                  <th>Brand</th>
+                  <th>Shared Ingredients</th>
+                  <th>Similarity</th>
+                </tr>
+              </thead>
+              <tbody>
+                {similarFormulas.map((similar) => (
+                  <tr key={similar.object_number}>
+                    <td className="item-number">
+                      <Link to={`/formula/${similar.object_number}`}>{similar.object_number}</Link>
+                    </td>
+                    <td>{similar.formulation_name}</td>
+                    <td>{similar.formula_brand}</td>
+                    <td className="amount">{similar.shared_ingredients}</td>
+                    <td className="amount">{(similar.similarity * 100).toFixed(1)}%</td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+          </div>
+        )}
+      </div>
     </div>
   );
 }
@@ -1,14 +1,21 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Link } from 'react-router-dom';
 import { getFormulas, getFilterOptions } from '../services/api';
 import FormulaCard from '../components/FormulaCard';
 import '../styles/FormulaList.scss';
 import downloadLogo from '../assets/download_logo.svg';
 
+const PAGE_SIZE = 12;
+
 function FormulaList() {
   const [formulas, setFormulas] = useState([]);
   const [pagination, setPagination] = useState(null);
   const [currentPage, setCurrentPage] = useState(1);
+  const [total, setTotal] = useState(null);
+  // Cursor of each page reached by paging forward ('' is the first page); those pages are fetched
+  // by cursor, so a deep page costs the same as the first one. Pages without a cursor, such as the
+  // last page, are fetched by offset
+  const cursors = useRef(['']);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [noResultsWithFilters, setNoResultsWithFilters] = useState(false);
@@ -54,9 +61,17 @@ function FormulaList() {
       setNoResultsWithFilters(false);
       
       try {
-        const data = await getFormulas(currentPage, 12, selectedFilters);
+        const cursor = cursors.current[currentPage - 1];
+        const data = await getFormulas(currentPage, PAGE_SIZE, selectedFilters, cursor === undefined ? null : cursor);
         setFormulas(data.formulas);
         setPagination(data.pagination);
+        // Only the first page comes with the total
+        if (data.pagination.total !== null) {
+          setTotal(data.pagination.total);
+        }
+        if (data.pagination.next_cursor) {
+          cursors.current[currentPage] = data.pagination.next_cursor;
+        }
         
         // Check if we have no results but filters are applied
         const hasActiveFilters = Object.values(selectedFilters).some(filter => filter !== '');
@@ -85,6 +100,7 @@ function FormulaList() {
       ...selectedFilters,
       [filterType]: value
     });
+    cursors.current = [''];
     setCurrentPage(1); // Reset to first page when filters change
   };
   
@@ -94,6 +110,7 @@ function FormulaList() {
       category: '',
       lifecyclePhase: ''
     });
+    cursors.current = [''];
     setCurrentPage(1);
   };
   
@@ -199,6 +216,8 @@ function FormulaList() {
   }
 
   // Check if database is empty (no filters applied and no results)
+  const totalPages = total !== null ? Math.ceil(total / PAGE_SIZE) : null;
+
   const isDatabaseEmpty = formulas.length === 0 && 
                          !Object.values(selectedFilters).some(filter => filter !== '') && 
                          !noResultsWithFilters;
@@ -305,7 +324,7 @@ function FormulaList() {
               <div style={{ display: 'flex', alignItems: 'flex-end', justifyContent: 'space-between', margin: '0 0 16px 0' }}>
               {pagination && (
                   <div className="formula-stats" style={{ padding: 0, margin: 0, fontSize: '1rem' }}>
-                    <p style={{ margin: 0, padding: 0 }}>Showing {formulas.length} of {pagination.total} formulas (Page {pagination.current_page} of {pagination.pages})</p>
+                    <p style={{ margin: 0, padding: 0 }}>Showing {formulas.length} of {total} formulas (Page {currentPage} of {totalPages})</p>
                   </div>
                 )}
                 <div style={{ display: 'flex', alignItems: 'center', gap: '0.5rem', background: '#e3eafc', borderRadius: '6px', padding: '4px 8px' }}>
@@ -372,7 +391,7 @@ function FormulaList() {
                 <FormulaTable formulas={formulas} />
               )}
               
-              {pagination && pagination.pages > 1 && (
+              {pagination && (currentPage > 1 || pagination.has_next) && (
                 <div className="pagination">
                   <button 
                     onClick={() => handlePageChange(1)} 
@@ -384,14 +403,14 @@ function FormulaList() {
                   
                   <button 
                     onClick={() => handlePageChange(currentPage - 1)} 
-                    disabled={!pagination.has_prev}
+                    disabled={currentPage === 1}
                     className="pagination-button"
                   >
                     Previous
                   </button>
                   
                   <span className="pagination-info">
-                    Page {pagination.current_page} of {pagination.pages}
+                    Page {currentPage} of {totalPages}
                   </span>
                   
                   <button 
@@ -403,8 +422,8 @@ function FormulaList() {
                   </button>
                   
                   <button 
-                    onClick={() => handlePageChange(pagination.pages)} 
-                    disabled={currentPage === pagination.pages}
+                    onClick={() => handlePageChange(totalPages)} 
+                    disabled={totalPages === null || currentPage >= totalPages}
                     className="pagination-button"
                   >
                     Last
@@ -1,13 +1,25 @@
 import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
-import { searchFormulas, getFilterOptions, getIngredients } from '../services/api';
+import { searchFormulas, getFilterOptions, suggestIngredients } from '../services/api';
 import FormulaCard from '../components/FormulaCard';
 import '../styles/SearchPage.scss';
 import downloadLogo from '../assets/download_logo.svg';
 
+// Units an amount range can be given in; ranges in a unit also match lines recorded in
+// convertible units (1 g matches 1000 mg), "As recorded" compares the raw amounts
+const AMOUNT_UNITS = [
+  { value: '', label: 'As recorded' },
+  { value: 'mg', label: 'mg' },
+  { value: 'g', label: 'g' },
+  { value: 'kg', label: 'kg' },
+  { value: 'ml', label: 'ml' },
+  { value: 'l', label: 'l' },
+  { value: '%', label: '%' }
+];
+
 function SearchPage() {
   const [ingredientInputs, setIngredientInputs] = useState([
-    { name: '', minAmount: '', maxAmount: '' }
+    { name: '', minAmount: '', maxAmount: '', unit: '' }
   ]);
   const [brand, setBrand] = useState('');
   const [category, setCategory] = useState('');
@@ -17,6 +29,7 @@ function SearchPage() {
   const [searching, setSearching] = useState(false);
   const [hasSearched, setHasSearched] = useState(false);
   const [pagination, setPagination] = useState(null);
+  const [corrections, setCorrections] = useState({});
   const [currentPage, setCurrentPage] = useState(1);
   const [hoveredRow, setHoveredRow] = useState(null);
   
@@ -61,9 +74,9 @@ function SearchPage() {
       setExcludeSuggestions([]);
       return;
     }
-    getIngredients(1, 10, excludeInput).then(res => {
+    suggestIngredients(excludeInput, 10).then(res => {
       if (active) {
-        setExcludeSuggestions(res.ingredients || res.results || []);
+        setExcludeSuggestions(res.ingredients || []);
       }
     });
     return () => { active = false; };
@@ -86,6 +99,7 @@ function SearchPage() {
         lifecyclePhase,
         formulation_name: formulationName,
         production_site: productionSite,
+        fuzzy: true,
       };
       
       // Add exclude ingredients as exclude_ingredient1, exclude_ingredient2, ...
@@ -96,6 +110,7 @@ function SearchPage() {
       const data = await searchFormulas(searchParams, currentPage);
       setResults(data.formulas);
       setPagination(data.pagination);
+      setCorrections(data.corrections || {});
     } catch (error) {
       console.error('Error searching formulas:', error);
     } finally {
@@ -116,6 +131,7 @@ function SearchPage() {
         lifecyclePhase,
         formulation_name: formulationName,
         production_site: productionSite, // ensure production site is included
+        fuzzy: true,
       };
       // Add exclude ingredients as exclude_ingredient1, exclude_ingredient2, ...
       excludeIngredients.forEach((ing, idx) => {
@@ -124,6 +140,7 @@ function SearchPage() {
       const data = await searchFormulas(searchParams, newPage);
       setResults(data.formulas);
       setPagination(data.pagination);
+      setCorrections(data.corrections || {});
     } catch (error) {
       console.error('Error searching formulas:', error);
     } finally {
@@ -132,7 +149,7 @@ function SearchPage() {
   };
 
   const addIngredientField = () => {
-    setIngredientInputs([...ingredientInputs, { name: '', minAmount: '', maxAmount: '' }]);
+    setIngredientInputs([...ingredientInputs, { name: '', minAmount: '', maxAmount: '', unit: '' }]);
   };
 
   const removeIngredientField = (index) => {
@@ -192,11 +209,13 @@ function SearchPage() {
       params.append(`ingredientFilters[${idx}][name]`, ing.name);
       if (ing.minAmount) params.append(`ingredientFilters[${idx}][minAmount]`, ing.minAmount);
       if (ing.maxAmount) params.append(`ingredientFilters[${idx}][maxAmount]`, ing.maxAmount);
+      if (ing.unit) params.append(`ingredientFilters[${idx}][unit]`, ing.unit);
     });
     // Add exclude ingredients
     excludeIngredients.forEach((ing, idx) => {
       params.append(`exclude_ingredient${idx+1}`, ing.name);
     });
+    params.append('fuzzy', '1');
     const url = `/api/formulas/export?${params.toString()}`;
     try {
       const response = await fetch(url);
@@ -312,6 +331,19 @@ function SearchPage() {
                       className="amount-input"
                     />
                   </div>
+                  
+                  <div className="amount-input-group">
+                    <label>Unit</label>
+                    <select
+                      value={input.unit}
+                      onChange={(e) => updateIngredientInput(index, 'unit', e.target.value)}
+                      className="amount-input"
+                    >
+                      {AMOUNT_UNITS.map(unit => (
+                        <option key={unit.value} value={unit.value}>{unit.label}</option>
+                      ))}
+                    </select>
+                  </div>
                 </div>
                 
                 {ingredientInputs.length > 1 && (
@@ -524,6 +556,12 @@ function SearchPage() {
       
       <div className="search-results">
         <h2>Results</h2>
+        {hasSearched && Object.keys(corrections).length > 0 && (
+          <p className="search-corrections">
+            Showing results for{' '}
+            {Object.entries(corrections).map(([term, correction]) => `"${correction}" (not "${term}")`).join(', ')}
+          </p>
+        )}
         {/* Stats, export, and view toggle row */}
         {hasSearched && results.length > 0 && (
           <div style={{ display: 'flex', alignItems: 'flex-end', justifyContent: 'space-between', margin: '0 0 15px 0' }}>
@@ -1,7 +1,9 @@
 const API_URL = process.env.REACT_APP_API_URL || '/api';
 
-export const getFormulas = async (page = 1, perPage = 12, filters = {}) => {
+// Pass a cursor ('' for the first page, then pagination.next_cursor) to page by cursor instead of page number
+export const getFormulas = async (page = 1, perPage = 12, filters = {}, cursor = null) => {
   let url = `${API_URL}/formulas?page=${page}&per_page=${perPage}`;
+  if (cursor !== null) url += `&cursor=${encodeURIComponent(cursor)}`;
   
   // Add filters to URL if provided
   if (filters.brand) url += `&brand=${encodeURIComponent(filters.brand)}`;
@@ -24,8 +26,17 @@ export const getFormulaById = async (objectNumber) => {
   return response.json();
 };
 
-export const searchFormulas = async (searchParams, page = 1, perPage = 12) => {
+export const getSimilarFormulas = async (objectNumber, metric = 'cosine', limit = 10) => {
+  const response = await fetch(`${API_URL}/formulas/${objectNumber}/similar?metric=${metric}&limit=${limit}`);
+  if (!response.ok) {
+    throw new Error('Failed to fetch similar formulas');
+  }
+  return response.json();
+};
+
+export const searchFormulas = async (searchParams, page = 1, perPage = 12, cursor = null) => {
   let url = `${API_URL}/formulas/search?page=${page}&per_page=${perPage}`;
+  if (cursor !== null) url += `&cursor=${encodeURIComponent(cursor)}`;
   
   // Add ingredient search parameters with coupled amount ranges
   if (searchParams.ingredientFilters && searchParams.ingredientFilters.length > 0) {
@@ -40,6 +51,10 @@ export const searchFormulas = async (searchParams, page = 1, perPage = 12) => {
         if (filter.maxAmount) {
           url += `&max_amount${index+1}=${encodeURIComponent(filter.maxAmount)}`;
         }
+        
+        if (filter.unit) {
+          url += `&unit${index+1}=${encodeURIComponent(filter.unit)}`;
+        }
       }
     });
   }
@@ -65,6 +80,11 @@ export const searchFormulas = async (searchParams, page = 1, perPage = 12) => {
     url += `&formulation_name=${encodeURIComponent(searchParams.formulation_name)}`;
   }
   
+  // Replace misspelled ingredient terms by their closest spelling
+  if (searchParams.fuzzy) {
+    url += '&fuzzy=1';
+  }
+  
   // Add exclude ingredients
   Object.keys(searchParams).forEach(key => {
     if (key.startsWith('exclude_ingredient')) {
@@ -80,10 +100,35 @@ export const searchFormulas = async (searchParams, page = 1, perPage = 12) => {
   return response.json();
 };
 
+export const getJob = async (jobId) => {
+  const response = await fetch(`${API_URL}/jobs/${jobId}`);
+  if (!response.ok) {
+    const errorData = await response.json().catch(() => ({ error: 'Failed to get job status' }));
+    throw new Error(errorData.error || 'Failed to get job status');
+  }
+  return response.json();
+};
+
+// Imports run as background jobs: poll the job until it finishes and return its result
+const waitForJob = async (response, onProgress) => {
+  const { job_id: jobId } = await response.json();
+  
+  while (true) {
+    const job = await getJob(jobId);
+    if (onProgress) onProgress(job);
+    
+    if (job.status === 'succeeded') return job.result;
+    if (job.status === 'failed') throw new Error(job.error || 'Import failed');
+    
+    await new Promise(resolve => setTimeout(resolve, 1000));
+  }
+};
+
 // Rest of the API service remains the same...
-export const uploadDatabase = async (file) => {
+export const uploadDatabase = async (file, mode = 'replace', onProgress) => {
   const formData = new FormData();
   formData.append('file', file);
+  formData.append('mode', mode);
   
   const response = await fetch(`${API_URL}/upload-database`, {
     method: 'POST',
@@ -95,7 +140,7 @@ export const uploadDatabase = async (file) => {
     throw new Error(errorData.error || 'Failed to upload database');
   }
   
-  return response.json();
+  return waitForJob(response, onProgress);
 };
 
 export const exportDatabase = async () => {
@@ -108,9 +153,10 @@ export const exportDatabase = async () => {
   return response.json();
 };
 
-export const uploadExcelDatabase = async (file) => {
+export const uploadExcelDatabase = async (file, mode = 'replace', onProgress) => {
   const formData = new FormData();
   formData.append('file', file);
+  formData.append('mode', mode);
   
   const response = await fetch(`${API_URL}/upload-excel`, {
     method: 'POST',
@@ -122,11 +168,11 @@ export const uploadExcelDatabase = async (file) => {
     throw new Error(errorData.error || 'Failed to upload Excel database');
   }
   
-  return response.json();
+  return waitForJob(response, onProgress);
 };
 
-export const initializeDatabase = async () => {
-  const response = await fetch(`${API_URL}/initialize-database`, {
+export const initializeDatabase = async (mode = 'replace', onProgress) => {
+  const response = await fetch(`${API_URL}/initialize-database?mode=${mode}`, {
     method: 'POST',
   });
   
@@ -135,7 +181,7 @@ export const initializeDatabase = async () => {
     throw new Error(errorData.error || 'Failed to initialize database');
   }
   
-  return response.json();
+  return waitForJob(response, onProgress);
 };
 
 export const getDatabaseStatus = async () => {
@@ -154,13 +200,26 @@ export const getFilterOptions = async () => {
   return response.json();
 };
 
-export const getIngredients = async (page = 1, perPage = 50, search = '') => {
+export const suggestIngredients = async (search, limit = 10) => {
+  const response = await fetch(`${API_URL}/ingredients/suggest?search=${encodeURIComponent(search)}&limit=${limit}`);
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.error || 'Failed to fetch ingredient suggestions');
+  }
+  return response.json();
+};
+
+export const getIngredients = async (page = 1, perPage = 50, search = '', fuzzy = false) => {
   let url = `${API_URL}/ingredients?page=${page}&per_page=${perPage}`;
   
   if (search) {
     url += `&search=${encodeURIComponent(search)}`;
   }
   
+  if (fuzzy) {
+    url += '&fuzzy=1';
+  }
+  
   const response = await fetch(url);
   if (!response.ok) {
     const errorData = await response.json();
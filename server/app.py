@@ -1,18 +1,57 @@
+import functools
 import os
+import numpy as np
 import pandas as pd
 import datetime
-from flask import Flask, request, jsonify, send_file, render_template, send_from_directory
+from flask import (
+    Flask, Response, g, request, jsonify, make_response, send_file, render_template, send_from_directory,
+    stream_with_context
+)
 from flask_cors import CORS
-from models.formula import db, Formula, Ingredient, FormulaIngredient, IngredientAlias
-from sqlalchemy import and_, or_, func, distinct
+from models.formula import db, Formula, Ingredient, FormulaIngredient, IngredientAlias, ProductionSite
+from services.importer import (
+    IMPORT_COLUMNS, REQUIRED_COLUMNS, DatabaseJsonImporter, DeltaImporter, SynapsImporter,
+    database_json_frames, normalize_synaps_frame
+)
+from services.cache import DataGeneration, LRUCache
+from services.counts import CountCache
+from services.cursor import cursor_page, decode_cursor
+from services.excel_reader import count_excel_rows, iter_excel_chunks, read_excel_header
+from services.exporter import gzip_chunks, iter_database_json, iter_database_ndjson
+from services.formula_index import FormulaIndexHolder
+from services.fuzzy_match import FuzzyIngredientIndex
+from services.jobs import JobRunner
+from services.json_stream import iter_json_array, json_array_keys
+from services.metadata import rebuild_reason, set_metadata, source_metadata
+from services.migrations import (
+    add_missing_columns, add_missing_tables, create_missing_indexes, query_plan_report, query_plans
+)
+from services.search_index import (
+    drop_search_index, ensure_search_index, ingredient_ids_matching, matching_ingredients, normalize_term
+)
+from services.search_planner import SearchPlanner, correct_search, load_formulas, parse_search
+from services.search_sql import (
+    search_count_statement, search_formulas_sql, search_formulas_sql_after
+)
+from services.serializer import serialize_formula_detail, serialize_formulas
+from services.shadow import build_and_swap, import_lock, install_swap_detection, swap_lock
+from services.similarity import METRICS, CompositionMatrixHolder
+from services.snapshot import (
+    SnapshotWriter, file_digest, has_snapshot, iter_snapshot_chunks, snapshot_dir, snapshot_row_count
+)
+from services.suggest import IngredientSuggestIndex
+from sqlalchemy import and_, or_, func, distinct, select
 from werkzeug.utils import secure_filename
 import json
+import uuid
 from io import BytesIO
 import openpyxl
 from openpyxl.worksheet.table import Table, TableStyleInfo
-from xhtml2pdf import pisa
 
-app = Flask(__name__)
+# Where the database, uploads, backups and job state live; FIND_DATA_DIR moves them elsewhere
+DATA_DIR = os.path.abspath(os.environ.get('FIND_DATA_DIR', os.path.dirname(__file__)))
+
+app = Flask(__name__, instance_path=os.path.join(DATA_DIR, 'instance'))
 CORS(app, origins=[
     "https://victorious-field-0dec9f70f.6.azurestaticapps.net", 
     "https://victorious-field-0dec9f70f.6.azurestaticapps.net/", 
@@ -20,19 +59,238 @@ CORS(app, origins=[
 ])
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///formulas.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
+app.config['UPLOAD_FOLDER'] = os.path.join(DATA_DIR, 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 
+# Search backend: 'bitmap' (in-memory formula index) or 'sql' (one compiled statement); ?engine= overrides it
+app.config['SEARCH_ENGINE'] = os.environ.get('SEARCH_ENGINE', 'bitmap')
+
+# Workbook the database is initialized from on startup
+STARTUP_EXCEL_PATH = os.path.join(app.config['UPLOAD_FOLDER'], "Synaps Full 2025 Q1.xlsx")
+
 # Ensure uploads directory exists
-BACKUPS_DIR = os.path.join(os.path.dirname(__file__), 'backups')
+BACKUPS_DIR = os.path.join(DATA_DIR, 'backups')
 os.makedirs(BACKUPS_DIR, exist_ok=True)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 db.init_app(app)
 
-def initialize_database_from_excel():
-    """Load the database from a predefined Excel file on server startup"""
-    excel_path = os.path.join(app.config['UPLOAD_FOLDER'], "Synaps Full 2025 Q1.xlsx")
+# Full imports swap in a new database file; pooled connections notice and reopen it
+with app.app_context():
+    install_swap_detection(db.engine)
+    ensure_search_index(db.engine)
+
+# Imports run in the background; their state is kept in JOBS_DIR so every worker can report on it
+JOBS_DIR = os.path.join(DATA_DIR, 'jobs')
+jobs = JobRunner(app, JOBS_DIR)
+
+# Bumped by every write path; shared through a file so caches of all workers see it
+data_generation = DataGeneration(os.path.join(app.instance_path, 'data_generation'))
+
+# Search terms -> ingredient ids; the same few hundred terms make up most searches
+INGREDIENT_TERM_CACHE_SIZE = 4096
+ingredient_term_cache = LRUCache(INGREDIENT_TERM_CACHE_SIZE, data_generation)
+
+def data_changed():
+    """Invalidate cached search data in every worker after a write"""
+    data_generation.bump()
+
+def data_imported():
+    """data_changed() for imports: also builds this worker's search indexes for the new data right away"""
+    data_changed()
+    composition_matrix.current(db.session)
+    fuzzy_ingredients.current(db.session)
+    ingredient_suggestions.current(db.session)
+
+def resolve_ingredient_term(term):
+    """Ids (sorted tuple) of the ingredients matching a search term by name or alias, cached per normalized term"""
+    return ingredient_term_cache.get_or_set(
+        normalize_term(term),
+        lambda: tuple(sorted(ingredient_ids_matching(term)))
+    )
+
+# Result counts of listings and searches by canonical filters; ?count=estimated answers
+# uncached counts with a quick estimate and computes the exact one in the background
+COUNT_CACHE_SIZE = 1024
+count_cache = CountCache(app, COUNT_CACHE_SIZE, data_generation)
+
+def paging_key(args):
+    return (
+        args.get('page', 1, type=int),
+        args.get('per_page', 12, type=int),
+        args.get('cursor'),
+        args.get('count') or 'exact'
+    )
+
+def search_request_key(args):
+    """Canonical form of a search request: parameter order, filter order and term case don't matter"""
+    return (
+        parse_search(args),
+        paging_key(args),
+        args.get('engine', app.config['SEARCH_ENGINE']),
+        args.get('fuzzy') == '1'
+    )
+
+def listing_request_key(args):
+    return (args.get('brand') or '', args.get('category') or '', args.get('lifecycle_phase') or '', paging_key(args))
+
+def result_count(key, count_statement, at_least=0):
+    """(total, exact) of the results of count_statement, from the count cache"""
+    estimated = request.args.get('count') == 'estimated'
+    total, exact = count_cache.total(key, count_statement, estimated, at_least)
+    if not exact:
+        # Don't serve the estimate from the response cache once the exact count is known
+        g.response_cacheable = False
+    return total, exact
+
+# Whole JSON responses of listings and searches by canonical request; people page back and
+# forth through the same searches all day. Responses are up to a few hundred kB each.
+RESPONSE_CACHE_SIZE = 256
+response_cache = LRUCache(RESPONSE_CACHE_SIZE, data_generation)
+
+def cached_response(request_key):
+    """Serve a GET endpoint from response_cache, keyed by its path and request_key(request.args).
+
+    Only successful responses are kept, and not those that set g.response_cacheable = False
+    (e.g. because their total is only an estimate).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            uncached = []
+            
+            def render():
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and g.get('response_cacheable', True):
+                    return response.get_data()
+                uncached.append(response)
+                return None
+            
+            body = response_cache.get_or_set(
+                (request.path, request_key(request.args)), render, cacheable=lambda body: body is not None
+            )
+            if uncached:
+                return uncached[0]
+            return app.response_class(body, mimetype='application/json')
+        return wrapper
+    return decorator
+
+def holds_swap_lock(view):
+    """Run a view that writes aliases under swap_lock, so a full import swapping in a new database keeps its changes"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with swap_lock():
+            return view(*args, **kwargs)
+    return wrapper
+
+# Inverted ingredient -> formulas index for search, rebuilt after data changes
+formula_index = FormulaIndexHolder(data_generation)
+
+# Sparse formula x ingredient weights for similar-formula ranking, rebuilt with the index
+composition_matrix = CompositionMatrixHolder(formula_index)
+
+# Most similar formulas returned by default and at most
+SIMILAR_FORMULAS_LIMIT = 10
+SIMILAR_FORMULAS_MAX_LIMIT = 100
+
+# Optimized search plans by canonical query, with their ingredient terms resolved
+SEARCH_PLAN_CACHE_SIZE = 1024
+search_planner = SearchPlanner(SEARCH_PLAN_CACHE_SIZE, data_generation, resolve_ingredient_term)
+
+# Typo-tolerant ingredient matching for ?fuzzy=1, updated incrementally after data changes
+FUZZY_MATCH_LIMIT = 50
+fuzzy_ingredients = FuzzyIngredientIndex(data_generation)
+
+# Ingredient autocomplete, served from memory and updated incrementally after data changes
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+ingredient_suggestions = IngredientSuggestIndex(data_generation)
+
+def search_query(args):
+    """(SearchQuery, corrections) of a search request.
+
+    With fuzzy=1, ingredient terms that match no ingredient are replaced by the closest spelling
+    of an ingredient name or alias; corrections maps each replaced term to its replacement.
+    """
+    query = parse_search(args)
+    if args.get('fuzzy') != '1':
+        return query, {}
+    return correct_search(query, resolve_ingredient_term, fuzzy_ingredients.current(db.session).correct)
+
+def cursor_pagination(per_page, next_cursor, total=None, total_exact=True):
+    """Pagination metadata of a cursor-mode page; total is None when it was not counted"""
+    return {
+        'total': total,
+        'total_exact': total_exact,
+        'per_page': per_page,
+        'has_next': next_cursor is not None,
+        'next_cursor': next_cursor
+    }
+
+def empty_search_response(page, per_page, cursor=None, **fields):
+    if cursor is not None:
+        return jsonify({'formulas': [], 'pagination': cursor_pagination(per_page, None, None if cursor else 0), **fields})
+    return jsonify({
+        **fields,
+        'formulas': [],
+        'pagination': {
+            'total': 0,
+            'total_exact': True,
+            'pages': 0,
+            'current_page': page,
+            'per_page': per_page,
+            'has_next': False,
+            'has_prev': False
+        }
+    })
+
+def job_accepted(job):
+    """Response for an endpoint that queued a background job"""
+    return jsonify({
+        'success': True,
+        'message': 'Import started',
+        'job_id': job.id,
+        'status_url': f'/api/jobs/{job.id}'
+    }), 202
+
+IMPORT_MODES = ('replace', 'delta')
+
+def backup_aliases_to_file():
+    """Write all aliases to a timestamped JSON backup before their ingredients are replaced"""
+    aliases_backup = []
+    rows = db.session.query(IngredientAlias.alias, Ingredient.name, Ingredient.fing_item_number).\
+        join(Ingredient, Ingredient.id == IngredientAlias.ingredient_id).all()
+    for alias, ingredient_name, ingredient_number in rows:
+        aliases_backup.append({
+            'ingredient_name': ingredient_name,
+            'ingredient_number': ingredient_number,
+            'alias': alias
+        })
+    
+    # Create an automatic backup if there are aliases
+    if aliases_backup:
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        backup_filename = f"aliases_backup_{timestamp}.json"
+        backup_path = os.path.join(BACKUPS_DIR, backup_filename)
+        
+        # Ensure backup directory exists
+        os.makedirs(BACKUPS_DIR, exist_ok=True)
+        
+        # Write the backup to a file
+        with open(backup_path, 'w') as f:
+            json.dump(aliases_backup, f, indent=2)
+        print(f"Created automatic backup: {backup_filename}")
+    
+    return len(aliases_backup)
+
+def initialize_database_from_excel(mode='replace', job=None):
+    """Load the database from a predefined Excel file on server startup.
+
+    mode='replace' builds a new database and swaps it in, mode='delta' only applies the differences.
+    When run as a background job, progress is reported on the job.
+    """
+    log = job.log if job else print
+    excel_path = STARTUP_EXCEL_PATH
     
     if not os.path.exists(excel_path):
         print(f"Warning: Default database file not found at {excel_path}")
@@ -40,159 +298,71 @@ def initialize_database_from_excel():
     
     try:
         print(f"Loading database from {excel_path}...")
-        df = pd.read_excel(excel_path)
-        
-        print(f"Successfully read Excel file with {len(df)} rows and {len(df.columns)} columns")
-        
-        # Backup existing aliases before clearing data
-        print("Backing up existing aliases...")
-        aliases_backup = []
-        for alias in IngredientAlias.query.all():
-            ingredient = Ingredient.query.get(alias.ingredient_id)
-            if ingredient:
-                aliases_backup.append({
-                    'ingredient_name': ingredient.name,
-                    'ingredient_number': ingredient.fing_item_number,
-                    'alias': alias.alias
-                })
         
-        # Create an automatic backup if there are aliases
-        if aliases_backup:
-            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_filename = f"aliases_backup_{timestamp}.json"
-            backup_path = os.path.join(BACKUPS_DIR, backup_filename)
-            
-            # Ensure backup directory exists
-            os.makedirs(BACKUPS_DIR, exist_ok=True)
+        # Reuse the parsed columns of this exact workbook if a snapshot was saved earlier
+        digest = file_digest(excel_path)
+        snapshot = snapshot_dir(app.config['UPLOAD_FOLDER'], digest)
+        if has_snapshot(snapshot):
+            print("Found columnar snapshot of Excel file, skipping Excel parsing")
+            frames = iter_snapshot_chunks(snapshot)
+            snapshot_writer = None
+            total_rows = snapshot_row_count(snapshot)
+        else:
+            columns = read_excel_header(excel_path)
+            print(f"Found {len(columns)} columns in Excel file")
+            frames = (normalize_synaps_frame(chunk) for chunk in iter_excel_chunks(excel_path, IMPORT_COLUMNS))
+            snapshot_writer = SnapshotWriter(snapshot)
+            total_rows = count_excel_rows(excel_path)
+        if job:
+            job.progress(total_rows=total_rows)
+        
+        def ingest(importer):
+            for frame in frames:
+                importer.ingest(frame)
+                if snapshot_writer:
+                    snapshot_writer.append(frame)
+                if job:
+                    job.progress(importer.rows_processed, errors=importer.errors)
+            return importer
+        
+        if mode == 'delta':
+            print("Importing Excel data as a delta against the current database...")
+            with import_lock():
+                importer = ingest(DeltaImporter(db.session, log=log))
+                importer.apply()
+                for key, value in source_metadata(excel_path, digest).items():
+                    set_metadata(db.session, key, value)
+                db.session.commit()
+            data_imported()
+        else:
+            # Backup existing aliases before they are carried over to the new database
+            print("Backing up existing aliases...")
+            backup_aliases_to_file()
             
-            # Write the backup to a file
-            with open(backup_path, 'w') as f:
-                json.dump(aliases_backup, f, indent=2)
-            print(f"Created automatic backup: {backup_filename}")
-        
-        # Clear existing data
-        print("Clearing existing database records...")
-        db.session.query(FormulaIngredient).delete()
-        db.session.query(Formula).delete()
-        db.session.query(IngredientAlias).delete()  # Delete aliases before ingredients
-        db.session.query(Ingredient).delete()
-        db.session.commit()
+            # Build the new data in a separate database file; readers see the old one until the swap
+            print("Importing Excel data into a new database...")
+            importer, aliases_restored = build_and_swap(
+                lambda session: ingest(SynapsImporter(session, log=log)),
+                log=log,
+                metadata=source_metadata(excel_path, digest)
+            )
+            data_imported()
+            print(f"Carried over {aliases_restored} aliases")
         
-        # Process the data
-        ingredients_dict = {}
-        formulas_dict = {}
-        formula_ingredients_created = 0
-        errors = 0
-        
-        # Process each row in the Excel file
-        print("Processing Excel data...")
-        for index, row in df.iterrows():
-            if index % 5000 == 0:
-                print(f"Processing row {index}/{len(df)}...")
-            
+        if snapshot_writer:
             try:
-                # Process ingredient if it doesn't exist
-                fing_item_number = str(row['FING_ITEM_NUMBER'])
-                if fing_item_number not in ingredients_dict:
-                    ingredient = Ingredient(
-                        fing_item_number=fing_item_number,
-                        name=str(row['FING_DESCRIPTION']),
-                        description=str(row['FING_DESCRIPTION']),
-                        description_expanded=str(row['Ingredient Description Expanded'])
-                    )
-                    db.session.add(ingredient)
-                    db.session.flush()  # Get the ID without committing
-                    ingredients_dict[fing_item_number] = ingredient.id
-                
-                # Process formula if it doesn't exist
-                object_number = str(row['OBJECT_NUMBER'])
-                if object_number not in formulas_dict:
-                    formula = Formula(
-                        object_number=object_number,
-                        formulation_name=str(row['FORMULATION_NAME']),
-                        lifecycle_phase=str(row['LIFECYCLE_PHASE']),
-                        formula_brand=str(row['FORMULA_BRAND']),
-                        sbu_category=str(row['SBU_CATEGORY']),
-                        dossier_type=str(row['DOSSIER_TYPE']),
-                        regulatory_comments=str(row['REGULATORY_COMMENTS']) if 'REGULATORY_COMMENTS' in row and not pd.isna(row['REGULATORY_COMMENTS']) else '',
-                        general_comments=str(row['GENERAL_COMMENTS']) if 'GENERAL_COMMENTS' in row and not pd.isna(row['GENERAL_COMMENTS']) else '',
-                        production_sites=str(row['PRODUCTION_SITES_AVAILABLE']) if 'PRODUCTION_SITES_AVAILABLE' in row and not pd.isna(row['PRODUCTION_SITES_AVAILABLE']) else '',
-                        predecessor_formulation_number=str(row['PREDECESSORFORMULATIONNUMBER']) if 'PREDECESSORFORMULATIONNUMBER' in row and not pd.isna(row['PREDECESSORFORMULATIONNUMBER']) else '',
-                        successor_formulation_number=str(row['SUCCESSORFORMULATIONNUMBER']) if 'SUCCESSORFORMULATIONNUMBER' in row and not pd.isna(row['SUCCESSORFORMULATIONNUMBER']) else ''
-                    )
-                    db.session.add(formula)
-                    db.session.flush()  # Get the ID without committing
-                    formulas_dict[object_number] = formula.id
-                
-                # Create formula ingredient relationship
-                # Handle NaN values in the amount field
-                amount = 0.0  # Default value
-                if 'FING_QUANTITY' in row:
-                    if pd.notna(row['FING_QUANTITY']):
-                        try:
-                            # Try to convert to float
-                            amount = float(row['FING_QUANTITY'])
-                        except (ValueError, TypeError):
-                            # If conversion fails, use the default value
-                            if isinstance(row['FING_QUANTITY'], str) and row['FING_QUANTITY'].strip().upper() == 'Q.S.':
-                                # Special case for "Q.S." (Quantum Satis - as much as needed)
-                                amount = 0.0  # Use 0 as a placeholder
-                                print(f"Row {index}: Q.S. value found, using 0.0 as placeholder")
-                            else:
-                                print(f"Row {index}: Invalid amount value: {row['FING_QUANTITY']}, using 0.0")
-                
-                unit = str(row['FING_UNIT']) if pd.notna(row['FING_UNIT']) else ''
-                
-                formula_ingredient = FormulaIngredient(
-                    formula_id=formulas_dict[object_number],
-                    ingredient_id=ingredients_dict[fing_item_number],
-                    amount=amount,
-                    unit=unit
-                )
-                db.session.add(formula_ingredient)
-                formula_ingredients_created += 1
-
-            
-
+                snapshot_writer.close()
+                print(f"Saved columnar snapshot to {snapshot}")
             except Exception as e:
-                errors += 1
-                print(f"Error processing row {index}: {str(e)}")
-                if errors >= 100:  # Limit the number of errors before giving up
-                    raise Exception(f"Too many errors ({errors}) during import. Last error: {str(e)}")
-                continue
-            
-            # Commit in batches to avoid memory issues
-            if index % 1000 == 0:
-                try:
-                    db.session.commit()
-                    print(f"Committed batch at row {index}")
-                except Exception as e:
-                    db.session.rollback()
-                    print(f"Error committing batch at row {index}: {str(e)}")
-                    # Continue with the next batch
-        
-                # Final commit
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error during final commit: {str(e)}")
-            return False
-        
-        # Restore aliases from the latest backup
-        print("Restoring aliases from latest backup...")
-        latest_backup = get_latest_backup()
-        if latest_backup:
-            aliases_restored = restore_aliases_from_backup(latest_backup)
-            print(f"Restored {aliases_restored} aliases from backup")
-        else:
-            print("No backup found to restore aliases from")
+                print(f"Error saving columnar snapshot: {str(e)}")
         
+        stats = importer.stats()
         print(f"Successfully loaded database from Excel:")
-        print(f"  - {len(ingredients_dict)} ingredients")
-        print(f"  - {len(formulas_dict)} formulas")
-        print(f"  - {formula_ingredients_created} formula-ingredient relationships")
-        print(f"  - {errors} errors encountered and skipped")
+        print(f"  - {stats['ingredients_created']} ingredients")
+        print(f"  - {stats['formulas_created']} formulas")
+        print(f"  - {stats['formula_ingredients_created']} formula-ingredient relationships")
+        print(f"  - {importer.invalid_amounts} invalid amounts stored as 0.0")
+        print(f"  - {stats['errors']} errors encountered and skipped")
         return True
         
     except Exception as e:
@@ -202,70 +372,8 @@ def initialize_database_from_excel():
         traceback.print_exc()
         return False
 
-def get_latest_backup():
-    """Get the latest aliases backup from the server"""
-    try:
-        backups = []
-        # List all JSON files in the backups directory
-        if os.path.exists(BACKUPS_DIR):
-            for filename in os.listdir(BACKUPS_DIR):
-                if filename.endswith('.json') and filename.startswith('aliases_backup_'):
-                    file_path = os.path.join(BACKUPS_DIR, filename)
-                    file_stats = os.stat(file_path)
-                    
-                    backups.append({
-                        'path': file_path,
-                        'mtime': file_stats.st_mtime
-                    })
-            
-            # Sort backups by modification time (newest first)
-            if backups:
-                backups.sort(key=lambda x: x['mtime'], reverse=True)
-                latest_backup = backups[0]['path']
-                
-                # Load and return the backup data
-                with open(latest_backup, 'r') as f:
-                    return json.load(f)
-    except Exception as e:
-        print(f"Error getting latest backup: {str(e)}")
-    
-    return None
-
-def restore_aliases_from_backup(aliases_data):
-    """Restore aliases from backup data"""
-    if not aliases_data:
-        return 0
-        
-    aliases_restored = 0
-    
-    for alias_data in aliases_data:
-        # Find the ingredient by name or number
-        ingredient = Ingredient.query.filter(
-            (Ingredient.name == alias_data['ingredient_name']) | 
-            (Ingredient.fing_item_number == alias_data['ingredient_number'])
-        ).first()
-        
-        if ingredient:
-            # Check if this alias already exists for the ingredient
-            existing_alias = IngredientAlias.query.filter_by(
-                ingredient_id=ingredient.id,
-                alias=alias_data['alias']
-            ).first()
-            
-            if not existing_alias:
-                new_alias = IngredientAlias(
-                    alias=alias_data['alias'],
-                    ingredient_id=ingredient.id
-                )
-                db.session.add(new_alias)
-                aliases_restored += 1
-    
-    if aliases_restored > 0:
-        db.session.commit()
-    
-    return aliases_restored
-
 @app.route('/api/formulas', methods=['GET'])
+@cached_response(listing_request_key)
 def get_formulas():
     try:
         # Get pagination parameters
@@ -283,56 +391,57 @@ def get_formulas():
         print(f"Fetching formulas (page {page}, per_page {per_page})...")
         
         # Build query with filters
-        query = Formula.query
+        conditions = []
         
         if brand:
-            query = query.filter(Formula.formula_brand == brand)
+            conditions.append(Formula.formula_brand == brand)
         
         if category:
-            query = query.filter(Formula.sbu_category == category)
+            conditions.append(Formula.sbu_category == category)
         
         if lifecycle_phase:
-            query = query.filter(Formula.lifecycle_phase == lifecycle_phase)
+            conditions.append(Formula.lifecycle_phase == lifecycle_phase)
         
-        # Get paginated formulas
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-        formulas = pagination.items
+        query = Formula.query.filter(*conditions)
+        count_key = ('formulas', brand, category, lifecycle_phase)
+        count_statement = select(func.count(Formula.id)).where(*conditions)
         
-        print(f"Found {len(formulas)} formulas for this page")
-        
-        result = []
-        for formula in formulas:
-            formula_data = {
-                'id': formula.id,
-                'object_number': formula.object_number,
-                'formulation_name': formula.formulation_name,
-                'lifecycle_phase': formula.lifecycle_phase,
-                'formula_brand': formula.formula_brand,
-                'sbu_category': formula.sbu_category,
-                'ingredients': []
-            }
-            
-            for formula_ingredient in formula.ingredients:
-                ingredient = Ingredient.query.get(formula_ingredient.ingredient_id)
-                formula_data['ingredients'].append({
-                    'id': ingredient.id,
-                    'name': ingredient.name,
-                    'fing_item_number': ingredient.fing_item_number,
-                    'amount': formula_ingredient.amount,
-                    'unit': formula_ingredient.unit
-                })
+        # Cursor mode (opt-in with ?cursor=, empty for the first page): seek past the last id seen
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            try:
+                after_id = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            per_page = max(per_page, 1)
+            rows = query.filter(Formula.id > after_id).order_by(Formula.id).limit(per_page + 1).all()
+            formulas, next_cursor = cursor_page(rows, per_page)
+            # Only the first page needs the count
+            total, total_exact = (None, True) if cursor else \
+                result_count(count_key, count_statement, len(formulas))
+            pagination_data = cursor_pagination(per_page, next_cursor, total, total_exact)
+        else:
+            # Get paginated formulas; the total comes from the count cache
+            pagination = query.paginate(page=page, per_page=per_page, error_out=False, count=False)
+            formulas = pagination.items
+            pagination.total, total_exact = result_count(
+                count_key, count_statement, (pagination.page - 1) * pagination.per_page + len(formulas)
+            )
             
-            result.append(formula_data)
+            # Include pagination metadata
+            pagination_data = {
+                'total': pagination.total,
+                'total_exact': total_exact,
+                'pages': pagination.pages,
+                'current_page': page,
+                'per_page': per_page,
+                'has_next': pagination.has_next,
+                'has_prev': pagination.has_prev
+            }
         
-        # Include pagination metadata
-        pagination_data = {
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev
-        }
+        print(f"Found {len(formulas)} formulas for this page")
+        
+        result = serialize_formulas(formulas)
         
         print(f"Returning {len(result)} formulas with pagination data")
         return jsonify({
@@ -349,37 +458,39 @@ def get_formulas():
 def get_formula(object_number):
     formula = Formula.query.filter_by(object_number=object_number).first_or_404()
     
-    formula_data = {
-        'id': formula.id,
-        'object_number': formula.object_number,
-        'formulation_name': formula.formulation_name,
-        'lifecycle_phase': formula.lifecycle_phase,
-        'formula_brand': formula.formula_brand,
-        'sbu_category': formula.sbu_category,
-        'dossier_type': formula.dossier_type,
-        'regulatory_comments': formula.regulatory_comments,
-        'general_comments': formula.general_comments,
-        'production_sites': formula.production_sites,
-        'predecessor_formulation_number': formula.predecessor_formulation_number,
-        'successor_formulation_number': formula.successor_formulation_number,
-        'ingredients': []
-    }
+    return jsonify(serialize_formula_detail(formula))
+
+@app.route('/api/formulas/<object_number>/similar', methods=['GET'])
+def get_similar_formulas(object_number):
+    formula = Formula.query.filter_by(object_number=object_number).first_or_404()
+    metric = request.args.get('metric', 'cosine')
+    if metric not in METRICS:
+        return jsonify({'error': f"Unknown metric '{metric}'; use one of {', '.join(METRICS)}"}), 400
+    limit = min(max(request.args.get('limit', SIMILAR_FORMULAS_LIMIT, type=int), 1), SIMILAR_FORMULAS_MAX_LIMIT)
     
-    for formula_ingredient in formula.ingredients:
-        ingredient = Ingredient.query.get(formula_ingredient.ingredient_id)
-        formula_data['ingredients'].append({
-            'id': ingredient.id,
-            'name': ingredient.name,
-            'fing_item_number': ingredient.fing_item_number,
-            'description': ingredient.description,
-            'description_expanded': ingredient.description_expanded,
-            'amount': formula_ingredient.amount,
-            'unit': formula_ingredient.unit
+    try:
+        ranked = composition_matrix.current(db.session).similar(formula.id, metric, limit)
+        formulas = {f.id: f for f in load_formulas(sorted(formula_id for formula_id, _, _ in ranked))}
+        ranked = [entry for entry in ranked if entry[0] in formulas]
+        
+        similar = serialize_formulas([formulas[formula_id] for formula_id, _, _ in ranked])
+        for formula_data, (_, score, shared) in zip(similar, ranked):
+            formula_data['similarity'] = round(score, 4)
+            formula_data['shared_ingredients'] = shared
+        
+        return jsonify({
+            'object_number': formula.object_number,
+            'metric': metric,
+            'formulas': similar
         })
-    
-    return jsonify(formula_data)
+    except Exception as e:
+        print(f"Error in get_similar_formulas: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/formulas/search', methods=['GET'])
+@cached_response(search_request_key)
 def search_formulas():
     try:
         # Get pagination parameters
@@ -389,217 +500,98 @@ def search_formulas():
         # Limit maximum per_page to avoid overwhelming responses
         per_page = min(per_page, 400)
         
-        # Start with a base query
-        query = Formula.query
-        
-        # Check for multiple ingredients with coupled amount ranges
-        ingredient_filters = []
-        i = 1
-        while True:
-            ingredient_param = request.args.get(f'ingredient{i}')
-            if not ingredient_param:
-                # If we have ingredient1 but not ingredient2, check for the legacy 'ingredient' param
-                if i == 1:
-                    ingredient_param = request.args.get('ingredient')
-                    if ingredient_param:
-                        min_amount = request.args.get('min_amount')
-                        max_amount = request.args.get('max_amount')
-                        ingredient_filters.append({
-                            'name': ingredient_param,
-                            'min_amount': min_amount,
-                            'max_amount': max_amount
-                        })
-                break
-            
-            min_amount = request.args.get(f'min_amount{i}')
-            max_amount = request.args.get(f'max_amount{i}')
-            
-            ingredient_filters.append({
-                'name': ingredient_param,
-                'min_amount': min_amount,
-                'max_amount': max_amount
-            })
-            i += 1
-        
-        # If we have ingredient filters, apply them
-        if ingredient_filters:
-            # For each ingredient, we need to find formulas that contain it with the specified amount range
-            formula_ids_with_all_ingredients = None
+        # Cursor mode (opt-in with ?cursor=, empty for the first page): pages by id instead of offset
+        cursor = request.args.get('cursor')
+        try:
+            after_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Normalized filter tree, optimized and with its terms resolved (memoized per query)
+        query, corrections = search_query(request.args)
+        # Misspelled terms that fuzzy=1 replaced, so the page can say what it searched for
+        fields = {'corrections': corrections} if corrections else {}
+        try:
+            plan = search_planner.plan(query)
+        except ValueError as e:
+            # Unknown units and amounts that are not numbers
+            return jsonify({"error": str(e)}), 400
+        if plan.no_includes_match:
+            # No formulas match the ingredient filters
+            return empty_search_response(page, per_page, cursor, **fields)
+        
+        page_number = max(page, 1)
+        page_size = per_page if per_page >= 1 else 20
+        
+        search_engine = request.args.get('engine', app.config['SEARCH_ENGINE'])
+        if search_engine == 'sql':
+            # The whole filter tree as one statement (INTERSECT / EXCEPT subqueries, windowed count)
+            count_key = ('search', plan.query)
+            count_statement = search_count_statement(plan.query)
+            if cursor is not None:
+                rows = search_formulas_sql_after(plan.query, after_id, page_size + 1)
+                formulas, next_cursor = cursor_page(rows, page_size)
+                # Only the first page needs the count
+                total_count, total_exact = (None, True) if cursor else \
+                    result_count(count_key, count_statement, len(formulas))
+            else:
+                # A cached count saves the window; an estimated count is only computed once the page is known
+                total_count = count_cache.get(count_key)
+                with_total = total_count is None and request.args.get('count') != 'estimated'
+                formulas, page_total = search_formulas_sql(plan.query, page_number, page_size, with_total)
+                total_exact = True
+                if with_total:
+                    total_count = count_cache.store(count_key, page_total)
+                elif total_count is None:
+                    total_count, total_exact = count_cache.estimate(
+                        count_key, count_statement, (page_number - 1) * page_size + len(formulas)
+                    )
+                    g.response_cacheable = total_exact
+                # Past the first page, an empty result whose ingredient filters alone match no formula
+                # gets the early empty response (has_prev false), as from the bitmap engine
+                if page > 1 and plan.includes_match_nothing(total_count):
+                    return empty_search_response(page, per_page, **fields)
+        else:
+            # Evaluate the plan as bitmap operations on the in-memory formula index
+            matching_formula_ids = plan.formula_ids(formula_index.current(db.session))
+            if matching_formula_ids is None:
+                return empty_search_response(page, per_page, cursor, **fields)
             
-            for ingredient_filter in ingredient_filters:
-                # Find ingredients matching the name OR any of their aliases
-                ingredient_name = ingredient_filter['name']
-                
-                # Find all ingredients that match by name or alias
-                matching_ingredients = db.session.query(Ingredient.id).distinct().\
-                    outerjoin(IngredientAlias, Ingredient.id == IngredientAlias.ingredient_id).\
-                    filter(
-                        db.or_(
-                            Ingredient.name.ilike(f'%{ingredient_name}%'),
-                            IngredientAlias.alias.ilike(f'%{ingredient_name}%')
-                        )
-                    ).all()
-                
-                matching_ingredient_ids = [r[0] for r in matching_ingredients]
-                
-                if not matching_ingredient_ids:
-                    # No ingredients match this filter, so no formulas will match
-                    return jsonify({
-                        'formulas': [],
-                        'pagination': {
-                            'total': 0,
-                            'pages': 0,
-                            'current_page': page,
-                            'per_page': per_page,
-                            'has_next': False,
-                            'has_prev': False
-                        }
-                    })
-                
-                # Find formulas containing any of these ingredients
-                subquery = db.session.query(FormulaIngredient.formula_id).\
-                    filter(FormulaIngredient.ingredient_id.in_(matching_ingredient_ids))
-                
-                # Apply amount filters for this specific ingredient
-                if ingredient_filter['min_amount']:
-                    subquery = subquery.filter(FormulaIngredient.amount >= float(ingredient_filter['min_amount']))
-                
-                if ingredient_filter['max_amount']:
-                    subquery = subquery.filter(FormulaIngredient.amount <= float(ingredient_filter['max_amount']))
-                
-                # Get distinct formula IDs that match this ingredient filter
-                formula_ids_with_ingredient = [r[0] for r in subquery.distinct().all()]
-                
-                # Intersect with previous results
-                if formula_ids_with_all_ingredients is None:
-                    formula_ids_with_all_ingredients = set(formula_ids_with_ingredient)
-                else:
-                    formula_ids_with_all_ingredients &= set(formula_ids_with_ingredient)
-                
-                # If at any point we have no matching formulas, we can stop
-                if not formula_ids_with_all_ingredients:
-                    break
+            # Count total results and cut out the requested page (in id order)
+            total_count = len(matching_formula_ids)
+            total_exact = True
             
-            # Apply the formula ID filter to our main query
-            if formula_ids_with_all_ingredients:
-                query = query.filter(Formula.id.in_(formula_ids_with_all_ingredients))
+            if cursor is not None:
+                # One more than a page tells whether there is a next one
+                start = np.searchsorted(matching_formula_ids, after_id, side='right')
+                rows = load_formulas(matching_formula_ids[start:start + page_size + 1])
+                formulas, next_cursor = cursor_page(rows, page_size)
             else:
-                # No formulas match all ingredients
-                return jsonify({
-                    'formulas': [],
-                    'pagination': {
-                        'total': 0,
-                        'pages': 0,
-                        'current_page': page,
-                        'per_page': per_page,
-                        'has_next': False,
-                        'has_prev': False
-                    }
-                })
-        
-        # Check for ingredient exclusions
-        exclude_ingredient_filters = []
-        i = 1
-        while True:
-            exclude_param = request.args.get(f'exclude_ingredient{i}')
-            if not exclude_param:
-                break
-            exclude_ingredient_filters.append(exclude_param)
-            i += 1
-        
-        # If we have exclusions, find all formulas that contain any of the excluded ingredients
-        if exclude_ingredient_filters:
-            exclude_ingredient_ids = set()
-            for exclude_name in exclude_ingredient_filters:
-                matching_ingredients = db.session.query(Ingredient.id).distinct().\
-                    outerjoin(IngredientAlias, Ingredient.id == IngredientAlias.ingredient_id).\
-                    filter(
-                        db.or_(
-                            Ingredient.name.ilike(f'%{exclude_name}%'),
-                            IngredientAlias.alias.ilike(f'%{exclude_name}%')
-                        )
-                    ).all()
-                exclude_ingredient_ids.update([r[0] for r in matching_ingredients])
-            if exclude_ingredient_ids:
-                # Find all formula IDs that contain any of these ingredients
-                exclude_formula_ids = db.session.query(FormulaIngredient.formula_id).\
-                    filter(FormulaIngredient.ingredient_id.in_(exclude_ingredient_ids)).distinct().all()
-                exclude_formula_ids = set([r[0] for r in exclude_formula_ids])
-                if exclude_formula_ids:
-                    query = query.filter(~Formula.id.in_(exclude_formula_ids))
-        
-        # Apply other filters
-        brand = request.args.get('brand')
-        if brand:
-            query = query.filter(Formula.formula_brand == brand)
-        
-        category = request.args.get('category')
-        if category:
-            query = query.filter(Formula.sbu_category == category)
-        
-        lifecycle_phase = request.args.get('lifecycle_phase')
-        if lifecycle_phase:
-            query = query.filter(Formula.lifecycle_phase == lifecycle_phase)
-        
-        # Filter by production site (partial, case-insensitive match)
-        production_site = request.args.get('production_site')
-        if production_site:
-            query = query.filter(Formula.production_sites.ilike(f'%{production_site}%'))
-        
-        # Filter by formulation name (partial, case-insensitive match)
-        formulation_name = request.args.get('formulation_name')
-        if formulation_name:
-            query = query.filter(Formula.formulation_name.ilike(f'%{formulation_name}%'))
-        
-        # Make sure results are distinct
-        query = query.distinct()
-        
-        # Count total results for pagination
-        total_count = query.count()
-        
-        # Apply pagination
-        formulas = query.paginate(page=page, per_page=per_page, error_out=False).items
+                formulas = load_formulas(matching_formula_ids[(page_number - 1) * page_size:page_number * page_size])
         
         # Prepare result
-        result = []
-        for formula in formulas:
-            formula_data = {
-                'id': formula.id,
-                'object_number': formula.object_number,
-                'formulation_name': formula.formulation_name,
-                'lifecycle_phase': formula.lifecycle_phase,
-                'formula_brand': formula.formula_brand,
-                'sbu_category': formula.sbu_category,
-                'ingredients': []
-            }
-            
-            for formula_ingredient in formula.ingredients:
-                ingredient = Ingredient.query.get(formula_ingredient.ingredient_id)
-                formula_data['ingredients'].append({
-                    'id': ingredient.id,
-                    'name': ingredient.name,
-                    'fing_item_number': ingredient.fing_item_number,
-                    'amount': formula_ingredient.amount,
-                    'unit': formula_ingredient.unit
-                })
-            
-            result.append(formula_data)
-        
-        # Calculate pagination metadata
-        total_pages = (total_count + per_page - 1) // per_page  # Ceiling division
+        result = serialize_formulas(formulas)
         
-        pagination_data = {
-            'total': total_count,
-            'pages': total_pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': page < total_pages,
-            'has_prev': page > 1
-        }
+        if cursor is not None:
+            pagination_data = cursor_pagination(page_size, next_cursor, total_count, total_exact)
+        else:
+            # Calculate pagination metadata
+            total_pages = (total_count + per_page - 1) // per_page  # Ceiling division
+            
+            pagination_data = {
+                'total': total_count,
+                'total_exact': total_exact,
+                'pages': total_pages,
+                'current_page': page,
+                'per_page': per_page,
+                'has_next': page < total_pages,
+                'has_prev': page > 1
+            }
         
         return jsonify({
             'formulas': result,
-            'pagination': pagination_data
+            'pagination': pagination_data,
+            **fields
         })
         
     except Exception as e:
@@ -639,6 +631,7 @@ def export_aliases():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/aliases/import', methods=['POST'])
+@holds_swap_lock
 def import_aliases():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
@@ -708,6 +701,7 @@ def import_aliases():
             
             # Commit the changes
             db.session.commit()
+            data_changed()
             
             # Clean up the file
             if os.path.exists(file_path):
@@ -742,16 +736,9 @@ def get_filter_options():
         phases_query = db.session.query(distinct(Formula.lifecycle_phase)).filter(Formula.lifecycle_phase != '').order_by(Formula.lifecycle_phase)
         lifecycle_phases = [phase[0] for phase in phases_query.all()]
         
-        # Get unique production sites (split by comma, strip whitespace, flatten)
-        sites_query = db.session.query(Formula.production_sites).filter(Formula.production_sites != '').distinct()
-        sites_set = set()
-        for row in sites_query:
-            if row[0]:
-                for site in row[0].split(','):
-                    site_clean = site.strip()
-                    if site_clean:
-                        sites_set.add(site_clean)
-        production_sites = sorted(sites_set)
+        # Production sites, split out of the formulas' site lists at import (in name index order)
+        sites_query = db.session.query(ProductionSite.name).order_by(ProductionSite.name)
+        production_sites = [site[0] for site in sites_query.all()]
         
         return jsonify({
             'brands': brands,
@@ -772,47 +759,67 @@ def get_ingredients():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
         search = request.args.get('search', '')
-        
-        # Base query joining with aliases to allow searching by alias
-        query = Ingredient.query.outerjoin(IngredientAlias)
-        
-        if search:
-            # Search by ingredient name OR alias
-            query = query.filter(
-                db.or_(
-                    Ingredient.name.ilike(f'%{search}%'),
-                    Ingredient.fing_item_number.ilike(f'%{search}%'),
-                    IngredientAlias.alias.ilike(f'%{search}%')
-                )
-            )
-        
-        # Make the query distinct to avoid duplicates from the join
-        query = query.distinct()
+        fuzzy = request.args.get('fuzzy') == '1'
+        
+        if search and fuzzy:
+            # Typo-tolerant: the FUZZY_MATCH_LIMIT closest ingredients by edit distance, closest first
+            ranked = fuzzy_ingredients.current(db.session).search(search, FUZZY_MATCH_LIMIT)
+            page = max(page, 1)
+            page_ranked = ranked[(page - 1) * per_page:page * per_page]
+            found = {
+                ingredient.id: ingredient
+                for ingredient in Ingredient.query.filter(Ingredient.id.in_([i for i, _ in page_ranked]))
+            }
+            items = [(found[i], distance) for i, distance in page_ranked if i in found]
+            total = len(ranked)
+            pages = (total + per_page - 1) // per_page if per_page > 0 else 0
+            pagination_data = {
+                'total': total,
+                'pages': pages,
+                'current_page': page,
+                'per_page': per_page,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            }
+        else:
+            query = Ingredient.query
             
-        # Apply pagination
-        pagination = query.order_by(Ingredient.name).paginate(page=page, per_page=per_page, error_out=False)
+            if search:
+                # Search by ingredient name, item number OR alias through the trigram index
+                query = query.filter(Ingredient.id.in_(matching_ingredients(search, include_item_number=True)))
+            
+            # Make the query distinct to avoid duplicates from the join
+            query = query.distinct()
+                
+            # Apply pagination
+            pagination = query.order_by(Ingredient.name).paginate(page=page, per_page=per_page, error_out=False)
+            items = [(ingredient, None) for ingredient in pagination.items]
+            pagination_data = {
+                'total': pagination.total,
+                'pages': pagination.pages,
+                'current_page': page,
+                'per_page': per_page,
+                'has_next': pagination.has_next,
+                'has_prev': pagination.has_prev
+            }
         
         ingredients = []
-        for ingredient in pagination.items:
+        for ingredient, distance in items:
             aliases = [alias.alias for alias in ingredient.aliases]
-            ingredients.append({
+            ingredient_data = {
                 'id': ingredient.id,
                 'name': ingredient.name,
                 'fing_item_number': ingredient.fing_item_number,
                 'description': ingredient.description,
                 'aliases': aliases
-            })
+            }
+            if search and fuzzy:
+                ingredient_data['distance'] = distance
+            ingredients.append(ingredient_data)
         
         return jsonify({
             'ingredients': ingredients,
-            'pagination': {
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'current_page': page,
-                'per_page': per_page,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
+            'pagination': pagination_data
         })
     except Exception as e:
         print(f"Error in get_ingredients: {str(e)}")
@@ -820,6 +827,20 @@ def get_ingredients():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/ingredients/suggest', methods=['GET'])
+def suggest_ingredients():
+    try:
+        search = request.args.get('search', '')
+        limit = min(max(request.args.get('limit', SUGGEST_LIMIT, type=int), 1), SUGGEST_MAX_LIMIT)
+        
+        # Top matches only, no pagination: this runs on every keystroke
+        return jsonify({'ingredients': ingredient_suggestions.current(db.session).suggest(search, limit)})
+    except Exception as e:
+        print(f"Error in suggest_ingredients: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/ingredients/<int:ingredient_id>/aliases', methods=['GET'])
 def get_ingredient_aliases(ingredient_id):
     try:
@@ -836,6 +857,7 @@ def get_ingredient_aliases(ingredient_id):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/ingredients/<int:ingredient_id>/aliases', methods=['POST'])
+@holds_swap_lock
 def add_ingredient_alias(ingredient_id):
     try:
         ingredient = Ingredient.query.get_or_404(ingredient_id)
@@ -865,6 +887,7 @@ def add_ingredient_alias(ingredient_id):
         
         db.session.add(new_alias)
         db.session.commit()
+        data_changed()
         
         return jsonify({
             'id': new_alias.id,
@@ -878,6 +901,7 @@ def add_ingredient_alias(ingredient_id):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/aliases/<int:alias_id>', methods=['DELETE'])
+@holds_swap_lock
 def delete_alias(alias_id):
     try:
         alias = IngredientAlias.query.get_or_404(alias_id)
@@ -885,6 +909,7 @@ def delete_alias(alias_id):
         
         db.session.delete(alias)
         db.session.commit()
+        data_changed()
         
         return jsonify({
             'message': 'Alias deleted successfully',
@@ -895,6 +920,53 @@ def delete_alias(alias_id):
         print(f"Error in delete_alias: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def import_excel_file(job, file_path, mode):
+    """Background job: import an uploaded Synaps workbook and remove it afterwards"""
+    try:
+        job.progress(total_rows=count_excel_rows(file_path))
+        
+        if mode == 'delta':
+            # Only write what changed; ids and aliases stay as they are
+            with import_lock():
+                importer = DeltaImporter(db.session, log=job.log)
+                for chunk in iter_excel_chunks(file_path, IMPORT_COLUMNS):
+                    importer.ingest(normalize_synaps_frame(chunk))
+                    job.progress(importer.rows_processed, errors=importer.errors)
+                importer.apply()
+                db.session.commit()
+            data_imported()
+            
+            return {
+                'success': True,
+                'message': 'Excel file imported successfully (delta)',
+                **importer.stats(),
+                'aliases_restored': 0
+            }
+        
+        # Build the sheet contents into a new database and swap it in, keeping the aliases
+        backup_aliases_to_file()
+        
+        def populate(session):
+            importer = SynapsImporter(session, log=job.log)
+            for chunk in iter_excel_chunks(file_path, IMPORT_COLUMNS):
+                importer.ingest(normalize_synaps_frame(chunk))
+                job.progress(importer.rows_processed, errors=importer.errors)
+            return importer
+        
+        importer, aliases_restored = build_and_swap(populate, log=job.log)
+        data_imported()
+        
+        return {
+            'success': True,
+            'message': 'Excel file imported successfully',
+            **importer.stats(),
+            'aliases_restored': aliases_restored
+        }
+    finally:
+        # Clean up the uploaded file
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
 @app.route('/api/upload-excel', methods=['POST'])
 def upload_excel():
     if 'file' not in request.files:
@@ -905,158 +977,52 @@ def upload_excel():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
+    mode = request.values.get('mode', 'replace')
+    if mode not in IMPORT_MODES:
+        return jsonify({'error': f'Invalid import mode: {mode}'}), 400
+    
     if file and (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
-        filename = secure_filename(file.filename)
+        # Prefix the name so queued uploads of the same file do not overwrite each other
+        filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(file_path)
         
         try:
-            # Load the Excel file
-            df = pd.read_excel(file_path)
+            # Read only the header; rows are streamed into the importer by the job
+            columns = read_excel_header(file_path)
             
             # Check if required columns exist
-            required_columns = [
-                'FING_ITEM_NUMBER', 'FING_DESCRIPTION', 
-                'Ingredient Description Expanded', 'FING_QUANTITY', 'FING_UNIT', 
-                'OBJECT_NUMBER', 'LIFECYCLE_PHASE', 'FORMULATION_NAME'
-            ]
-            
-            missing_columns = [col for col in required_columns if col not in df.columns]
+            missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
             if missing_columns:
+                os.remove(file_path)
                 return jsonify({
                     'error': f'Missing required columns: {", ".join(missing_columns)}'
                 }), 400
-            
-            # Clear existing data
-            db.session.query(FormulaIngredient).delete()
-            db.session.query(Formula).delete()
-            db.session.query(IngredientAlias).delete()  # Delete aliases before ingredients
-            db.session.query(Ingredient).delete()
-            db.session.commit()
-            
-            # Process the data
-            ingredients_dict = {}
-            formulas_dict = {}
-            formula_ingredients_created = 0
-            errors = 0
-            
-            # Process each row in the Excel file
-            for index, row in df.iterrows():
-                try:
-                    # Process ingredient if it doesn't exist
-                    fing_item_number = str(row['FING_ITEM_NUMBER'])
-                    if fing_item_number not in ingredients_dict:
-                        ingredient = Ingredient(
-                            fing_item_number=fing_item_number,
-                            name=str(row['FING_DESCRIPTION']),
-                            description=str(row['FING_DESCRIPTION']),
-                            description_expanded=str(row['Ingredient Description Expanded'])
-                        )
-                        db.session.add(ingredient)
-                        db.session.flush()
-                        ingredients_dict[fing_item_number] = ingredient.id
-                    
-                    # Process formula if it doesn't exist
-                    object_number = str(row['OBJECT_NUMBER'])
-                    if object_number not in formulas_dict:
-                        formula = Formula(
-                            object_number=object_number,
-                            formulation_name=str(row['FORMULATION_NAME']),
-                            lifecycle_phase=str(row['LIFECYCLE_PHASE']),
-                            formula_brand=str(row['FORMULA_BRAND']) if 'FORMULA_BRAND' in row else '',
-                            sbu_category=str(row['SBU_CATEGORY']) if 'SBU_CATEGORY' in row else '',
-                            dossier_type=str(row['DOSSIER_TYPE']) if 'DOSSIER_TYPE' in row else '',
-                            regulatory_comments=str(row['REGULATORY_COMMENTS']) if 'REGULATORY_COMMENTS' in row and not pd.isna(row['REGULATORY_COMMENTS']) else '',
-                            general_comments=str(row['GENERAL_COMMENTS']) if 'GENERAL_COMMENTS' in row and not pd.isna(row['GENERAL_COMMENTS']) else '',
-                            production_sites=str(row['PRODUCTION_SITES_AVAILABLE']) if 'PRODUCTION_SITES_AVAILABLE' in row and not pd.isna(row['PRODUCTION_SITES_AVAILABLE']) else '',
-                            predecessor_formulation_number=str(row['PREDECESSORFORMULATIONNUMBER']) if 'PREDECESSORFORMULATIONNUMBER' in row and not pd.isna(row['PREDECESSORFORMULATIONNUMBER']) else '',
-                            successor_formulation_number=str(row['SUCCESSORFORMULATIONNUMBER']) if 'SUCCESSORFORMULATIONNUMBER' in row and not pd.isna(row['SUCCESSORFORMULATIONNUMBER']) else ''
-                        )
-                        db.session.add(formula)
-                        db.session.flush()
-                        formulas_dict[object_number] = formula.id
-                    
-                    # Create formula ingredient relationship
-                    # Handle NaN values in the amount field
-                    amount = 0.0  # Default value
-                    if 'FING_QUANTITY' in row:
-                        if pd.notna(row['FING_QUANTITY']):
-                            try:
-                                # Try to convert to float
-                                amount = float(row['FING_QUANTITY'])
-                            except (ValueError, TypeError):
-                                # If conversion fails, use the default value
-                                if isinstance(row['FING_QUANTITY'], str) and row['FING_QUANTITY'].strip().upper() == 'Q.S.':
-                                    # Special case for "Q.S." (Quantum Satis - as much as needed)
-                                    amount = 0.0  # Use 0 as a placeholder
-                                else:
-                                    print(f"Row {index}: Invalid amount value: {row['FING_QUANTITY']}, using 0.0")
-                    
-                    unit = str(row['FING_UNIT']) if pd.notna(row['FING_UNIT']) else ''
-                    
-                    formula_ingredient = FormulaIngredient(
-                        formula_id=formulas_dict[object_number],
-                        ingredient_id=ingredients_dict[fing_item_number],
-                        amount=amount,
-                        unit=unit
-                    )
-                    db.session.add(formula_ingredient)
-                    formula_ingredients_created += 1
-                    
-                except Exception as e:
-                    errors += 1
-                    print(f"Error processing row {index}: {str(e)}")
-                    continue
-                
-                # Commit in batches
-                if index % 1000 == 0:
-                    try:
-                        db.session.commit()
-                    except Exception as e:
-                        db.session.rollback()
-                        print(f"Error committing batch at row {index}: {str(e)}")
-            
-            # Final commit
-            db.session.commit()
-            
-            # Restore aliases from the latest backup
-            print("Restoring aliases from latest backup...")
-            latest_backup = get_latest_backup()
-            if latest_backup:
-                aliases_restored = restore_aliases_from_backup(latest_backup)
-                print(f"Restored {aliases_restored} aliases from backup")
-                
-                # Include in the response
-                return jsonify({
-                    'success': True,
-                    'message': 'Excel file imported successfully',
-                    'ingredients_created': len(ingredients_dict),
-                    'formulas_created': len(formulas_dict),
-                    'formula_ingredients_created': formula_ingredients_created,
-                    'aliases_restored': aliases_restored,
-                    'errors': errors
-                })
-            else:
-                return jsonify({
-                    'success': True,
-                    'message': 'Excel file imported successfully',
-                    'ingredients_created': len(ingredients_dict),
-                    'formulas_created': len(formulas_dict),
-                    'formula_ingredients_created': formula_ingredients_created,
-                    'aliases_restored': 0,
-                    'errors': errors
-                })
-            
         except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': f'Error importing Excel file: {str(e)}'}), 500
-        finally:
-            # Clean up the uploaded file
             if os.path.exists(file_path):
                 os.remove(file_path)
+            return jsonify({'error': f'Error importing Excel file: {str(e)}'}), 500
+        
+        job = jobs.submit('upload-excel', import_excel_file, file_path, mode)
+        return job_accepted(job)
     
     return jsonify({'error': 'Invalid file format. Please upload an Excel file (.xlsx or .xls).'}), 400
 
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    try:
+        return jsonify({'jobs': jobs.list()})
+    except Exception as e:
+        print(f"Error listing jobs: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 @app.route('/api/database-status', methods=['GET'])
 def database_status():
     try:
@@ -1072,7 +1038,13 @@ def database_status():
                 'formulas': formula_count,
                 'formula_ingredients': formula_ingredient_count
             },
-            'has_data': ingredient_count > 0 and formula_count > 0
+            'has_data': ingredient_count > 0 and formula_count > 0,
+            'caches': {
+                'ingredient_terms': ingredient_term_cache.stats(),
+                'result_counts': count_cache.stats(),
+                'responses': response_cache.stats(),
+                'search_plans': search_planner.plans.stats()
+            }
         })
     except Exception as e:
         return jsonify({
@@ -1081,30 +1053,28 @@ def database_status():
             'has_data': False
         })
 
+def run_initialize_database(job, mode):
+    """Background job: (re)load the database from the default Excel file"""
+    if not initialize_database_from_excel(mode, job=job):
+        raise RuntimeError('Failed to initialize database. Check server logs for details.')
+    
+    # Get count of restored aliases
+    aliases_count = IngredientAlias.query.count()
+    
+    return {
+        'success': True,
+        'message': 'Database initialized successfully from Excel file',
+        'aliases_restored': aliases_count
+    }
+
 @app.route('/api/initialize-database', methods=['POST'])
 def initialize_database():
-    try:
-        success = initialize_database_from_excel()
-        
-        if success:
-            # Get count of restored aliases
-            aliases_count = IngredientAlias.query.count()
-            
-            return jsonify({
-                'success': True,
-                'message': 'Database initialized successfully from Excel file',
-                'aliases_restored': aliases_count
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to initialize database. Check server logs for details.'
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': f'Error initializing database: {str(e)}'
-        }), 500
+    mode = request.values.get('mode', 'replace')
+    if mode not in IMPORT_MODES:
+        return jsonify({'success': False, 'error': f'Invalid import mode: {mode}'}), 400
+    
+    job = jobs.submit('initialize-database', run_initialize_database, mode)
+    return job_accepted(job)
 
 @app.route('/api/aliases/server-backup', methods=['POST'])
 def create_server_backup():
@@ -1178,6 +1148,7 @@ def list_server_backups():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/aliases/server-restore/<backup_id>', methods=['POST'])
+@holds_swap_lock
 def restore_server_backup(backup_id):
     try:
         # Find the backup file
@@ -1199,6 +1170,7 @@ def restore_server_backup(backup_id):
         if clear_existing:
             db.session.query(IngredientAlias).delete()
             db.session.commit()
+            data_changed()
         
         for alias_data in aliases_data:
             # Find the ingredient by name or number
@@ -1228,6 +1200,7 @@ def restore_server_backup(backup_id):
         
         # Commit the restored aliases
         db.session.commit()
+        data_changed()
         
         return jsonify({
             'success': True,
@@ -1264,57 +1237,95 @@ def delete_server_backup(backup_id):
 
 @app.route('/api/export-database', methods=['GET'])
 def export_database():
+    """Stream the whole database as JSON (or NDJSON with ?format=ndjson), optionally gzipped with ?gzip=1"""
     try:
-        # Query all ingredients
-        ingredients = []
-        for ingredient in Ingredient.query.all():
-            ingredients.append({
-                'id': ingredient.id,
-                'name': ingredient.name,
-                'fing_item_number': ingredient.fing_item_number,
-                'description': ingredient.description,
-                'description_expanded': ingredient.description_expanded
-            })
+        export_format = request.args.get('format', 'json')
+        if export_format not in ('json', 'ndjson'):
+            return jsonify({'error': f'Invalid export format: {export_format}'}), 400
         
-        # Query all formulas with their ingredients
-        formulas = []
-        for formula in Formula.query.all():
-            formula_data = {
-                'id': formula.id,
-                'object_number': formula.object_number,
-                'formulation_name': formula.formulation_name,
-                'lifecycle_phase': formula.lifecycle_phase,
-                'formula_brand': formula.formula_brand,
-                'sbu_category': formula.sbu_category,
-                'dossier_type': formula.dossier_type,
-                'regulatory_comments': formula.regulatory_comments,
-                'general_comments': formula.general_comments,
-                'production_sites': formula.production_sites,
-                'predecessor_formulation_number': formula.predecessor_formulation_number,
-                'successor_formulation_number': formula.successor_formulation_number,
-                'ingredients': []
-            }
-            
-            for formula_ingredient in formula.ingredients:
-                formula_data['ingredients'].append({
-                    'ingredient_id': formula_ingredient.ingredient_id,
-                    'amount': formula_ingredient.amount,
-                    'unit': formula_ingredient.unit
-                })
-            
-            formulas.append(formula_data)
+        if export_format == 'ndjson':
+            chunks = iter_database_ndjson(db.session)
+            mimetype = 'application/x-ndjson'
+        else:
+            chunks = iter_database_json(db.session)
+            mimetype = 'application/json'
+        
+        headers = {}
+        if request.args.get('gzip', 'false').lower() in ('1', 'true'):
+            chunks = gzip_chunks(chunks)
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                headers['Content-Encoding'] = 'gzip'
+                headers['Vary'] = 'Accept-Encoding'
+            else:
+                # The client cannot decode it transparently, so send it as a .gz download
+                mimetype = 'application/gzip'
+                headers['Content-Disposition'] = f'attachment; filename=database.{export_format}.gz'
         
-        # Return the complete database
-        return jsonify({
-            'ingredients': ingredients,
-            'formulas': formulas
-        })
+        # Rows are read from the database while the response is being sent
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
     except Exception as e:
         print(f"Error exporting database: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+def import_database_json(job, file_path, mode):
+    """Background job: import an exported database JSON file and remove it afterwards.
+
+    The ingredients and formulas arrays are streamed from the saved file, one pass each,
+    so memory does not grow with the size of the upload.
+    """
+    try:
+        ingredients = lambda: iter_json_array(file_path, 'ingredients')
+        formulas = lambda: iter_json_array(file_path, 'formulas')
+        
+        if mode == 'delta':
+            # Match rows by fing_item_number / object_number and only write what changed
+            with import_lock():
+                importer = DeltaImporter(db.session, log=job.log)
+                ingredient_frame, formula_frame, line_frame = database_json_frames(ingredients(), formulas())
+                importer.add(ingredient_frame, formula_frame, line_frame)
+                importer.apply()
+                db.session.commit()
+            data_imported()
+            
+            job.progress(len(ingredient_frame) + len(formula_frame), errors=importer.errors)
+            
+            return {
+                'message': 'Database imported successfully (delta)',
+                'ingredients_count': len(ingredient_frame),
+                'formulas_count': len(formula_frame),
+                'aliases_restored': 0,
+                'delta': importer.stats()['delta']
+            }
+        
+        # Back up aliases before they are carried over to the new database
+        backup_aliases_to_file()
+        
+        def populate(session):
+            importer = DatabaseJsonImporter(session, log=job.log)
+            importer.add_ingredients(ingredients(), progress=job.progress)
+            importer.add_formulas(formulas(), progress=job.progress)
+            job.progress(importer.rows_processed)
+            return importer
+        
+        # Build the new database next to the live one and swap it in; readers never see it half-written
+        importer, aliases_restored = build_and_swap(populate, log=job.log)
+        data_imported()
+        stats = importer.stats()
+        
+        return {
+            'message': 'Database imported successfully',
+            'ingredients_count': stats['ingredients_created'],
+            'formulas_count': stats['formulas_created'],
+            'aliases_restored': aliases_restored
+        }
+    except KeyError:
+        raise ValueError('Invalid JSON format: missing ingredients or formulas')
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
 @app.route('/api/upload-database', methods=['POST'])
 def upload_database():
     if 'file' not in request.files:
@@ -1325,269 +1336,42 @@ def upload_database():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
+    mode = request.values.get('mode', 'replace')
+    if mode not in IMPORT_MODES:
+        return jsonify({'error': f'Invalid import mode: {mode}'}), 400
+    
     if file and file.filename.endswith('.json'):
-        try:
-            # Read the JSON file
-            json_data = json.load(file)
-            
-            # Validate the structure
-            if 'ingredients' not in json_data or 'formulas' not in json_data:
-                return jsonify({'error': 'Invalid JSON format: missing ingredients or formulas'}), 400
-            
-            # Back up aliases before clearing data
-            aliases_backup = []
-            for alias in IngredientAlias.query.all():
-                ingredient = Ingredient.query.get(alias.ingredient_id)
-                if ingredient:
-                    aliases_backup.append({
-                        'ingredient_name': ingredient.name,
-                        'ingredient_number': ingredient.fing_item_number,
-                        'alias': alias.alias
-                    })
-            
-            # Create an automatic backup if there are aliases
-            if aliases_backup:
-                timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                backup_filename = f"aliases_backup_{timestamp}.json"
-                backup_path = os.path.join(BACKUPS_DIR, backup_filename)
-                
-                # Write the backup to a file
-                with open(backup_path, 'w') as f:
-                    json.dump(aliases_backup, f, indent=2)
-            
-            # Clear existing data
-            db.session.query(FormulaIngredient).delete()
-            db.session.query(Formula).delete()
-            db.session.query(IngredientAlias).delete()
-            db.session.query(Ingredient).delete()
-            db.session.commit()
-            
-            # Create a mapping from file ingredient IDs to database IDs
-            ingredient_id_mapping = {}
-            
-            # Import ingredients
-            for ingredient_data in json_data['ingredients']:
-                ingredient = Ingredient(
-                    name=ingredient_data.get('name', ''),
-                    fing_item_number=ingredient_data.get('fing_item_number', ''),
-                    description=ingredient_data.get('description', ''),
-                    description_expanded=ingredient_data.get('description_expanded', '')
-                )
-                db.session.add(ingredient)
-                db.session.flush()  # Get the ID without committing
-                ingredient_id_mapping[ingredient_data['id']] = ingredient.id
-            
-            # Import formulas
-            for formula_data in json_data['formulas']:
-                formula = Formula(
-                    object_number=formula_data.get('object_number', ''),
-                    formulation_name=formula_data.get('formulation_name', ''),
-                    lifecycle_phase=formula_data.get('lifecycle_phase', ''),
-                    formula_brand=formula_data.get('formula_brand', ''),
-                    sbu_category=formula_data.get('sbu_category', ''),
-                    dossier_type=formula_data.get('dossier_type', ''),
-                    regulatory_comments=formula_data.get('regulatory_comments', ''),
-                    general_comments=formula_data.get('general_comments', ''),
-                    production_sites=formula_data.get('production_sites', ''),
-                    predecessor_formulation_number=formula_data.get('predecessor_formulation_number', ''),
-                    successor_formulation_number=formula_data.get('successor_formulation_number', '')
-                )
-                db.session.add(formula)
-                db.session.flush()
-                
-                # Import formula ingredients
-                for ingredient_data in formula_data.get('ingredients', []):
-                    # Map the ingredient ID from the file to the database ID
-                    if ingredient_data.get('ingredient_id') in ingredient_id_mapping:
-                        db_ingredient_id = ingredient_id_mapping[ingredient_data['ingredient_id']]
-                        
-                        formula_ingredient = FormulaIngredient(
-                            formula_id=formula.id,
-                            ingredient_id=db_ingredient_id,
-                            amount=ingredient_data.get('amount', 0.0),
-                            unit=ingredient_data.get('unit', '')
-                        )
-                        db.session.add(formula_ingredient)
-            
-            # Commit all changes
-            db.session.commit()
-            
-            # Restore aliases from backup
-            aliases_restored = 0
-            for alias_data in aliases_backup:
-                # Find the ingredient by name or number
-                ingredient = Ingredient.query.filter(
-                    (Ingredient.name == alias_data['ingredient_name']) | 
-                    (Ingredient.fing_item_number == alias_data['ingredient_number'])
-                ).first()
-                
-                if ingredient:
-                    # Check if this alias already exists for the ingredient
-                    existing_alias = IngredientAlias.query.filter_by(
-                        ingredient_id=ingredient.id,
-                        alias=alias_data['alias']
-                    ).first()
-                    
-                    if not existing_alias:
-                        new_alias = IngredientAlias(
-                            alias=alias_data['alias'],
-                            ingredient_id=ingredient.id
-                        )
-                        db.session.add(new_alias)
-                        aliases_restored += 1
-            
-            if aliases_restored > 0:
-                db.session.commit()
-            
-            return jsonify({
-                'message': 'Database imported successfully',
-                'ingredients_count': len(json_data['ingredients']),
-                'formulas_count': len(json_data['formulas']),
-                'aliases_restored': aliases_restored
-            })
+        filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        file.save(file_path)
         
-        except json.JSONDecodeError:
-            return jsonify({'error': 'Invalid JSON file'}), 400
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error importing database: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({"error": str(e)}), 500
+        # Reject malformed files right away; one bounded pass over the upload finds its arrays
+        try:
+            arrays = json_array_keys(file_path)
+        except ValueError as e:
+            os.remove(file_path)
+            return jsonify({'error': str(e)}), 400
+        if 'ingredients' not in arrays or 'formulas' not in arrays:
+            os.remove(file_path)
+            return jsonify({'error': 'Invalid JSON format: missing ingredients or formulas'}), 400
+        
+        job = jobs.submit('upload-database', import_database_json, file_path, mode)
+        return job_accepted(job)
     
     return jsonify({'error': 'Invalid file format. Please upload a JSON file.'}), 400
 
 @app.route('/api/formulas/export', methods=['GET'])
 def export_formulas_excel():
     try:
-        # --- Begin: Copy filter logic from search_formulas (no pagination) ---
-        query = Formula.query
-
-        # Ingredient filters (support both legacy and array-style)
-        ingredient_filters = []
-        # Legacy: ingredient1, min_amount1, max_amount1, ...
-        i = 1
-        while True:
-            ingredient_param = request.args.get(f'ingredient{i}')
-            if not ingredient_param:
-                # If we have ingredient1 but not ingredient2, check for the legacy 'ingredient' param
-                if i == 1:
-                    ingredient_param = request.args.get('ingredient')
-                    if ingredient_param:
-                        min_amount = request.args.get('min_amount')
-                        max_amount = request.args.get('max_amount')
-                        ingredient_filters.append({
-                            'name': ingredient_param,
-                            'min_amount': min_amount,
-                            'max_amount': max_amount
-                        })
-                break
-            min_amount = request.args.get(f'min_amount{i}')
-            max_amount = request.args.get(f'max_amount{i}')
-            ingredient_filters.append({
-                'name': ingredient_param,
-                'min_amount': min_amount,
-                'max_amount': max_amount
-            })
-            i += 1
-        # New: ingredientFilters[0][name], ingredientFilters[0][minAmount], ...
-        idx = 0
-        while True:
-            name = request.args.get(f'ingredientFilters[{idx}][name]')
-            if not name:
-                break
-            min_amount = request.args.get(f'ingredientFilters[{idx}][minAmount]')
-            max_amount = request.args.get(f'ingredientFilters[{idx}][maxAmount]')
-            ingredient_filters.append({
-                'name': name,
-                'min_amount': min_amount,
-                'max_amount': max_amount
-            })
-            idx += 1
-        if ingredient_filters:
-            formula_ids_with_all_ingredients = None
-            for ingredient_filter in ingredient_filters:
-                ingredient_name = ingredient_filter['name']
-                matching_ingredients = db.session.query(Ingredient.id).distinct().\
-                    outerjoin(IngredientAlias, Ingredient.id == IngredientAlias.ingredient_id).\
-                    filter(
-                        db.or_(
-                            Ingredient.name.ilike(f'%{ingredient_name}%'),
-                            IngredientAlias.alias.ilike(f'%{ingredient_name}%')
-                        )
-                    ).all()
-                matching_ingredient_ids = [r[0] for r in matching_ingredients]
-                if not matching_ingredient_ids:
-                    return send_file(BytesIO(), as_attachment=True, download_name='no_results.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                subquery = db.session.query(FormulaIngredient.formula_id).\
-                    filter(FormulaIngredient.ingredient_id.in_(matching_ingredient_ids))
-                if ingredient_filter['min_amount']:
-                    subquery = subquery.filter(FormulaIngredient.amount >= float(ingredient_filter['min_amount']))
-                if ingredient_filter['max_amount']:
-                    subquery = subquery.filter(FormulaIngredient.amount <= float(ingredient_filter['max_amount']))
-                formula_ids_with_ingredient = [r[0] for r in subquery.distinct().all()]
-                if formula_ids_with_all_ingredients is None:
-                    formula_ids_with_all_ingredients = set(formula_ids_with_ingredient)
-                else:
-                    formula_ids_with_all_ingredients &= set(formula_ids_with_ingredient)
-                if not formula_ids_with_all_ingredients:
-                    break
-            if formula_ids_with_all_ingredients:
-                query = query.filter(Formula.id.in_(formula_ids_with_all_ingredients))
-            else:
-                return send_file(BytesIO(), as_attachment=True, download_name='no_results.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        # Exclude ingredients
-        exclude_ingredient_filters = []
-        i = 1
-        while True:
-            exclude_param = request.args.get(f'exclude_ingredient{i}')
-            if not exclude_param:
-                break
-            exclude_ingredient_filters.append(exclude_param)
-            i += 1
-        if exclude_ingredient_filters:
-            exclude_ingredient_ids = set()
-            for exclude_name in exclude_ingredient_filters:
-                matching_ingredients = db.session.query(Ingredient.id).distinct().\
-                    outerjoin(IngredientAlias, Ingredient.id == IngredientAlias.ingredient_id).\
-                    filter(
-                        db.or_(
-                            Ingredient.name.ilike(f'%{exclude_name}%'),
-                            IngredientAlias.alias.ilike(f'%{exclude_name}%')
-                        )
-                    ).all()
-                exclude_ingredient_ids.update([r[0] for r in matching_ingredients])
-            if exclude_ingredient_ids:
-                exclude_formula_ids = db.session.query(FormulaIngredient.formula_id).\
-                    filter(FormulaIngredient.ingredient_id.in_(exclude_ingredient_ids)).distinct().all()
-                exclude_formula_ids = set([r[0] for r in exclude_formula_ids])
-                if exclude_formula_ids:
-                    query = query.filter(~Formula.id.in_(exclude_formula_ids))
-        # Other filters
-        brand = request.args.get('brand', '')
-        if brand:
-            query = query.filter(Formula.formula_brand == brand)
-        category = request.args.get('category', '')
-        if category:
-            query = query.filter(Formula.sbu_category == category)
-        lifecycle_phase = request.args.get('lifecycle_phase', '')
-        if lifecycle_phase:
-            query = query.filter(Formula.lifecycle_phase == lifecycle_phase)
-        
-        # Filter by production site (partial, case-insensitive match)
-        production_site = request.args.get('production_site')
-        if production_site:
-            query = query.filter(Formula.production_sites.ilike(f'%{production_site}%'))
-        
-        # Filter by formulation name (partial, case-insensitive match)
-        formulation_name = request.args.get('formulation_name')
-        if formulation_name:
-            query = query.filter(Formula.formulation_name.ilike(f'%{formulation_name}%'))
-        
-        # Make sure results are distinct
-        query = query.distinct()
-        formulas = query.all()
-        # --- End: Copy filter logic ---
+        # Same filters as search_formulas, through the shared planner (no pagination)
+        try:
+            plan = search_planner.plan(search_query(request.args)[0])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        matching_formula_ids = plan.formula_ids(formula_index.current(db.session))
+        if matching_formula_ids is None:
+            return send_file(BytesIO(), as_attachment=True, download_name='no_results.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        formulas = load_formulas(matching_formula_ids)
 
         # Create Excel workbook
         wb = openpyxl.Workbook()
@@ -1646,31 +1430,11 @@ def export_formulas_excel():
 def export_formula_pdf(object_number):
     formula = Formula.query.filter_by(object_number=object_number).first_or_404()
     # Prepare data for template
-    formula_data = {
-        'object_number': formula.object_number,
-        'formulation_name': formula.formulation_name,
-        'lifecycle_phase': formula.lifecycle_phase,
-        'formula_brand': formula.formula_brand,
-        'sbu_category': formula.sbu_category,
-        'dossier_type': formula.dossier_type,
-        'regulatory_comments': formula.regulatory_comments,
-        'general_comments': formula.general_comments,
-        'production_sites': formula.production_sites,
-        'predecessor_formulation_number': formula.predecessor_formulation_number,
-        'successor_formulation_number': formula.successor_formulation_number,
-        'ingredients': []
-    }
-    for formula_ingredient in formula.ingredients:
-        ingredient = Ingredient.query.get(formula_ingredient.ingredient_id)
-        formula_data['ingredients'].append({
-            'name': ingredient.name,
-            'fing_item_number': ingredient.fing_item_number,
-            'amount': formula_ingredient.amount,
-            'unit': formula_ingredient.unit
-        })
+    formula_data = serialize_formula_detail(formula)
     # Render HTML template
     html = render_template('formula_pdf.html', formula=formula_data)
-    # Convert HTML to PDF
+    # Convert HTML to PDF (xhtml2pdf takes about a second to import, so only load it when needed)
+    from xhtml2pdf import pisa
     pdf = BytesIO()
     pisa_status = pisa.CreatePDF(html, dest=pdf)
     if pisa_status.err:
@@ -1693,22 +1457,54 @@ def serve_react_app(path):
     else:
         return send_from_directory(build_dir, 'index.html')
 
+@app.cli.command('migrate-indexes')
+def migrate_indexes():
+    """Add missing tables, columns and secondary indexes to the existing database and report the query plans before and after"""
+    tables = add_missing_tables(db.engine)
+    if tables:
+        print(f"Added {len(tables)} tables.")
+    added = add_missing_columns(db.engine)
+    if added:
+        print(f"Added {len(added)} columns.")
+    before = query_plans(db.engine)
+    created = create_missing_indexes(db.engine)
+    if not created:
+        print("All indexes are present, nothing to migrate.")
+        return
+    print(f"Created {len(created)} indexes.\n")
+    print(query_plan_report(before, query_plans(db.engine)))
+
 if __name__ == '__main__':
     with app.app_context():
-        # Drop and recreate all tables
-        print("Dropping all tables...")
-        db.drop_all()
-        print("Creating all tables...")
+        # 'persistent' keeps the database across restarts and only rebuilds it when the schema
+        # version or the startup workbook changed; 'rebuild' drops and reimports every time
+        startup_mode = os.environ.get('DB_STARTUP_MODE', 'persistent').lower()
+        if startup_mode == 'rebuild':
+            print("Dropping all tables...")
+            with db.engine.begin() as connection:
+                drop_search_index(connection)
+            db.drop_all()
+        print("Creating missing tables...")
+        add_missing_tables(db.engine)
         db.create_all()
+        add_missing_columns(db.engine)
+        create_missing_indexes(db.engine)
+        ensure_search_index(db.engine)
         
-        # Try to initialize from Excel
-        print("Attempting to initialize database from Excel file...")
-        success = initialize_database_from_excel()
+        excel_path = STARTUP_EXCEL_PATH
+        reason = 'rebuild requested' if startup_mode == 'rebuild' else rebuild_reason(excel_path)
         
-        if success:
-            print("Database successfully initialized from Excel file!")
+        if reason is None:
+            print("Database is up to date, skipping import from Excel file.")
         else:
-            print("Failed to initialize database from Excel file.")
+            # Try to initialize from Excel
+            print(f"Attempting to initialize database from Excel file ({reason})...")
+            success = initialize_database_from_excel()
+            
+            if success:
+                print("Database successfully initialized from Excel file!")
+            else:
+                print("Failed to initialize database from Excel file.")
 
     debug_mode = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
     port = int(os.environ.get('PORT', 5000))
@@ -11,6 +11,9 @@ class Ingredient(db.Model):
     description_expanded = db.Column(db.Text)
     aliases = db.relationship('IngredientAlias', backref='ingredient', lazy=True, cascade="all, delete-orphan")
     
+    # Ingredient listing is ordered by name
+    __table_args__ = (db.Index('ix_ingredient_name', 'name'),)
+    
 class IngredientAlias(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     alias = db.Column(db.String(255), nullable=False)
@@ -18,7 +21,11 @@ class IngredientAlias(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
     
     # Add a unique constraint to prevent duplicate aliases for the same ingredient
-    __table_args__ = (db.UniqueConstraint('alias', 'ingredient_id', name='_alias_ingredient_uc'),)
+    # (it leads with alias, so looking up the aliases of an ingredient needs its own index)
+    __table_args__ = (
+        db.UniqueConstraint('alias', 'ingredient_id', name='_alias_ingredient_uc'),
+        db.Index('ix_ingredient_alias_ingredient_id', 'ingredient_id'),
+    )
     
 class FormulaIngredient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,6 +33,21 @@ class FormulaIngredient(db.Model):
     ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredient.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     unit = db.Column(db.String(50), nullable=False)
+    # The amount in the canonical unit of its dimension (mg, ml or %), so ranges work across units;
+    # NULL, with amount_convertible false, for Q.S. quantities and units without a conversion
+    normalized_amount = db.Column(db.Float)
+    normalized_unit = db.Column(db.String(10))
+    amount_convertible = db.Column(db.Boolean, nullable=False, default=True)
+    
+    __table_args__ = (
+        # Ingredient filters: ingredient ids with an amount range -> formula ids, answered from the index alone
+        db.Index('ix_formula_ingredient_ingredient_amount', 'ingredient_id', 'amount', 'formula_id'),
+        # The same with the range in a canonical unit
+        db.Index('ix_formula_ingredient_normalized_amount',
+                 'ingredient_id', 'normalized_unit', 'normalized_amount', 'formula_id'),
+        # The lines of a formula (formula.ingredients, exports), with the ingredient to join on
+        db.Index('ix_formula_ingredient_formula', 'formula_id', 'ingredient_id'),
+    )
     
 class Formula(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -41,4 +63,32 @@ class Formula(db.Model):
     predecessor_formulation_number = db.Column(db.String(50))
     successor_formulation_number = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    ingredients = db.relationship('FormulaIngredient', backref='formula', lazy=True)
+    ingredients = db.relationship('FormulaIngredient', backref='formula', lazy=True, order_by='FormulaIngredient.id')
+    
+    # Equality filters; SQLite appends the rowid, so matches also come out in id order
+    __table_args__ = (
+        db.Index('ix_formula_brand', 'formula_brand'),
+        db.Index('ix_formula_sbu_category', 'sbu_category'),
+        db.Index('ix_formula_lifecycle_phase', 'lifecycle_phase'),
+    )
+    
+class ProductionSite(db.Model):
+    """A distinct site named in Formula.production_sites; the unique index keeps the names in order"""
+    __tablename__ = 'production_site'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+    
+class FormulaProductionSite(db.Model):
+    """One row per site listed in a formula's production_sites, so site filters are index lookups"""
+    __tablename__ = 'formula_production_site'
+    formula_id = db.Column(db.Integer, db.ForeignKey('formula.id'), primary_key=True)
+    production_site_id = db.Column(db.Integer, db.ForeignKey('production_site.id'), primary_key=True)
+    
+    # Site filters: site ids -> formula ids, answered from the index alone
+    __table_args__ = (db.Index('ix_formula_production_site_site', 'production_site_id', 'formula_id'),)
+    
+class DatabaseMetadata(db.Model):
+    """Key/value facts about the database itself, such as its schema version and source workbook"""
+    __tablename__ = 'database_metadata'
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Text)
@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: the counter is still shared, bumps are just not serialized
+    fcntl = None
+
+
+class DataGeneration:
+    """Counter of data changes shared by all worker processes through a small file.
+
+    Every write path bumps it; caches compare it with the generation their entries were
+    built for. Reads only stat the file and reuse the last value while it is unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._stat = None
+        self._value = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def current(self):
+        try:
+            stat = os.stat(self.path)
+            key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return 0
+        if key != self._stat:
+            self._value = self._read()
+            self._stat = key
+        return self._value
+
+    def bump(self):
+        """Advance the counter so every process drops what it cached before the change"""
+        with self.lock, open(f'{self.path}.lock', 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            value = self._read() + 1
+            tmp_path = f'{self.path}.tmp-{os.getpid()}'
+            with open(tmp_path, 'w') as f:
+                f.write(str(value))
+            # A new file (new inode) each time, so readers notice even within one mtime tick
+            os.replace(tmp_path, self.path)
+            return value
+
+
+class LRUCache:
+    """Thread-safe LRU cache whose entries are dropped whenever the data generation changes"""
+
+    def __init__(self, maxsize, generation):
+        self.maxsize = maxsize
+        self.generation = generation
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.entries_generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def _sync(self, generation):
+        if generation != self.entries_generation:
+            self.entries.clear()
+            self.entries_generation = generation
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss"""
+        generation = self.generation.current()
+        with self.lock:
+            self._sync(generation)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def get_or_set(self, key, compute, cacheable=None):
+        """Return the cached value for key, computing and storing it on a miss.
+
+        Values for which cacheable(value) is false are returned without being stored.
+        """
+        generation = self.generation.current()
+        with self.lock:
+            self._sync(generation)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        value = compute()
+        if cacheable is not None and not cacheable(value):
+            return value
+
+        with self.lock:
+            # Don't keep a value computed from data that changed while it was being computed
+            if self.generation.current() == generation == self.entries_generation:
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'generation': self.entries_generation
+            }
@@ -0,0 +1,87 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, select
+
+from models.formula import db, Formula
+from services.cache import LRUCache
+
+# Formulas (the lowest ids) counted for an estimate
+ESTIMATE_SAMPLE_SIZE = 5000
+
+
+class CountCache:
+    """Result counts by canonical filter key, dropped when the data generation changes.
+
+    Counts are select(func.count(Formula.id)).where(...) statements. In estimated mode a
+    missing count is extrapolated from the first ESTIMATE_SAMPLE_SIZE formulas and the exact
+    count is computed on a background thread, so later requests for the same filters get it.
+    """
+
+    def __init__(self, app, maxsize, generation):
+        self.app = app
+        self.cache = LRUCache(maxsize, generation)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='find-count')
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """The cached exact count, or None"""
+        return self.cache.get(key)
+
+    def store(self, key, total):
+        """Remember an exact count computed elsewhere (e.g. by a windowed page query)"""
+        return self.cache.get_or_set(key, lambda: total)
+
+    def total(self, key, statement, estimated=False, at_least=0):
+        """Return (count, exact) for the filters key identifies.
+
+        at_least is the number of results known to exist (e.g. up to the end of the current
+        page); estimates never go below it.
+        """
+        if not estimated:
+            return self.cache.get_or_set(key, lambda: db.session.execute(statement).scalar()), True
+
+        total = self.cache.get(key)
+        if total is not None:
+            return total, True
+        return self.estimate(key, statement, at_least)
+
+    def estimate(self, key, statement, at_least=0):
+        """(count, exact) from a sample when the count is not cached; the exact count follows in the background"""
+        total, exact = self._estimate(statement)
+        if exact:
+            return self.store(key, total), True
+        self._refine(key, statement)
+        return max(total, at_least), False
+
+    def _estimate(self, statement):
+        cutoff = db.session.execute(
+            select(Formula.id).order_by(Formula.id).offset(ESTIMATE_SAMPLE_SIZE - 1).limit(1)
+        ).scalar()
+        if cutoff is None:
+            # Few enough formulas that the sample would be all of them
+            return db.session.execute(statement).scalar(), True
+        formula_count = db.session.execute(select(func.count(Formula.id))).scalar()
+        sample = db.session.execute(statement.where(Formula.id <= cutoff)).scalar()
+        return round(sample * formula_count / ESTIMATE_SAMPLE_SIZE), False
+
+    def _refine(self, key, statement):
+        with self.lock:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+        self.executor.submit(self._count, key, statement)
+
+    def _count(self, key, statement):
+        try:
+            with self.app.app_context():
+                self.cache.get_or_set(key, lambda: db.session.execute(statement).scalar())
+        except Exception as e:
+            print(f"Error refining count: {str(e)}")
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+
+    def stats(self):
+        return {**self.cache.stats(), 'pending': len(self.pending)}
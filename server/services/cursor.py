@@ -0,0 +1,33 @@
+import base64
+import json
+
+
+def encode_cursor(formula_id):
+    """Opaque cursor pointing just past the formula with this id (results are ordered by id)"""
+    payload = json.dumps({'after': int(formula_id)}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Id of the last formula before the cursor; an empty cursor starts at the beginning.
+
+    Raises ValueError for a cursor that was not made by encode_cursor.
+    """
+    if not cursor:
+        return 0
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        after = json.loads(payload)['after']
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(after, int) or isinstance(after, bool):
+        raise ValueError('Invalid cursor')
+    return after
+
+
+def cursor_page(rows, per_page):
+    """Split rows fetched with limit per_page + 1 into (page rows, next cursor or None)"""
+    page = rows[:per_page]
+    if len(rows) > per_page and page:
+        return page, encode_cursor(page[-1].id)
+    return page, None
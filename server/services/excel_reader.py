@@ -0,0 +1,108 @@
+import openpyxl
+import pandas as pd
+
+# Rows handed to the import pipeline per chunk
+CHUNK_SIZE = 5000
+
+# Cell texts that pd.read_excel treats as missing by default
+NA_VALUES = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a',
+    'nan', 'null'
+}
+
+NAN = float('nan')
+
+# Cells are converted one by one, like pd.read_excel(dtype=object): no column gets a numeric
+# dtype, so an integer code stays 123 (text '123') even in a column with blank cells, where a
+# plain pd.read_excel would make the column float64 and the code '123.0'.
+
+
+def _is_xlsx(path):
+    return not path.lower().endswith('.xls')
+
+
+def _cell_value(value):
+    """Convert a raw openpyxl value the same way pd.read_excel(dtype=object) does"""
+    if value is None:
+        return NAN
+    if isinstance(value, str):
+        return NAN if value in NA_VALUES else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def read_excel_header(path):
+    """Return the column names of the first sheet without loading its rows"""
+    if not _is_xlsx(path):
+        return list(pd.read_excel(path, nrows=0).columns)
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        for row in workbook.worksheets[0].iter_rows(max_row=1, values_only=True):
+            return [value for value in row if value is not None]
+        return []
+    finally:
+        workbook.close()
+
+
+def count_excel_rows(path):
+    """Return the number of data rows recorded in the sheet dimensions, or None if unknown"""
+    if not _is_xlsx(path):
+        return None
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        max_row = workbook.worksheets[0].max_row
+        return max_row - 1 if max_row else None
+    finally:
+        workbook.close()
+
+
+def iter_excel_chunks(path, columns, chunk_size=CHUNK_SIZE):
+    """Yield DataFrames of up to chunk_size rows holding only the requested columns of the first sheet"""
+    if not _is_xlsx(path):
+        # openpyxl cannot read legacy .xls files, so let pandas (xlrd) load the projected columns
+        df = pd.read_excel(path, usecols=lambda column: column in columns, dtype=object)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size].reset_index(drop=True)
+        return
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+
+        # Project the requested columns, keeping the first occurrence of duplicated headers
+        positions = {}
+        for position, name in enumerate(header):
+            if name in columns and name not in positions:
+                positions[name] = position
+        names = list(positions)
+        indices = list(positions.values())
+
+        chunk = []
+        empty_rows = 0
+        for row in rows:
+            # Like pd.read_excel, keep blank rows in the middle of the sheet but drop trailing ones
+            if all(value is None for value in row):
+                empty_rows += 1
+                continue
+            if empty_rows:
+                chunk.extend([(NAN,) * len(indices)] * empty_rows)
+                empty_rows = 0
+
+            chunk.append(tuple(
+                _cell_value(row[index]) if index < len(row) else NAN
+                for index in indices
+            ))
+            # Blank rows added above can fill more than one chunk
+            while len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk[:chunk_size], columns=names, dtype=object)
+                chunk = chunk[chunk_size:]
+
+        if chunk:
+            yield pd.DataFrame(chunk, columns=names, dtype=object)
+    finally:
+        workbook.close()
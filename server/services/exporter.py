@@ -0,0 +1,110 @@
+import json
+import zlib
+
+from sqlalchemy import select
+
+from models.formula import Formula, Ingredient, FormulaIngredient
+
+# Rows fetched from the database per round-trip
+FETCH_SIZE = 2000
+
+# Bytes of output collected before a chunk is sent
+FLUSH_SIZE = 64 * 1024
+
+INGREDIENT_COLUMNS = ['id', 'name', 'fing_item_number', 'description', 'description_expanded']
+FORMULA_COLUMNS = [
+    'id', 'object_number', 'formulation_name', 'lifecycle_phase', 'formula_brand', 'sbu_category',
+    'dossier_type', 'regulatory_comments', 'general_comments', 'production_sites',
+    'predecessor_formulation_number', 'successor_formulation_number'
+]
+LINE_COLUMNS = ['ingredient_id', 'amount', 'unit', 'amount_convertible']
+
+
+def _dumps(value):
+    # Same encoding as jsonify outside debug mode, so the streamed export matches the old one byte for byte
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def _rows(session, statement):
+    result = session.execute(statement.execution_options(yield_per=FETCH_SIZE))
+    for row in result:
+        yield row._asdict()
+
+
+def iter_ingredients(session):
+    table = Ingredient.__table__
+    yield from _rows(session, select(*[table.c[column] for column in INGREDIENT_COLUMNS]).order_by(table.c.id))
+
+
+def iter_formulas(session):
+    """Yield formulas in id order with their ingredient lines, merging two ordered cursors"""
+    formulas = Formula.__table__
+    lines = FormulaIngredient.__table__
+    line_rows = _rows(session, select(lines.c.formula_id, *[lines.c[column] for column in LINE_COLUMNS])
+                      .order_by(lines.c.formula_id, lines.c.id))
+    line = next(line_rows, None)
+
+    for formula in _rows(session, select(*[formulas.c[column] for column in FORMULA_COLUMNS]).order_by(formulas.c.id)):
+        # Skip lines of formulas that no longer exist
+        while line is not None and line['formula_id'] < formula['id']:
+            line = next(line_rows, None)
+        formula['ingredients'] = []
+        while line is not None and line['formula_id'] == formula['id']:
+            formula['ingredients'].append({column: line[column] for column in LINE_COLUMNS})
+            line = next(line_rows, None)
+        yield formula
+
+
+def _buffered(parts):
+    """Join small string parts into chunks of about FLUSH_SIZE bytes"""
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= FLUSH_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _json_array(items):
+    first = True
+    for item in items:
+        yield _dumps(item) if first else ',' + _dumps(item)
+        first = False
+
+
+def iter_database_json(session):
+    """Yield the database as the {"formulas": [...], "ingredients": [...]} document, chunk by chunk"""
+    def parts():
+        yield '{"formulas":['
+        yield from _json_array(iter_formulas(session))
+        yield '],"ingredients":['
+        yield from _json_array(iter_ingredients(session))
+        yield ']}\n'
+    return _buffered(parts())
+
+
+def iter_database_ndjson(session):
+    """Yield the database as newline-delimited JSON: ingredient records first, then formula records"""
+    def parts():
+        for ingredient in iter_ingredients(session):
+            ingredient['type'] = 'ingredient'
+            yield _dumps(ingredient) + '\n'
+        for formula in iter_formulas(session):
+            formula['type'] = 'formula'
+            yield _dumps(formula) + '\n'
+    return _buffered(parts())
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into a gzip stream, emitting output as each chunk arrives"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,141 @@
+import threading
+
+import numpy as np
+from sqlalchemy import text
+
+from services.units import CANONICAL_UNITS
+
+# Above this many ingredients per lookup, one vectorized pass over all postings beats slicing
+SLICE_LIMIT = 64
+
+
+class Postings:
+    """Formula ids of lines grouped by ingredient (CSR layout), sorted by amount within each"""
+
+    def __init__(self, ingredient_count, ingredient_ids, line_formula_ids, amounts):
+        # NaN (NULL) amounts sort last in each ingredient and never fall inside a range
+        order = np.lexsort((line_formula_ids, amounts, ingredient_ids))
+        self.row_ingredients = ingredient_ids[order]
+        self.formula_ids = line_formula_ids[order]
+        self.amounts = amounts[order]
+        self.indptr = np.zeros(ingredient_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.row_ingredients, minlength=ingredient_count), out=self.indptr[1:])
+
+
+class FormulaIndex:
+    """Immutable inverted index from ingredient id to the formulas that contain it.
+
+    Postings are stored compactly as one int32 array of formula ids grouped by ingredient
+    (CSR layout, with the line amount alongside). Within an ingredient they are sorted by
+    amount, so an amount range is two binary searches and a slice. Lines with a normalized
+    amount are also posted per canonical unit, sorted by that amount, for ranges in a unit.
+    Lookups expand postings into dense boolean bitmaps over formula ids, so filters combine
+    with numpy AND / AND NOT.
+    """
+
+    def __init__(self, generation, formula_ids, ingredient_ids, line_formula_ids, amounts,
+                 unit_codes=None, normalized_amounts=None):
+        self.generation = generation
+        # Lines of deleted formulas must still fit; the formulas bitmap filters them out
+        self.size = int(max(formula_ids.max(initial=0), line_formula_ids.max(initial=0))) + 1
+
+        self.formulas = np.zeros(self.size, dtype=bool)
+        self.formulas[formula_ids] = True
+
+        ingredient_count = int(ingredient_ids.max()) + 1 if len(ingredient_ids) else 1
+        self.lines = Postings(ingredient_count, ingredient_ids, line_formula_ids, amounts)
+        self.row_ingredients = self.lines.row_ingredients
+        self.postings = self.lines.formula_ids
+        self.amounts = self.lines.amounts
+        self.indptr = self.lines.indptr
+
+        # Canonical unit -> postings of the lines normalized to it (unit code -1: not convertible)
+        self.unit_postings = {}
+        if unit_codes is not None:
+            for code, unit in enumerate(CANONICAL_UNITS):
+                lines = unit_codes == code
+                self.unit_postings[unit] = Postings(
+                    ingredient_count, ingredient_ids[lines], line_formula_ids[lines], normalized_amounts[lines]
+                )
+
+    @classmethod
+    def load(cls, session, generation):
+        formula_ids = np.array(session.execute(text('SELECT id FROM formula')).scalars().all(), dtype=np.int32)
+        unit_codes = ' '.join(f"WHEN '{unit}' THEN {code}" for code, unit in enumerate(CANONICAL_UNITS))
+        rows = session.execute(text(
+            f'SELECT ingredient_id, formula_id, amount, CASE normalized_unit {unit_codes} ELSE -1 END, '
+            'normalized_amount FROM formula_ingredient'
+        )).all()
+        lines = np.array(rows, dtype=np.float64).reshape(-1, 5)
+        return cls(
+            generation,
+            formula_ids,
+            lines[:, 0].astype(np.int32),
+            lines[:, 1].astype(np.int32),
+            lines[:, 2],
+            lines[:, 3].astype(np.int8),
+            lines[:, 4]
+        )
+
+    def all(self):
+        """Bitmap of every formula"""
+        return self.formulas.copy()
+
+    def from_ids(self, formula_ids):
+        bitmap = np.zeros(self.size, dtype=bool)
+        formula_ids = np.asarray(formula_ids, dtype=np.int64)
+        bitmap[formula_ids[formula_ids < self.size]] = True
+        return bitmap
+
+    def containing(self, ingredient_ids, min_amount=None, max_amount=None, unit=None):
+        """Bitmap of formulas with a line of any of the ingredients, optionally within an amount range.
+
+        With a canonical unit, only lines normalized to it count and the range applies to their
+        normalized amounts.
+        """
+        postings = self.unit_postings[unit] if unit else self.lines
+        indptr, formula_ids, amounts = postings.indptr, postings.formula_ids, postings.amounts
+        ingredient_ids = np.fromiter(ingredient_ids, dtype=np.int64)
+        ingredient_ids = ingredient_ids[(ingredient_ids >= 0) & (ingredient_ids < len(indptr) - 1)]
+        ranged = min_amount is not None or max_amount is not None
+        low = -np.inf if min_amount is None else min_amount
+        high = np.inf if max_amount is None else max_amount
+
+        bitmap = np.zeros(self.size, dtype=bool)
+        if len(ingredient_ids) <= SLICE_LIMIT:
+            for ingredient_id in ingredient_ids:
+                start, end = indptr[ingredient_id], indptr[ingredient_id + 1]
+                if ranged:
+                    line_amounts = amounts[start:end]
+                    start, end = (start + np.searchsorted(line_amounts, low, side='left'),
+                                  start + np.searchsorted(line_amounts, high, side='right'))
+                bitmap[formula_ids[start:end]] = True
+            return bitmap
+
+        # Many ingredients (a short, common term): one vectorized pass over all postings
+        selected = np.zeros(len(indptr) - 1, dtype=bool)
+        selected[ingredient_ids] = True
+        rows = selected[postings.row_ingredients]
+        if ranged:
+            rows &= (amounts >= low) & (amounts <= high)
+        bitmap[formula_ids[rows]] = True
+        return bitmap
+
+
+class FormulaIndexHolder:
+    """Keeps the index of the current data generation, rebuilding it on first use after a change"""
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.index = None
+        self.lock = threading.Lock()
+
+    def current(self, session):
+        generation = self.generation.current()
+        index = self.index
+        if index is not None and index.generation == generation:
+            return index
+        with self.lock:
+            if self.index is None or self.index.generation != generation:
+                self.index = FormulaIndex.load(session, generation)
+            return self.index
@@ -0,0 +1,124 @@
+import heapq
+from collections import Counter
+
+from services.ingredient_texts import IngredientTextIndex, trigrams
+from services.search_index import normalize_term
+
+# Terms shorter than this match too much to be worth correcting
+MIN_FUZZY_LENGTH = 3
+
+# Entries sharing the most trigrams with a term whose edit distance is actually computed
+CANDIDATE_LIMIT = 256
+
+
+def max_distance(length):
+    """Edits tolerated in a term of this length"""
+    if length <= 4:
+        return 1
+    if length <= 8:
+        return 2
+    return 3
+
+
+def edit_distance(pattern, text, anchored=False):
+    """Levenshtein distance from pattern to its closest substring of text (to a prefix of it when anchored).
+
+    Returns (distance, end) with the end of the first such substring. Bit-parallel (Myers' algorithm):
+    one pass over text with a few integer operations per character, however long pattern is.
+    """
+    if not pattern:
+        return 0, 0
+    masks = {}
+    for i, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    all_bits = (1 << len(pattern)) - 1
+    high = 1 << (len(pattern) - 1)
+    positive, negative = all_bits, 0
+    score = best = len(pattern)
+    best_end = 0
+    for j, char in enumerate(text):
+        eq = masks.get(char, 0)
+        xv = eq | negative
+        xh = ((((eq & positive) + positive) & all_bits) ^ positive) | eq
+        horizontal_positive = negative | (~(xh | positive) & all_bits)
+        horizontal_negative = positive & xh
+        if horizontal_positive & high:
+            score += 1
+        elif horizontal_negative & high:
+            score -= 1
+        # Anchored, the first row grows by one per character of text; otherwise it stays 0
+        horizontal_positive = ((horizontal_positive << 1) | anchored) & all_bits
+        horizontal_negative = (horizontal_negative << 1) & all_bits
+        positive = horizontal_negative | (~(xv | horizontal_positive) & all_bits)
+        negative = horizontal_positive & xv
+        if score < best:
+            best, best_end = score, j + 1
+    return best, best_end
+
+
+def _matched_words(term, text, end):
+    """The words of text covered by the closest match of term ending at end"""
+    _, length = edit_distance(term[::-1], text[end - 1::-1] if end else '', anchored=True)
+    start = end - length
+    while start > 0 and text[start - 1].isalnum():
+        start -= 1
+    while end < len(text) and text[end].isalnum():
+        end += 1
+    return text[start:end].strip()
+
+
+class FuzzyIngredientIndex(IngredientTextIndex):
+    """Typo-tolerant matching of terms against ingredient names, item numbers and aliases.
+
+    A lookup takes the entries sharing the most trigrams with the term and ranks them by edit
+    distance from the term to their closest substring, so both "paracetamole" and "ascorbic acd"
+    find their ingredient.
+    """
+
+    def _matches(self, term, kinds):
+        """The normalized term and the (distance, length difference, text, ingredient id, match end)
+        of the entries of the given kinds within max_distance of it, closest first"""
+        term = normalize_term(term.strip())
+        if len(term) < MIN_FUZZY_LENGTH:
+            return term, []
+        limit = max_distance(len(term))
+        grams = trigrams(term)
+        # An edit destroys at most 3 of the term's trigrams; the rest occur in any match
+        min_shared = max(1, len(grams) - 3 * limit)
+
+        with self.lock:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.grams.get(gram, ()))
+            candidates = heapq.nlargest(
+                CANDIDATE_LIMIT,
+                (key for key, count in shared.items() if count >= min_shared and key[0] in kinds),
+                key=shared.__getitem__
+            )
+            entries = [self.entries[key] for key in candidates]
+
+        matches = []
+        for text, ingredient_id, _ in entries:
+            distance, end = edit_distance(term, text)
+            if distance <= limit:
+                # Among equally close matches, texts about as long as the term come first
+                matches.append((distance, abs(len(text) - len(term)), text, ingredient_id, end))
+        matches.sort()
+        return term, matches
+
+    def search(self, term, limit, kinds=('name', 'item', 'alias')):
+        """[(ingredient id, distance)] of the limit ingredients closest to term, closest first"""
+        ranked = {}
+        for distance, _, _, ingredient_id, _ in self._matches(term, kinds)[1]:
+            ranked.setdefault(ingredient_id, distance)
+            if len(ranked) == limit:
+                break
+        return list(ranked.items())
+
+    def correct(self, term):
+        """Closest spelling of term in an ingredient name or alias (whole words), or None if nothing is close"""
+        term, matches = self._matches(term, ('name', 'alias'))
+        if not matches:
+            return None
+        _, _, text, _, end = matches[0]
+        return _matched_words(term, text, end) or None
@@ -0,0 +1,526 @@
+import re
+
+import pandas as pd
+from sqlalchemy import bindparam, func, select
+from models.formula import Formula, Ingredient, FormulaIngredient, IngredientAlias
+from services.production_sites import ProductionSiteLinker
+from services.units import amount_parsed, normalize_amount, normalize_amounts
+
+# Columns every Synaps sheet must provide
+REQUIRED_COLUMNS = [
+    'FING_ITEM_NUMBER', 'FING_DESCRIPTION',
+    'Ingredient Description Expanded', 'FING_QUANTITY', 'FING_UNIT',
+    'OBJECT_NUMBER', 'LIFECYCLE_PHASE', 'FORMULATION_NAME'
+]
+
+# Optional formula columns that are stored as str(value), or '' when the column is missing
+FORMULA_TEXT_COLUMNS = {
+    'formula_brand': 'FORMULA_BRAND',
+    'sbu_category': 'SBU_CATEGORY',
+    'dossier_type': 'DOSSIER_TYPE',
+}
+
+# Optional formula columns where empty cells are stored as ''
+FORMULA_OPTIONAL_COLUMNS = {
+    'regulatory_comments': 'REGULATORY_COMMENTS',
+    'general_comments': 'GENERAL_COMMENTS',
+    'production_sites': 'PRODUCTION_SITES_AVAILABLE',
+    'predecessor_formulation_number': 'PREDECESSORFORMULATIONNUMBER',
+    'successor_formulation_number': 'SUCCESSORFORMULATIONNUMBER',
+}
+
+# Every sheet column the importer reads
+IMPORT_COLUMNS = REQUIRED_COLUMNS + list(FORMULA_TEXT_COLUMNS.values()) + list(FORMULA_OPTIONAL_COLUMNS.values())
+
+INGREDIENT_FIELDS = ['fing_item_number', 'name', 'description', 'description_expanded']
+FORMULA_FIELDS = [
+    'object_number', 'formulation_name', 'lifecycle_phase',
+    *FORMULA_TEXT_COLUMNS, *FORMULA_OPTIONAL_COLUMNS
+]
+FORMULA_INGREDIENT_FIELDS = ['formula_id', 'ingredient_id', 'amount', 'unit', 'amount_convertible']
+# Derived from amount and unit; written with the lines but not compared
+NORMALIZED_FIELDS = ['normalized_amount', 'normalized_unit']
+
+# Line columns of normalized frames; amount_parsed tells whether FING_QUANTITY was a number
+LINE_COLUMNS = ['object_number', 'fing_item_number', 'amount', 'unit', 'amount_parsed']
+
+# Number of rows sent to the database per executemany call
+BATCH_SIZE = 10000
+
+# Integer codes as pd.read_excel stored them from columns with blank cells ('123.0'); they read as '123' now
+_FLOAT_CODE = re.compile(r'(\d+)\.0')
+
+
+def _as_text(column):
+    """Convert a column the same way str(value) does, NaN included"""
+    return column.map(str)
+
+
+def _as_optional_text(column):
+    """Convert a column with str(value), storing empty cells as ''"""
+    return column.map(str).where(column.notna(), '')
+
+
+def item_number_key(number):
+    """Form of an item number that is the same for '123' and the '123.0' older imports stored"""
+    match = _FLOAT_CODE.fullmatch(number) if isinstance(number, str) else None
+    return match.group(1) if match else number
+
+
+def _has_value(column):
+    """Cells that are neither empty nor blank text"""
+    return column.notna() & (column.map(str).str.strip() != '')
+
+
+def _parse_amounts(column):
+    """Parse FING_QUANTITY the way float(value) does, returning (amounts, parsed, invalid_count)
+
+    Values that are not numbers are stored as 0.0; parsed marks the others.
+    """
+    amounts = pd.to_numeric(column, errors='coerce')
+
+    # to_numeric is stricter than float() for some strings, so retry those one by one
+    retry = amounts.isna() & column.notna()
+    if retry.any():
+        def to_float(value):
+            try:
+                return float(value)
+            except (ValueError, TypeError):
+                return float('nan')
+        amounts[retry] = column[retry].map(to_float)
+
+    unparsed = amounts.isna() & column.notna()
+    # "Q.S." (Quantum Satis - as much as needed) is expected and stored as 0.0
+    qs = column[unparsed].map(lambda value: isinstance(value, str) and value.strip().upper() == 'Q.S.')
+    invalid = int(unparsed.sum() - qs.sum())
+
+    return amounts.fillna(0.0).astype(float), amounts.notna(), invalid
+
+
+def normalize_synaps_frame(df):
+    """Project a raw Synaps sheet onto the typed columns stored by the importer.
+
+    Rows without an item number or object number belong to no ingredient or formula; they are
+    left out and counted in attrs['rejected_rows'].
+    """
+    keyed = _has_value(df['FING_ITEM_NUMBER']) & _has_value(df['OBJECT_NUMBER'])
+    rejected_rows = int((~keyed).sum())
+    df = df[keyed]
+    frame = pd.DataFrame(index=df.index)
+
+    frame['fing_item_number'] = _as_text(df['FING_ITEM_NUMBER'])
+    frame['name'] = _as_text(df['FING_DESCRIPTION'])
+    frame['description'] = frame['name']
+    frame['description_expanded'] = _as_text(df['Ingredient Description Expanded'])
+
+    frame['object_number'] = _as_text(df['OBJECT_NUMBER'])
+    frame['formulation_name'] = _as_text(df['FORMULATION_NAME'])
+    frame['lifecycle_phase'] = _as_text(df['LIFECYCLE_PHASE'])
+    for field, column in FORMULA_TEXT_COLUMNS.items():
+        frame[field] = _as_text(df[column]) if column in df.columns else ''
+    for field, column in FORMULA_OPTIONAL_COLUMNS.items():
+        frame[field] = _as_optional_text(df[column]) if column in df.columns else ''
+
+    frame['amount'], frame['amount_parsed'], invalid_amounts = _parse_amounts(df['FING_QUANTITY'])
+    frame['unit'] = _as_optional_text(df['FING_UNIT'])
+
+    frame.attrs['invalid_amounts'] = invalid_amounts
+    frame.attrs['rejected_rows'] = rejected_rows
+    return frame.reset_index(drop=True)
+
+
+class SynapsImporter:
+    """Bulk-writes normalized Synaps frames, deduplicating ingredients and formulas across calls"""
+
+    def __init__(self, session, batch_size=BATCH_SIZE, log=print):
+        self.session = session
+        self.batch_size = batch_size
+        self.log = log
+        self.ingredient_ids = {}  # fing_item_number -> ingredient id
+        self.formula_ids = {}  # object_number -> formula id
+        self.sites = ProductionSiteLinker(session, batch_size)
+        self.rows_processed = 0
+        self.formula_ingredients_created = 0
+        self.invalid_amounts = 0
+        self.errors = 0
+
+    def _next_id(self, model):
+        max_id = self.session.query(func.max(model.id)).scalar()
+        return (max_id or 0) + 1
+
+    def _bulk_insert(self, model, records):
+        for start in range(0, len(records), self.batch_size):
+            self.session.execute(model.__table__.insert(), records[start:start + self.batch_size])
+
+    def _insert_new(self, model, frame, key, fields, ids):
+        """Insert the first occurrence of each unseen key and record its new id; returns the inserted records"""
+        new_rows = frame.drop_duplicates(key)
+        new_rows = new_rows[~new_rows[key].isin(ids.keys())]
+        if new_rows.empty:
+            return []
+
+        start_id = self._next_id(model)
+        records = new_rows[fields].to_dict('records')
+        for offset, record in enumerate(records):
+            record['id'] = start_id + offset
+            ids[record[key]] = record['id']
+        self._bulk_insert(model, records)
+        return records
+
+    def ingest(self, frame):
+        """Insert the ingredients, formulas and formula lines of a normalized frame"""
+        # Rows normalize_synaps_frame left out count as processed, with an error each
+        rejected_rows = frame.attrs.get('rejected_rows', 0)
+        self.rows_processed += rejected_rows
+        self.errors += rejected_rows
+        if frame.empty:
+            return
+
+        self._insert_new(Ingredient, frame, 'fing_item_number', INGREDIENT_FIELDS, self.ingredient_ids)
+        formulas = self._insert_new(Formula, frame, 'object_number', FORMULA_FIELDS, self.formula_ids)
+        self.sites.link((formula['id'], formula['production_sites']) for formula in formulas)
+
+        lines = _with_normalized_amounts(pd.DataFrame({
+            'formula_id': frame['object_number'].map(self.formula_ids),
+            'ingredient_id': frame['fing_item_number'].map(self.ingredient_ids),
+            'amount': frame['amount'],
+            'unit': frame['unit'],
+            'amount_parsed': frame['amount_parsed'],
+        }))
+        self._bulk_insert(FormulaIngredient, lines[FORMULA_INGREDIENT_FIELDS + NORMALIZED_FIELDS].to_dict('records'))
+
+        self.rows_processed += len(frame)
+        self.formula_ingredients_created += len(lines)
+        self.invalid_amounts += frame.attrs.get('invalid_amounts', 0)
+        self.log(f"Imported {self.rows_processed} rows "
+                 f"({len(self.ingredient_ids)} ingredients, {len(self.formula_ids)} formulas)")
+
+    def stats(self):
+        return {
+            'ingredients_created': len(self.ingredient_ids),
+            'formulas_created': len(self.formula_ids),
+            'formula_ingredients_created': self.formula_ingredients_created,
+            'errors': self.errors,
+        }
+
+
+def split_synaps_frame(frame):
+    """Split a normalized frame into unique ingredients, unique formulas and formula lines"""
+    ingredients = frame.drop_duplicates('fing_item_number')[INGREDIENT_FIELDS]
+    formulas = frame.drop_duplicates('object_number')[FORMULA_FIELDS]
+    lines = frame[LINE_COLUMNS]
+    return ingredients, formulas, lines
+
+
+def _with_normalized_amounts(lines):
+    """Formula line records with their normalized amount columns, from amount, unit and amount_parsed"""
+    normalized = normalize_amounts(lines['amount'], lines['unit'], lines['amount_parsed'])
+    normalized.index = lines.index
+    return pd.concat([lines.drop(columns='amount_parsed'), normalized], axis=1)
+
+
+def _differs(left, right):
+    """Element-wise inequality that treats two missing values as equal"""
+    return (left != right) & ~(left.isna() & right.isna())
+
+
+class DeltaImporter:
+    """Applies only the inserts, updates and deletes needed to make the tables match an incoming dataset.
+
+    Ingredients are matched by fing_item_number and formulas by object_number, so
+    their ids and the aliases attached to them are left untouched. The lines of a
+    formula are rewritten only when its set of (ingredient, amount, unit, convertibility) changed.
+    """
+
+    def __init__(self, session, batch_size=BATCH_SIZE, log=print):
+        self.session = session
+        self.batch_size = batch_size
+        self.log = log
+        self.ingredient_parts = []
+        self.formula_parts = []
+        self.line_parts = []
+        self.rows_processed = 0
+        self.invalid_amounts = 0
+        self.errors = 0
+        self.counts = {}
+        self.sites = ProductionSiteLinker(session, batch_size)
+
+    def add(self, ingredients, formulas, lines):
+        """Collect incoming ingredients, formulas and lines (keyed by object_number / fing_item_number)"""
+        self.ingredient_parts.append(ingredients)
+        self.formula_parts.append(formulas)
+        self.line_parts.append(lines)
+
+    def ingest(self, frame):
+        """Collect a normalized Synaps frame"""
+        self.add(*split_synaps_frame(frame))
+        # Rows normalize_synaps_frame left out count as processed, with an error each
+        rejected_rows = frame.attrs.get('rejected_rows', 0)
+        self.rows_processed += len(frame) + rejected_rows
+        self.errors += rejected_rows
+        self.invalid_amounts += frame.attrs.get('invalid_amounts', 0)
+
+    def _current(self, model, fields):
+        columns = [getattr(model, field) for field in ['id'] + fields]
+        return pd.DataFrame(self.session.execute(select(*columns)).all(), columns=['id'] + fields)
+
+    def _execute_many(self, statement, records):
+        for start in range(0, len(records), self.batch_size):
+            self.session.execute(statement, records[start:start + self.batch_size])
+
+    def _delete_ids(self, column, ids):
+        ids = [int(i) for i in ids]
+        for start in range(0, len(ids), self.batch_size):
+            self.session.execute(column.table.delete().where(column.in_(ids[start:start + self.batch_size])))
+
+    def _match_item_numbers(self, ingredients):
+        """Give stored ingredients the incoming item number they only differ from in form ('123.0' / '123').
+
+        They keep their ids and aliases instead of being deleted and added again.
+        """
+        incoming = set(ingredients['fing_item_number'])
+        by_key = {}
+        for number in incoming:
+            by_key.setdefault(item_number_key(number), number)
+        stored = dict(self.session.execute(select(Ingredient.fing_item_number, Ingredient.id)).all())
+
+        records = []
+        for number, ingredient_id in stored.items():
+            target = by_key.get(item_number_key(number))
+            if number not in incoming and target is not None and target not in stored:
+                records.append({'_id': ingredient_id, 'fing_item_number': target})
+        table = Ingredient.__table__
+        statement = table.update().where(table.c.id == bindparam('_id')).values(fing_item_number=bindparam('fing_item_number'))
+        self._execute_many(statement, records)
+        self.counts['ingredients_renumbered'] = len(records)
+
+    def _sync(self, model, incoming, key, fields):
+        """Insert new and update changed rows of model; returns (key -> id, ids of rows no longer present)"""
+        incoming = incoming.drop_duplicates(key)
+        current = self._current(model, fields)
+        merged = incoming.merge(current, on=key, how='outer', suffixes=('', '_current'), indicator=True)
+
+        added = merged[merged['_merge'] == 'left_only']
+        if not added.empty:
+            max_id = self.session.query(func.max(model.id)).scalar() or 0
+            records = added[fields].to_dict('records')
+            for offset, record in enumerate(records):
+                record['id'] = max_id + 1 + offset
+            self._execute_many(model.__table__.insert(), records)
+            merged.loc[added.index, 'id'] = [record['id'] for record in records]
+
+        both = merged[merged['_merge'] == 'both']
+        value_fields = [field for field in fields if field != key]
+        changed = pd.Series(False, index=both.index)
+        for field in value_fields:
+            changed |= _differs(both[field], both[f'{field}_current'])
+        updated = both[changed]
+        if not updated.empty:
+            table = model.__table__
+            statement = table.update().where(table.c.id == bindparam('_id')).values(
+                {field: bindparam(field) for field in value_fields}
+            )
+            records = updated[value_fields].to_dict('records')
+            for record, row_id in zip(records, updated['id']):
+                record['_id'] = int(row_id)
+            self._execute_many(statement, records)
+
+        removed = merged.loc[merged['_merge'] == 'right_only', 'id']
+        present = merged[merged['_merge'] != 'right_only']
+        ids = dict(zip(present[key], present['id'].astype(int)))
+
+        name = model.__tablename__
+        self.counts[f'{name}s_added'] = len(added)
+        self.counts[f'{name}s_updated'] = len(updated)
+        self.counts[f'{name}s_deleted'] = len(removed)
+        return ids, removed.astype(int).tolist()
+
+    def apply(self):
+        """Write the collected dataset as a delta against the current tables"""
+        ingredients = pd.concat(self.ingredient_parts, ignore_index=True) if self.ingredient_parts else pd.DataFrame(columns=INGREDIENT_FIELDS)
+        formulas = pd.concat(self.formula_parts, ignore_index=True) if self.formula_parts else pd.DataFrame(columns=FORMULA_FIELDS)
+        lines = pd.concat(self.line_parts, ignore_index=True) if self.line_parts else pd.DataFrame(columns=LINE_COLUMNS)
+        self.ingredient_parts, self.formula_parts, self.line_parts = [], [], []
+
+        self._match_item_numbers(ingredients)
+        ingredient_ids, removed_ingredients = self._sync(Ingredient, ingredients, 'fing_item_number', INGREDIENT_FIELDS)
+        formula_ids, removed_formulas = self._sync(Formula, formulas, 'object_number', FORMULA_FIELDS)
+        # Relink the formulas whose sites changed; deleted formulas lose their links here
+        formula_sites = formulas.drop_duplicates('object_number')
+        self.sites.sync(zip(formula_sites['object_number'].map(formula_ids), formula_sites['production_sites']))
+
+        # Compare formula lines as multisets: number repeated identical lines so they pair up one to one
+        incoming = _with_normalized_amounts(pd.DataFrame({
+            'formula_id': lines['object_number'].map(formula_ids),
+            'ingredient_id': lines['fing_item_number'].map(ingredient_ids),
+            'amount': lines['amount'].astype(float),
+            'unit': lines['unit'],
+            'amount_parsed': lines['amount_parsed'],
+        }))
+        # Lines whose formula or ingredient is not in the dataset are dropped, with an error each
+        resolved = incoming['formula_id'].notna() & incoming['ingredient_id'].notna()
+        self.errors += int((~resolved).sum())
+        incoming = incoming[resolved].astype({'formula_id': int, 'ingredient_id': int})
+        current = self._current(FormulaIngredient, FORMULA_INGREDIENT_FIELDS).drop(columns='id')
+
+        line_key = FORMULA_INGREDIENT_FIELDS
+        incoming['occurrence'] = incoming.groupby(line_key, dropna=False).cumcount()
+        current['occurrence'] = current.groupby(line_key, dropna=False).cumcount()
+        diff = incoming[line_key + ['occurrence']].merge(current, on=line_key + ['occurrence'], how='outer', indicator=True)
+        changed_formulas = diff.loc[diff['_merge'] != 'both', 'formula_id'].astype(int).unique()
+
+        # Rewrite the lines of every formula whose composition changed
+        self._delete_ids(FormulaIngredient.formula_id, changed_formulas)
+        new_lines = incoming[incoming['formula_id'].isin(changed_formulas)]
+        self._execute_many(
+            FormulaIngredient.__table__.insert(),
+            new_lines[FORMULA_INGREDIENT_FIELDS + NORMALIZED_FIELDS].to_dict('records')
+        )
+
+        self._delete_ids(Formula.id, removed_formulas)
+        self.sites.prune()
+        self._delete_ids(IngredientAlias.ingredient_id, removed_ingredients)
+        self._delete_ids(Ingredient.id, removed_ingredients)
+
+        self.counts['formulas_rewritten'] = len(changed_formulas)
+        self.counts['formula_ingredients_added'] = len(new_lines)
+        self.counts['formula_ingredients_total'] = len(incoming)
+        self.log(f"Delta import: {self.counts}")
+        return self.counts
+
+    def stats(self):
+        return {
+            'ingredients_created': self.counts.get('ingredients_added', 0),
+            'formulas_created': self.counts.get('formulas_added', 0),
+            'formula_ingredients_created': self.counts.get('formula_ingredients_added', 0),
+            'errors': self.errors,
+            'delta': self.counts,
+        }
+
+
+class DatabaseJsonImporter:
+    """Bulk-writes the ingredients and formulas of an exported database JSON file into an empty database.
+
+    Elements are consumed from iterables and written in batches of batch_size, so the
+    whole document never has to be in memory. Ingredients must be added before formulas.
+    """
+
+    def __init__(self, session, batch_size=BATCH_SIZE, log=print):
+        self.session = session
+        self.batch_size = batch_size
+        self.log = log
+        self.ingredient_ids = {}  # ingredient id in the file -> ingredient id in the database
+        self.sites = ProductionSiteLinker(session, batch_size)
+        self.formulas_created = 0
+        self.formula_ingredients_created = 0
+        self.rows_processed = 0
+
+    def _next_id(self, model):
+        max_id = self.session.query(func.max(model.id)).scalar()
+        return (max_id or 0) + 1
+
+    def _insert(self, model, records):
+        """Insert and empty a batch of records"""
+        if records:
+            self.session.execute(model.__table__.insert(), records)
+            records.clear()
+
+    def add_ingredients(self, ingredients, progress=None):
+        """Insert ingredients; progress(rows_processed) is called after every batch"""
+        next_id = self._next_id(Ingredient)
+        batch = []
+        for ingredient_data in ingredients:
+            record = {field: ingredient_data.get(field, '') for field in INGREDIENT_FIELDS}
+            record['id'] = next_id
+            self.ingredient_ids[ingredient_data.get('id')] = next_id
+            next_id += 1
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self.rows_processed += len(batch)
+                self._insert(Ingredient, batch)
+                if progress:
+                    progress(self.rows_processed)
+        self.rows_processed += len(batch)
+        self._insert(Ingredient, batch)
+
+    def add_formulas(self, formulas, progress=None):
+        """Insert formulas with their ingredient lines; progress(rows_processed) is called after every batch"""
+        next_id = self._next_id(Formula)
+        batch = []
+        lines = []
+        for formula_data in formulas:
+            record = {field: formula_data.get(field, '') for field in FORMULA_FIELDS}
+            record['id'] = next_id
+            batch.append(record)
+            for ingredient_data in formula_data.get('ingredients', []):
+                # Lines pointing at ingredients missing from the file are skipped
+                ingredient_id = self.ingredient_ids.get(ingredient_data.get('ingredient_id'))
+                if ingredient_id is not None:
+                    amount = ingredient_data.get('amount', 0.0)
+                    unit = ingredient_data.get('unit', '')
+                    lines.append({
+                        'formula_id': next_id,
+                        'ingredient_id': ingredient_id,
+                        'amount': amount,
+                        'unit': unit,
+                        # Files exported before the flag existed have no Q.S. information
+                        **normalize_amount(amount, unit, amount_parsed(amount, ingredient_data.get('amount_convertible')))
+                    })
+            next_id += 1
+            if len(batch) >= self.batch_size or len(lines) >= self.batch_size:
+                self._insert_formulas(batch, lines)
+                if progress:
+                    progress(self.rows_processed)
+        self._insert_formulas(batch, lines)
+
+    def _insert_formulas(self, formulas, lines):
+        self.rows_processed += len(formulas)
+        self.formulas_created += len(formulas)
+        self.formula_ingredients_created += len(lines)
+        formula_sites = [(formula['id'], formula['production_sites']) for formula in formulas]
+        self._insert(Formula, formulas)
+        self._insert(FormulaIngredient, lines)
+        self.sites.link(formula_sites)
+
+    def stats(self):
+        return {
+            'ingredients_created': len(self.ingredient_ids),
+            'formulas_created': self.formulas_created,
+            'formula_ingredients_created': self.formula_ingredients_created,
+        }
+
+
+def database_json_frames(ingredients, formulas):
+    """Convert the ingredients and formulas of an exported database JSON file into (ingredients, formulas, lines) frames.
+
+    Both arguments may be iterators; ingredients are consumed before formulas.
+    """
+    numbers = {}  # ingredient id in the file -> fing_item_number
+    ingredient_rows = []
+    for ingredient_data in ingredients:
+        row = {field: ingredient_data.get(field, '') for field in INGREDIENT_FIELDS}
+        numbers[ingredient_data['id']] = row['fing_item_number']
+        ingredient_rows.append(row)
+
+    formula_rows = []
+    line_rows = []
+    for formula_data in formulas:
+        row = {field: formula_data.get(field, '') for field in FORMULA_FIELDS}
+        formula_rows.append(row)
+        for ingredient_data in formula_data.get('ingredients', []):
+            # Lines pointing at ingredients missing from the file are skipped, as in a full import
+            if ingredient_data.get('ingredient_id') in numbers:
+                amount = ingredient_data.get('amount', 0.0)
+                line_rows.append({
+                    'object_number': row['object_number'],
+                    'fing_item_number': numbers[ingredient_data['ingredient_id']],
+                    'amount': amount,
+                    'unit': ingredient_data.get('unit', ''),
+                    'amount_parsed': amount_parsed(amount, ingredient_data.get('amount_convertible'))
+                })
+
+    return (
+        pd.DataFrame(ingredient_rows, columns=INGREDIENT_FIELDS),
+        pd.DataFrame(formula_rows, columns=FORMULA_FIELDS),
+        pd.DataFrame(line_rows, columns=LINE_COLUMNS)
+    )
@@ -0,0 +1,78 @@
+import threading
+from collections import defaultdict
+
+from sqlalchemy import select
+
+from models.formula import Ingredient, IngredientAlias
+from services.search_index import normalize_term
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)} or {text}
+
+
+class IngredientTextIndex:
+    """In-memory index over ingredient names, item numbers and aliases, for lookups while typing.
+
+    Entries map (kind, row id), kind being 'name', 'item' or 'alias', to (normalized text,
+    ingredient id, text), and are indexed by character trigrams. The index follows the data
+    generation: after a change it rereads the ingredient and alias rows and reindexes only the
+    entries whose text changed (through _add and _remove), so adding or deleting an alias is cheap.
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.entries_generation = None
+        self.entries = {}
+        self.grams = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def current(self, session):
+        """This index, brought up to date with the current data generation"""
+        generation = self.generation.current()
+        if generation != self.entries_generation:
+            with self.lock:
+                if generation != self.entries_generation:
+                    self._sync(self._rows(session))
+                    self.entries_generation = generation
+        return self
+
+    def _rows(self, session):
+        rows = {}
+        for ingredient_id, name, item_number in session.execute(
+            select(Ingredient.id, Ingredient.name, Ingredient.fing_item_number)
+        ):
+            if name:
+                rows[('name', ingredient_id)] = (normalize_term(name), ingredient_id, name)
+            if item_number:
+                rows[('item', ingredient_id)] = (normalize_term(item_number), ingredient_id, item_number)
+        for alias_id, alias, ingredient_id in session.execute(
+            select(IngredientAlias.id, IngredientAlias.alias, IngredientAlias.ingredient_id)
+        ):
+            rows[('alias', alias_id)] = (normalize_term(alias), ingredient_id, alias)
+        return rows
+
+    def _sync(self, rows):
+        for key in [key for key, entry in self.entries.items() if rows.get(key) != entry]:
+            self._remove(key, self.entries.pop(key))
+        for key, entry in rows.items():
+            if key not in self.entries:
+                self.entries[key] = entry
+                self._add(key, entry)
+
+    def _add(self, key, entry):
+        for gram in trigrams(entry[0]):
+            self.grams[gram].add(key)
+
+    def _remove(self, key, entry):
+        for gram in trigrams(entry[0]):
+            postings = self.grams[gram]
+            postings.discard(key)
+            if not postings:
+                del self.grams[gram]
+
+    def _containing(self, term):
+        """Keys of the entries whose text contains the normalized term (3 characters or more)"""
+        postings = sorted((self.grams.get(gram, set()) for gram in trigrams(term)), key=len)
+        keys = postings[0].intersection(*postings[1:])
+        return [key for key in keys if term in self.entries[key][0]]
@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from models.formula import db
+
+# Minimum number of seconds between two progress writes of the same job
+PROGRESS_INTERVAL = 1.0
+
+# Finished jobs older than this many seconds are removed from disk
+JOB_RETENTION = 24 * 60 * 60
+
+
+class Job:
+    """State and progress of one background job"""
+
+    def __init__(self, runner, kind):
+        self.runner = runner
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.rows_processed = 0
+        self.total_rows = None
+        self.errors = 0
+        self.message = 'Queued'
+        self.result = None
+        self.error = None
+        self._last_saved = 0.0
+
+    def log(self, message):
+        """Record a progress message (also printed to the server log)"""
+        print(f"[job {self.id[:8]}] {message}")
+        self.message = message
+        self.save()
+
+    def progress(self, rows_processed=None, total_rows=None, errors=None):
+        if rows_processed is not None:
+            self.rows_processed = rows_processed
+        if total_rows is not None:
+            self.total_rows = total_rows
+        if errors is not None:
+            self.errors = errors
+        self.save()
+
+    def save(self, force=False):
+        now = time.time()
+        if force or now - self._last_saved >= PROGRESS_INTERVAL:
+            self._last_saved = now
+            self.runner.save(self)
+
+    def to_dict(self):
+        elapsed = None
+        throughput = None
+        eta = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            if elapsed > 0:
+                throughput = self.rows_processed / elapsed
+            if self.status == 'running' and throughput and self.total_rows:
+                eta = max(self.total_rows - self.rows_processed, 0) / throughput
+
+        return {
+            'id': self.id,
+            'type': self.kind,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'elapsed_seconds': elapsed,
+            'rows_processed': self.rows_processed,
+            'total_rows': self.total_rows,
+            'throughput': throughput,
+            'eta_seconds': eta,
+            'errors': self.errors,
+            'message': self.message,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class JobRunner:
+    """Runs jobs on a thread pool inside an application context.
+
+    Job state is mirrored to one JSON file per job so that any worker process
+    can report on a job started by another one.
+    """
+
+    def __init__(self, app, jobs_dir, max_workers=1):
+        self.app = app
+        self.jobs_dir = jobs_dir
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='find-job')
+        self.jobs = {}
+        self.lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f'{job_id}.json')
+
+    def save(self, job):
+        data = job.to_dict()
+        tmp_path = f'{self._path(job.id)}.tmp'
+        with self.lock:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path(job.id))
+
+    def submit(self, kind, func, *args, **kwargs):
+        """Queue func(job, *args, **kwargs); its return value becomes the job result"""
+        self.cleanup()
+        job = Job(self, kind)
+        self.jobs[job.id] = job
+        job.save(force=True)
+        self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        with self.app.app_context():
+            job.status = 'running'
+            job.started_at = time.time()
+            job.message = 'Running'
+            job.save(force=True)
+            try:
+                job.result = func(job, *args, **kwargs)
+                job.status = 'succeeded'
+                job.message = 'Completed'
+            except Exception as e:
+                traceback.print_exc()
+                job.status = 'failed'
+                job.error = str(e)
+                job.message = 'Failed'
+                # Leave no half-written transaction behind for the next job
+                db.session.rollback()
+            finally:
+                job.finished_at = time.time()
+                job.save(force=True)
+
+    def get(self, job_id):
+        """Return the state of a job as a dict, or None if it is unknown"""
+        if not job_id.isalnum():
+            return None
+        job = self.jobs.get(job_id)
+        if job:
+            return job.to_dict()
+
+        # The job may belong to another worker process
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def list(self):
+        jobs = []
+        for filename in os.listdir(self.jobs_dir):
+            if filename.endswith('.json'):
+                job = self.get(filename[:-len('.json')])
+                if job:
+                    jobs.append(job)
+        jobs.sort(key=lambda job: job['created_at'], reverse=True)
+        return jobs
+
+    def cleanup(self):
+        """Forget finished jobs older than JOB_RETENTION"""
+        cutoff = time.time() - JOB_RETENTION
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at and job.finished_at < cutoff:
+                del self.jobs[job_id]
+        for filename in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, filename)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
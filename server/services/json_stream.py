@@ -0,0 +1,147 @@
+import json
+
+# Bytes read from the file per refill of the parse buffer
+READ_SIZE = 1024 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Character buffer over a text file that is refilled on demand and compacted as it is consumed"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read another block; returns False at end of file"""
+        if self.eof:
+            return False
+        block = self.f.read(READ_SIZE)
+        if not block:
+            self.eof = True
+            return False
+        # Drop what has been consumed before growing the buffer
+        self.buffer = self.buffer[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it, or '' at end of file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Invalid JSON file')
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value, reading more of the file as needed"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise ValueError('Invalid JSON file')
+            # A number at the very end of the buffer may continue in the next block
+            if end == len(self.buffer) and not isinstance(value, (dict, list, str)) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Yield the elements of the array starting at the current position one by one"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError('Invalid JSON file')
+
+
+def _skip(reader):
+    """Consume the value at the current position, decoding arrays one element at a time"""
+    if reader.peek() == '[':
+        for _ in reader.array():
+            pass
+    else:
+        reader.value()
+
+
+def _members(reader):
+    """Yield the name of each member of the object at the current position, with the reader at its value.
+
+    The caller consumes the value before asking for the next member.
+    """
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+        return
+
+    while True:
+        name = reader.value()
+        if not isinstance(name, str):
+            raise ValueError('Invalid JSON file')
+        reader.expect(':')
+        yield name
+
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == '}':
+            return
+        if separator != ',':
+            raise ValueError('Invalid JSON file')
+
+
+def json_array_keys(path):
+    """Keys of the top-level object of a JSON file whose values are arrays, reading it in one bounded pass.
+
+    Raises ValueError if the file is not a valid JSON object.
+    """
+    keys = []
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _Reader(f)
+        for name in _members(reader):
+            if reader.peek() == '[':
+                keys.append(name)
+            _skip(reader)
+        if reader.peek() != '':
+            raise ValueError('Invalid JSON file')
+    return keys
+
+
+def iter_json_array(path, key):
+    """Yield the elements of the array stored under key in the top-level object of a JSON file.
+
+    Only one element is decoded at a time, so memory stays bounded by the largest element
+    rather than by the file. Other top-level arrays are skipped element by element.
+    Raises KeyError if the key is missing and ValueError if the file is not valid JSON.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _Reader(f)
+        for name in _members(reader):
+            if name == key:
+                if reader.peek() != '[':
+                    raise ValueError(f'Invalid JSON format: {key} is not a list')
+                yield from reader.array()
+                return
+            _skip(reader)
+        raise KeyError(key)
@@ -0,0 +1,72 @@
+import os
+
+from sqlalchemy import inspect
+
+from models.formula import db, DatabaseMetadata
+from services.snapshot import file_digest
+
+# Bump whenever the tables change in a way that needs the database to be rebuilt
+SCHEMA_VERSION = 3
+
+SCHEMA_VERSION_KEY = 'schema_version'
+SOURCE_FINGERPRINT_KEY = 'source_fingerprint'  # SHA-256 of the workbook the data was loaded from
+SOURCE_STAT_KEY = 'source_stat'  # size and mtime of that workbook, checked before hashing it
+
+
+def get_metadata(session, key):
+    row = session.get(DatabaseMetadata, key)
+    return row.value if row else None
+
+
+def set_metadata(session, key, value):
+    session.merge(DatabaseMetadata(key=key, value=str(value)))
+
+
+def file_stat(path):
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def source_metadata(path, digest):
+    """Metadata entries that identify the workbook at path as the source of the data"""
+    return {SOURCE_FINGERPRINT_KEY: digest, SOURCE_STAT_KEY: file_stat(path)}
+
+
+def copy_metadata(source, target, overrides=None):
+    """Copy the metadata of the source session to target, stamping the current schema version"""
+    values = {}
+    if inspect(source.get_bind()).has_table(DatabaseMetadata.__tablename__):
+        values = {row.key: row.value for row in source.query(DatabaseMetadata)}
+    values[SCHEMA_VERSION_KEY] = SCHEMA_VERSION
+    values.update(overrides or {})
+    for key, value in values.items():
+        set_metadata(target, key, value)
+
+
+def rebuild_reason(source_path):
+    """Return why the database has to be rebuilt from the source workbook, or None if it is current.
+
+    The workbook is only hashed when its size or modification time differ from the recorded ones.
+    """
+    if not inspect(db.engine).has_table(DatabaseMetadata.__tablename__):
+        return 'database has no metadata table'
+
+    version = get_metadata(db.session, SCHEMA_VERSION_KEY)
+    if version != str(SCHEMA_VERSION):
+        return f'schema version {version} does not match {SCHEMA_VERSION}'
+
+    if not os.path.exists(source_path):
+        # Nothing to rebuild from; keep serving what is there
+        return None
+
+    if get_metadata(db.session, SOURCE_STAT_KEY) == file_stat(source_path):
+        return None
+
+    digest = file_digest(source_path)
+    if get_metadata(db.session, SOURCE_FINGERPRINT_KEY) != digest:
+        return 'source workbook changed'
+
+    # Same content with a new timestamp (e.g. copied again): remember the new stat
+    set_metadata(db.session, SOURCE_STAT_KEY, file_stat(source_path))
+    db.session.commit()
+    return None
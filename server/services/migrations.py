@@ -0,0 +1,144 @@
+from sqlalchemy import inspect, text
+
+from models.formula import db
+from services.production_sites import backfill_production_sites
+from services.units import backfill_normalized_amounts
+
+# The hot query shapes, shown with EXPLAIN QUERY PLAN before and after a migration
+QUERY_PLAN_SAMPLES = [
+    ('ingredient filter with an amount range',
+     "SELECT formula_id FROM formula_ingredient WHERE ingredient_id IN (1, 2, 3) AND amount BETWEEN 1 AND 10"),
+    ('ingredient filter with a range in a canonical unit',
+     """SELECT formula_id FROM formula_ingredient
+        WHERE ingredient_id IN (1, 2, 3) AND normalized_unit = 'mg' AND normalized_amount BETWEEN 1 AND 10"""),
+    ('ingredient lines of a formula',
+     "SELECT * FROM formula_ingredient WHERE formula_id = 1"),
+    ('formulas with their lines and ingredients',
+     """SELECT f.id, i.name, fi.amount FROM formula f JOIN formula_ingredient fi ON fi.formula_id = f.id
+        JOIN ingredient i ON i.id = fi.ingredient_id WHERE f.id IN (1, 2, 3)"""),
+    ('aliases of an ingredient',
+     "SELECT * FROM ingredient_alias WHERE ingredient_id = 1"),
+    ('brand filter, one page in id order',
+     "SELECT id FROM formula WHERE formula_brand = 'x' ORDER BY id LIMIT 20"),
+    ('category and lifecycle filters',
+     "SELECT id FROM formula WHERE sbu_category = 'x' AND lifecycle_phase = 'y'"),
+    ('production site filter',
+     """SELECT formula_id FROM formula_production_site
+        WHERE production_site_id IN (SELECT id FROM production_site WHERE name LIKE '%x%')"""),
+    ('production site filter options',
+     "SELECT name FROM production_site ORDER BY name"),
+    ('brand filter options',
+     "SELECT DISTINCT formula_brand FROM formula WHERE formula_brand != '' ORDER BY formula_brand"),
+    ('ingredient listing by name',
+     "SELECT id, name FROM ingredient ORDER BY name LIMIT 50"),
+]
+
+
+# Fill a table added to an existing database from the tables it already has, by table name
+TABLE_BACKFILLS = {
+    'formula_production_site': backfill_production_sites,
+}
+
+# Fill a column added to an existing database, by (table, column); run once all columns are added
+COLUMN_BACKFILLS = {
+    ('formula_ingredient', 'normalized_amount'): backfill_normalized_amounts,
+}
+
+
+def add_missing_tables(engine, log=print):
+    """Create the declared tables missing from an existing database and fill them; returns their names.
+
+    An empty database is left to create_all(). TABLE_BACKFILLS derives the rows of new tables
+    from the data already there, once all missing tables exist.
+    """
+    with engine.begin() as connection:
+        existing = set(inspect(connection).get_table_names())
+        if not existing:
+            return []
+        missing = [table for table in db.metadata.sorted_tables if table.name not in existing]
+        for table in missing:
+            log(f"Creating table {table.name}")
+        db.metadata.create_all(connection, tables=missing)
+        for table in missing:
+            if table.name in TABLE_BACKFILLS:
+                log(f"Filling {table.name} from existing rows")
+                TABLE_BACKFILLS[table.name](connection)
+    return [table.name for table in missing]
+
+
+def add_missing_columns(engine, log=print):
+    """Add the declared columns missing from the tables of an existing database and fill them.
+
+    create_all() does not alter existing tables. Columns are added as nullable, without their
+    defaults; COLUMN_BACKFILLS computes the values of existing rows. Returns 'table.column' names.
+    """
+    added = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    log(f"Adding column {table.name}.{column.name}")
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    added.append((table.name, column.name))
+        for key, backfill in COLUMN_BACKFILLS.items():
+            if key in added:
+                log(f"Filling {'.'.join(key)} of existing rows")
+                backfill(connection)
+    return ['.'.join(key) for key in added]
+
+
+def missing_indexes(connection):
+    """Indexes declared on the models that the database does not have yet"""
+    inspector = inspect(connection)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def create_missing_indexes(engine, log=print):
+    """Add the declared indexes missing from an existing database; returns their names.
+
+    create_all() only creates indexes together with their tables, so databases created
+    before an index was declared need this. The planner statistics are refreshed afterwards.
+    """
+    with engine.begin() as connection:
+        missing = missing_indexes(connection)
+        for index in missing:
+            columns = ', '.join(column.name for column in index.columns)
+            log(f"Creating index {index.name} on {index.table.name}({columns})")
+            index.create(connection)
+        if missing:
+            connection.execute(text('ANALYZE'))
+    return [index.name for index in missing]
+
+
+def query_plans(engine):
+    """EXPLAIN QUERY PLAN details of each sample query, by sample name"""
+    plans = {}
+    with engine.connect() as connection:
+        for name, sql in QUERY_PLAN_SAMPLES:
+            rows = connection.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+            plans[name] = [row[-1] for row in rows]
+    return plans
+
+
+def query_plan_report(before, after):
+    """Text report comparing two query_plans() results"""
+    lines = []
+    for name, _ in QUERY_PLAN_SAMPLES:
+        lines.append(f"{name}:")
+        lines.extend(f"  before: {detail}" for detail in before[name])
+        if after[name] == before[name]:
+            lines.append("  after:  (unchanged)")
+        else:
+            lines.extend(f"  after:  {detail}" for detail in after[name])
+    return '\n'.join(lines)
@@ -0,0 +1,105 @@
+from collections import defaultdict
+
+from sqlalchemy import select
+
+from models.formula import Formula, FormulaProductionSite, ProductionSite
+
+# Rows written per executemany call
+BATCH_SIZE = 10000
+
+# Separator of the site names in Formula.production_sites
+SITE_SEPARATOR = ','
+
+
+def split_production_sites(value):
+    """Distinct site names of a comma-separated production_sites value, in the order listed"""
+    if not value:
+        return []
+    return list(dict.fromkeys(site.strip() for site in value.split(SITE_SEPARATOR) if site.strip()))
+
+
+class ProductionSiteLinker:
+    """Keeps the production_site and formula_production_site tables in step with Formula.production_sites.
+
+    Formula.production_sites stays the text the API returns; the tables hold the same sites
+    normalized, one link row per (formula, site), for indexed site filters and the site list.
+    Sites are created as they first appear. Works on a session or a connection.
+    """
+
+    def __init__(self, connection, batch_size=BATCH_SIZE):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.site_ids = None  # site name -> id, read on first use
+
+    def _insert(self, model, records):
+        for start in range(0, len(records), self.batch_size):
+            self.connection.execute(model.__table__.insert(), records[start:start + self.batch_size])
+
+    def _site_id(self, name, new_sites):
+        site_id = self.site_ids.get(name)
+        if site_id is None:
+            site_id = self.site_ids[name] = self.next_site_id
+            self.next_site_id += 1
+            new_sites.append({'id': site_id, 'name': name})
+        return site_id
+
+    def link(self, formula_sites):
+        """Insert the links of (formula id, production_sites) pairs of formulas that have none yet"""
+        return self._link((formula_id, split_production_sites(sites)) for formula_id, sites in formula_sites)
+
+    def _link(self, formula_names):
+        if self.site_ids is None:
+            self.site_ids = dict(self.connection.execute(select(ProductionSite.name, ProductionSite.id)).all())
+            self.next_site_id = max(self.site_ids.values(), default=0) + 1
+        new_sites = []
+        links = [
+            {'formula_id': int(formula_id), 'production_site_id': self._site_id(name, new_sites)}
+            for formula_id, names in formula_names
+            for name in names
+        ]
+        self._insert(ProductionSite, new_sites)
+        self._insert(FormulaProductionSite, links)
+        return len(links)
+
+    def unlink(self, formula_ids):
+        """Delete the links of the given formulas"""
+        formula_ids = [int(formula_id) for formula_id in formula_ids]
+        table = FormulaProductionSite.__table__
+        for start in range(0, len(formula_ids), self.batch_size):
+            self.connection.execute(
+                table.delete().where(table.c.formula_id.in_(formula_ids[start:start + self.batch_size]))
+            )
+
+    def sync(self, formula_sites):
+        """Make the links match (formula id, production_sites) pairs covering every formula.
+
+        Only formulas whose set of sites changed are relinked; links of formulas missing from
+        formula_sites are deleted. Returns the number of formulas relinked.
+        """
+        incoming = {int(formula_id): split_production_sites(sites) for formula_id, sites in formula_sites}
+        current = defaultdict(set)
+        for formula_id, name in self.connection.execute(
+            select(FormulaProductionSite.formula_id, ProductionSite.name).join(ProductionSite)
+        ):
+            current[formula_id].add(name)
+
+        changed = sorted(
+            formula_id for formula_id in incoming.keys() | current.keys()
+            if set(incoming.get(formula_id, ())) != current.get(formula_id, set())
+        )
+        self.unlink(changed)
+        self._link((formula_id, incoming[formula_id]) for formula_id in changed if formula_id in incoming)
+        return len(changed)
+
+    def prune(self):
+        """Delete the sites no formula lists any more"""
+        table = ProductionSite.__table__
+        self.connection.execute(
+            table.delete().where(table.c.id.not_in(select(FormulaProductionSite.production_site_id)))
+        )
+        self.site_ids = None
+
+
+def backfill_production_sites(connection):
+    """Fill the site tables from the production_sites of every formula, for databases that predate them"""
+    ProductionSiteLinker(connection).link(connection.execute(select(Formula.id, Formula.production_sites)).all())
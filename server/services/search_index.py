@@ -0,0 +1,133 @@
+from sqlalchemy import Integer, bindparam, inspect, text
+from sqlalchemy.exc import OperationalError
+
+from models.formula import db, Ingredient, IngredientAlias
+
+# FTS5 tables with the trigram tokenizer over ingredient names, item numbers and aliases.
+# They are external-content tables (the text stays in ingredient / ingredient_alias) kept in
+# sync by triggers, so every writer (imports, alias endpoints, restores) updates them.
+# A LIKE '%term%' on a trigram table is answered from the index and keeps the exact LIKE
+# semantics (ASCII case folding, % and _ wildcards).
+SEARCH_INDEX_STATEMENTS = [
+    """CREATE VIRTUAL TABLE ingredient_fts USING fts5(
+        name, fing_item_number, content='ingredient', content_rowid='id', tokenize='trigram')""",
+    """CREATE VIRTUAL TABLE ingredient_alias_fts USING fts5(
+        alias, content='ingredient_alias', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER ingredient_fts_insert AFTER INSERT ON ingredient BEGIN
+        INSERT INTO ingredient_fts(rowid, name, fing_item_number) VALUES (new.id, new.name, new.fing_item_number);
+    END""",
+    """CREATE TRIGGER ingredient_fts_delete AFTER DELETE ON ingredient BEGIN
+        INSERT INTO ingredient_fts(ingredient_fts, rowid, name, fing_item_number)
+        VALUES ('delete', old.id, old.name, old.fing_item_number);
+    END""",
+    """CREATE TRIGGER ingredient_fts_update AFTER UPDATE ON ingredient BEGIN
+        INSERT INTO ingredient_fts(ingredient_fts, rowid, name, fing_item_number)
+        VALUES ('delete', old.id, old.name, old.fing_item_number);
+        INSERT INTO ingredient_fts(rowid, name, fing_item_number) VALUES (new.id, new.name, new.fing_item_number);
+    END""",
+    """CREATE TRIGGER ingredient_alias_fts_insert AFTER INSERT ON ingredient_alias BEGIN
+        INSERT INTO ingredient_alias_fts(rowid, alias) VALUES (new.id, new.alias);
+    END""",
+    """CREATE TRIGGER ingredient_alias_fts_delete AFTER DELETE ON ingredient_alias BEGIN
+        INSERT INTO ingredient_alias_fts(ingredient_alias_fts, rowid, alias) VALUES ('delete', old.id, old.alias);
+    END""",
+    """CREATE TRIGGER ingredient_alias_fts_update AFTER UPDATE ON ingredient_alias BEGIN
+        INSERT INTO ingredient_alias_fts(ingredient_alias_fts, rowid, alias) VALUES ('delete', old.id, old.alias);
+        INSERT INTO ingredient_alias_fts(rowid, alias) VALUES (new.id, new.alias);
+    END""",
+]
+
+
+def has_search_index(connection):
+    # Remember a positive answer on the DBAPI connection; a swapped-in file gets new connections
+    if not connection.info.get('search_index'):
+        connection.info['search_index'] = inspect(connection).has_table('ingredient_fts')
+    return connection.info['search_index']
+
+
+def create_search_index(connection):
+    """Create the trigram index and its triggers if missing and fill it from the current rows.
+
+    Returns False when this SQLite build has no FTS5 trigram tokenizer; searches then scan.
+    """
+    if has_search_index(connection):
+        return True
+    try:
+        # Without FTS5 or its trigram tokenizer the first statement fails and nothing is created
+        for statement in SEARCH_INDEX_STATEMENTS:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO ingredient_fts(ingredient_fts) VALUES ('rebuild')"))
+        connection.execute(text("INSERT INTO ingredient_alias_fts(ingredient_alias_fts) VALUES ('rebuild')"))
+        connection.info['search_index'] = True
+        return True
+    except OperationalError as e:
+        print(f"Ingredient search index not available, falling back to table scans: {str(e)}")
+        return False
+
+
+def ensure_search_index(engine):
+    """Create the search index in an existing database if it has none yet"""
+    with engine.begin() as connection:
+        if not inspect(connection).has_table(Ingredient.__tablename__):
+            return False
+        return create_search_index(connection)
+
+
+def _uses_index(term):
+    """Whether the trigram index can answer term: it needs 3 characters in a row between wildcards.
+
+    Shorter terms would scan anyway, and SQLite's trigram LIKE can miss matches for them when
+    they contain non-ASCII characters, so those keep the plain ilike query.
+    """
+    return max(len(part) for part in term.replace('_', '%').split('%')) >= 3
+
+
+def _index_query(include_item_number):
+    sql = "SELECT rowid FROM ingredient_fts WHERE name LIKE :pattern"
+    if include_item_number:
+        sql += " UNION SELECT rowid FROM ingredient_fts WHERE fing_item_number LIKE :pattern"
+    sql += """ UNION SELECT a.ingredient_id FROM ingredient_alias a JOIN ingredient i ON i.id = a.ingredient_id
+        WHERE a.id IN (SELECT rowid FROM ingredient_alias_fts WHERE alias LIKE :pattern)"""
+    return sql
+
+
+def matching_ingredients(term, include_item_number=False):
+    """Selectable of the ids of ingredients whose name (or item number) or an alias contains term.
+
+    Same matches as Ingredient.name.ilike('%term%') OR IngredientAlias.alias.ilike('%term%')
+    over the outer join, but answered from the trigram index when it exists.
+    """
+    pattern = f'%{term}%'
+    if _uses_index(term) and has_search_index(db.session.connection()):
+        # unique=True so several terms can be embedded in one statement
+        return text(_index_query(include_item_number)).\
+            bindparams(bindparam('pattern', pattern, unique=True)).columns(id=Integer)
+
+    conditions = [Ingredient.name.ilike(pattern), IngredientAlias.alias.ilike(pattern)]
+    if include_item_number:
+        conditions.append(Ingredient.fing_item_number.ilike(pattern))
+    return db.select(Ingredient.id).distinct().\
+        outerjoin(IngredientAlias, Ingredient.id == IngredientAlias.ingredient_id).\
+        filter(db.or_(*conditions))
+
+
+def ingredient_ids_matching(term, include_item_number=False):
+    return [row[0] for row in db.session.execute(matching_ingredients(term, include_item_number))]
+
+
+def drop_search_index(connection):
+    """Drop the index tables; their triggers go away with the tables they are defined on"""
+    connection.execute(text("DROP TABLE IF EXISTS ingredient_fts"))
+    connection.execute(text("DROP TABLE IF EXISTS ingredient_alias_fts"))
+    connection.info['search_index'] = False
+
+
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def normalize_term(term):
+    """Canonical form of a search term: terms with the same form match the same ingredients.
+
+    Only ASCII letters are folded, exactly like SQLite's LIKE and lower().
+    """
+    return term.translate(_ASCII_LOWER)
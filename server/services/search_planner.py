@@ -0,0 +1,295 @@
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import select
+
+from models.formula import db, Formula, FormulaProductionSite, ProductionSite
+from services.cache import LRUCache
+from services.production_sites import SITE_SEPARATOR
+from services.search_index import normalize_term
+from services.search_sql import includes_match_nothing
+from services.units import CANONICAL_UNITS, to_canonical
+
+# Formula ids bound per query when loading matches
+FETCH_CHUNK = 500
+
+# One ingredient filter: formulas with a line of an ingredient matching term, within the amount range.
+# With a unit (one of CANONICAL_UNITS), the range applies to the normalized amounts in that unit.
+IngredientFilter = namedtuple('IngredientFilter', ['term', 'min_amount', 'max_amount', 'unit'], defaults=(None,))
+
+# Exact-match and partial-match (case-insensitive) formula attribute filters, by request parameter
+EXACT_ATTRIBUTES = {
+    'brand': Formula.formula_brand,
+    'category': Formula.sbu_category,
+    'lifecycle_phase': Formula.lifecycle_phase,
+}
+PARTIAL_ATTRIBUTES = {
+    'formulation_name': Formula.formulation_name,
+}
+# Partial-match filters on rows linked to the formula through a link table: (link column of the
+# formula id, link column of the row id, matched column of the row, formula column joining the
+# matched values with SITE_SEPARATOR)
+LINKED_ATTRIBUTES = {
+    'production_site': (
+        FormulaProductionSite.formula_id, FormulaProductionSite.production_site_id, ProductionSite.name,
+        Formula.production_sites
+    ),
+}
+
+
+# LIKE wildcards; a value holding one can match across the names of a joined list
+LIKE_WILDCARDS = ('%', '_')
+
+
+def _within_one_name(value):
+    """Whether value can only match inside a single name of a joined list, so the link table answers it"""
+    return (SITE_SEPARATOR not in value and value == value.strip()
+            and not any(wildcard in value for wildcard in LIKE_WILDCARDS))
+
+
+class SearchQuery(namedtuple('SearchQuery', ['includes', 'excludes', 'attributes'])):
+    """Normalized filter tree of a search: AND of the includes, AND NOT of the excludes, AND of the attributes.
+
+    includes is a sorted tuple of distinct IngredientFilters, excludes a sorted tuple of distinct terms
+    and attributes a sorted tuple of (parameter, value). Terms and partial-match values are ASCII
+    case-folded like LIKE, so equal queries select the same formulas; a query is hashable and
+    serves as the canonical key of its results.
+    """
+
+    def conditions(self):
+        """SQL conditions of the attribute filters"""
+        conditions = []
+        for name, value in self.attributes:
+            if name in EXACT_ATTRIBUTES:
+                conditions.append(EXACT_ATTRIBUTES[name] == value)
+            elif name in LINKED_ATTRIBUTES and _within_one_name(value):
+                # The few matching rows of the small linked table, then the link index to the formulas
+                formula_id, row_id, column, _ = LINKED_ATTRIBUTES[name]
+                rows = select(column.table.c.id).where(column.ilike(f'%{value}%'))
+                conditions.append(Formula.id.in_(select(formula_id).where(row_id.in_(rows))))
+            elif name in LINKED_ATTRIBUTES:
+                # Values that can span a separator ('Berlin, Lev', 'n%L') match the joined text, as they always did
+                conditions.append(LINKED_ATTRIBUTES[name][3].ilike(f'%{value}%'))
+            else:
+                conditions.append(PARTIAL_ATTRIBUTES[name].ilike(f'%{value}%'))
+        return conditions
+
+
+def canonical_amount(value):
+    """An amount filter as the number it filters by, so '5' and '5.0' are the same filter.
+
+    Values that are not numbers are kept as they are; planning the query rejects them.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def canonical_range(min_amount, max_amount, unit):
+    """(min_amount, max_amount, unit) of a range with its bounds converted to the canonical unit of unit.
+
+    So 1-2 g and 1000-2000 mg are the same filter. A unit without a range filters nothing and is
+    dropped; an unknown unit, or bounds that are not numbers, are kept for planning to reject.
+    """
+    if not unit or (min_amount is None and max_amount is None):
+        return min_amount, max_amount, None
+    try:
+        converted = [None if value is None else to_canonical(float(value), unit) for value in (min_amount, max_amount)]
+    except (TypeError, ValueError):
+        return min_amount, max_amount, unit
+    canonical = next(conversion[1] for conversion in converted if conversion)
+    return (*[conversion and conversion[0] for conversion in converted], canonical)
+
+
+def _ingredient_params(args):
+    """(name, min_amount, max_amount, unit) of each ingredient filter parameter of a request"""
+    # ingredient1, min_amount1, max_amount1, unit1, ... or the legacy ingredient, min_amount, max_amount, unit
+    i = 1
+    while True:
+        name = args.get(f'ingredient{i}')
+        if not name:
+            if i == 1 and args.get('ingredient'):
+                yield args.get('ingredient'), args.get('min_amount'), args.get('max_amount'), args.get('unit')
+            break
+        yield name, args.get(f'min_amount{i}'), args.get(f'max_amount{i}'), args.get(f'unit{i}')
+        i += 1
+
+    # ingredientFilters[0][name], ingredientFilters[0][minAmount], ...
+    i = 0
+    while args.get(f'ingredientFilters[{i}][name]'):
+        yield (args.get(f'ingredientFilters[{i}][name]'),
+               args.get(f'ingredientFilters[{i}][minAmount]'),
+               args.get(f'ingredientFilters[{i}][maxAmount]'),
+               args.get(f'ingredientFilters[{i}][unit]'))
+        i += 1
+
+
+def _exclude_params(args):
+    i = 1
+    while args.get(f'exclude_ingredient{i}'):
+        yield args.get(f'exclude_ingredient{i}')
+        i += 1
+
+
+def parse_search(args):
+    """Parse the filter parameters of a search request into its SearchQuery"""
+    includes = {
+        IngredientFilter(normalize_term(name), *canonical_range(canonical_amount(min_amount), canonical_amount(max_amount), unit))
+        for name, min_amount, max_amount, unit in _ingredient_params(args)
+    }
+    excludes = {normalize_term(term) for term in _exclude_params(args)}
+    attributes = set()
+    for name in EXACT_ATTRIBUTES:
+        if args.get(name):
+            attributes.add((name, args.get(name)))
+    for name in [*PARTIAL_ATTRIBUTES, *LINKED_ATTRIBUTES]:
+        if args.get(name):
+            attributes.add((name, normalize_term(args.get(name))))
+    return SearchQuery(tuple(sorted(includes, key=repr)), tuple(sorted(excludes)), tuple(sorted(attributes)))
+
+
+def correct_search(query, resolve, correct):
+    """query with each ingredient term that matches no ingredient replaced by correct(term).
+
+    Returns (query, {term: correction}); terms correct() has no spelling for are kept as they are.
+    """
+    corrections = {}
+
+    def corrected(term):
+        if term not in corrections and not resolve(term):
+            correction = correct(term)
+            if correction and correction != term:
+                corrections[term] = correction
+        return corrections.get(term, term)
+
+    includes = {f._replace(term=corrected(f.term)) for f in query.includes}
+    excludes = {corrected(term) for term in query.excludes}
+    return SearchQuery(tuple(sorted(includes, key=repr)), tuple(sorted(excludes)), query.attributes), corrections
+
+
+def _amount(value):
+    if value is None:
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid amount '{value}'")
+
+
+def _unit(unit):
+    if unit is not None and unit not in CANONICAL_UNITS:
+        raise ValueError(f"Unknown unit '{unit}'")
+    return unit
+
+
+class SearchPlan:
+    """An optimized SearchQuery with its ingredient terms resolved to ingredient ids.
+
+    query is the optimized query (what the SQL backend compiles); includes holds the
+    (ingredient ids, min, max, unit) of each ingredient filter, most selective first, and
+    exclude_ids the ingredients no result may contain. When no_includes_match, the
+    ingredient filters alone rule out every formula; when contradictory, the excludes
+    rule out whatever the includes match.
+    """
+
+    def __init__(self, query, includes, exclude_ids, no_includes_match=False, contradictory=False):
+        self.query = query
+        self.includes = includes
+        self.exclude_ids = exclude_ids
+        self.no_includes_match = no_includes_match
+        self.contradictory = contradictory
+        self.includes_empty = None  # whether the ingredient filters alone match nothing, once known
+
+    def bitmap(self, index):
+        """Bitmap of the matching formulas over the formula index, or None if no_includes_match"""
+        if self.no_includes_match:
+            return None
+        matches = index.all()
+        for ingredient_ids, min_amount, max_amount, unit in self.includes:
+            matches &= index.containing(ingredient_ids, min_amount, max_amount, unit)
+            if not matches.any():
+                return None
+        if self.contradictory:
+            return index.from_ids([])
+        if self.exclude_ids:
+            matches &= ~index.containing(self.exclude_ids)
+        conditions = self.query.conditions()
+        if conditions:
+            matches &= index.from_ids(db.session.execute(select(Formula.id).where(*conditions)).scalars().all())
+        return matches
+
+    def includes_match_nothing(self, total_count):
+        """Whether a search whose filters matched total_count formulas failed on its ingredient filters alone.
+
+        When the ingredient filters are the only filters, the count says so; otherwise they
+        are counted on their own in SQL, once per plan.
+        """
+        if total_count or not self.query.includes:
+            return False
+        if self.includes_empty is None:
+            self.includes_empty = (not self.query.excludes and not self.query.attributes) or \
+                includes_match_nothing(self.query)
+        return self.includes_empty
+
+    def formula_ids(self, index):
+        """Sorted array of the ids of the matching formulas, or None if no_includes_match"""
+        matches = self.bitmap(index)
+        return None if matches is None else np.flatnonzero(matches)
+
+
+def load_formulas(formula_ids):
+    """Formulas with the given sorted ids, in id order, binding at most FETCH_CHUNK ids per query"""
+    formulas = []
+    for start in range(0, len(formula_ids), FETCH_CHUNK):
+        chunk = [int(formula_id) for formula_id in formula_ids[start:start + FETCH_CHUNK]]
+        formulas.extend(db.session.execute(
+            select(Formula).where(Formula.id.in_(chunk)).order_by(Formula.id)
+        ).scalars().all())
+    return formulas
+
+
+class SearchPlanner:
+    """Plans SearchQueries and memoizes the plans until the data changes"""
+
+    def __init__(self, maxsize, generation, resolve):
+        # resolve(term) -> ids of the ingredients matching term by name or alias
+        self.resolve = resolve
+        self.plans = LRUCache(maxsize, generation)
+
+    def plan(self, query):
+        return self.plans.get_or_set(query, lambda: self._plan(query))
+
+    def _plan(self, query):
+        includes = [
+            IngredientFilter(f.term, _amount(f.min_amount), _amount(f.max_amount), _unit(f.unit)) for f in query.includes
+        ]
+
+        # A filter with an amount range implies the same term without one
+        ranged_terms = {f.term for f in includes if f.min_amount is not None or f.max_amount is not None}
+        includes = [
+            f for f in includes
+            if f.min_amount is not None or f.max_amount is not None or f.term not in ranged_terms
+        ]
+        query = SearchQuery(tuple(includes), query.excludes, query.attributes)
+
+        resolved = []
+        for ingredient_filter in includes:
+            ingredient_ids = self.resolve(ingredient_filter.term)
+            empty_range = (ingredient_filter.min_amount is not None and ingredient_filter.max_amount is not None
+                           and ingredient_filter.min_amount > ingredient_filter.max_amount)
+            if not ingredient_ids or empty_range:
+                return SearchPlan(query, [], (), no_includes_match=True)
+            resolved.append((ingredient_ids, *ingredient_filter[1:]))
+        # Intersect the smallest sets first; the intersection is empty sooner
+        resolved.sort(key=lambda include: len(include[0]))
+
+        exclude_ids = set()
+        for term in query.excludes:
+            exclude_ids.update(self.resolve(term))
+
+        # Excluding a term that is also required leaves nothing
+        contradictory = bool(includes) and any(f.term in query.excludes for f in includes)
+        return SearchPlan(query, resolved, tuple(sorted(exclude_ids)), contradictory=contradictory)
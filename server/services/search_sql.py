@@ -0,0 +1,83 @@
+from sqlalchemy import func, intersect, select
+
+from models.formula import db, Formula, FormulaIngredient
+from services.search_index import matching_ingredients
+
+
+def _lines(term, min_amount=None, max_amount=None, unit=None):
+    """Formula ids with a line of an ingredient matching term, within the amount range (of normalized amounts in a unit)"""
+    statement = select(FormulaIngredient.formula_id).\
+        where(FormulaIngredient.ingredient_id.in_(matching_ingredients(term)))
+    amount = FormulaIngredient.amount
+    if unit is not None:
+        statement = statement.where(FormulaIngredient.normalized_unit == unit)
+        amount = FormulaIngredient.normalized_amount
+    if min_amount is not None:
+        statement = statement.where(amount >= min_amount)
+    if max_amount is not None:
+        statement = statement.where(amount <= max_amount)
+    return statement
+
+
+def _included_formula_ids(ingredient_filters):
+    """Compound SELECT (INTERSECT of one subquery per filter) of the formula ids passing all ingredient filters"""
+    includes = [_lines(f.term, f.min_amount, f.max_amount, f.unit) for f in ingredient_filters]
+    return includes[0] if len(includes) == 1 else intersect(*includes)
+
+
+def query_conditions(query):
+    """WHERE conditions on Formula for a SearchQuery: ingredient filters, exclusions and attributes"""
+    conditions = []
+    if query.includes:
+        conditions.append(Formula.id.in_(_included_formula_ids(query.includes)))
+    for term in query.excludes:
+        conditions.append(Formula.id.not_in(_lines(term)))
+    return conditions + query.conditions()
+
+
+def _filtered(statement, query):
+    return statement.where(*query_conditions(query))
+
+
+def search_page_statement(query, page, per_page):
+    """Formulas of one page in id order, each row carrying the total match count (count(*) OVER ())"""
+    statement = select(Formula, func.count().over().label('total'))
+    return _filtered(statement, query).\
+        order_by(Formula.id).limit(per_page).offset((page - 1) * per_page)
+
+
+def search_count_statement(query):
+    return _filtered(select(func.count(Formula.id)), query)
+
+
+def search_formulas_sql(query, page, per_page, with_total=True):
+    """Run a SearchQuery as a single statement; returns (formulas of the page, total count or None)"""
+    if not with_total:
+        statement = _filtered(select(Formula), query).\
+            order_by(Formula.id).limit(per_page).offset((page - 1) * per_page)
+        return db.session.execute(statement).scalars().all(), None
+
+    rows = db.session.execute(search_page_statement(query, page, per_page)).all()
+    if rows:
+        return [row[0] for row in rows], rows[0].total
+    if page == 1:
+        return [], 0
+    # Past the last page the window count has no row to ride on
+    return [], count_formulas_sql(query)
+
+
+def count_formulas_sql(query):
+    return db.session.execute(search_count_statement(query)).scalar()
+
+
+def search_formulas_sql_after(query, after_id, limit):
+    """Up to limit matching formulas with ids above after_id, in id order (keyset pagination, no count)"""
+    statement = _filtered(select(Formula), query).\
+        where(Formula.id > after_id).order_by(Formula.id).limit(limit)
+    return db.session.execute(statement).scalars().all()
+
+
+def includes_match_nothing(query):
+    """Whether the ingredient filters alone already rule out every formula"""
+    statement = _included_formula_ids(query.includes)
+    return db.session.execute(select(func.count()).select_from(statement.subquery())).scalar() == 0
@@ -0,0 +1,56 @@
+from collections import defaultdict
+
+from sqlalchemy import select
+
+from models.formula import db, FormulaIngredient, Ingredient
+
+# Formula fields of list and search results
+SUMMARY_FIELDS = ['id', 'object_number', 'formulation_name', 'lifecycle_phase', 'formula_brand', 'sbu_category']
+
+# Formula fields of the detail page and PDF
+DETAIL_FIELDS = SUMMARY_FIELDS + [
+    'dossier_type', 'regulatory_comments', 'general_comments', 'production_sites',
+    'predecessor_formulation_number', 'successor_formulation_number'
+]
+
+INGREDIENT_FIELDS = ['id', 'name', 'fing_item_number']
+DETAIL_INGREDIENT_FIELDS = INGREDIENT_FIELDS + ['description', 'description_expanded']
+
+
+def formula_lines(formula_ids, ingredient_fields=INGREDIENT_FIELDS):
+    """Ingredient lines of the formulas, by formula id, in line order, from one joined query"""
+    lines = defaultdict(list)
+    if not formula_ids:
+        return lines
+    statement = select(
+        FormulaIngredient.formula_id, FormulaIngredient.amount, FormulaIngredient.unit,
+        *[getattr(Ingredient, field) for field in ingredient_fields]
+    ).join(Ingredient, Ingredient.id == FormulaIngredient.ingredient_id).\
+        where(FormulaIngredient.formula_id.in_(formula_ids)).\
+        order_by(FormulaIngredient.formula_id, FormulaIngredient.id)
+    for row in db.session.execute(statement):
+        line = {field: getattr(row, field) for field in ingredient_fields}
+        line['amount'] = row.amount
+        line['unit'] = row.unit
+        lines[row.formula_id].append(line)
+    return lines
+
+
+def _serialize(formulas, fields, ingredient_fields):
+    lines = formula_lines([formula.id for formula in formulas], ingredient_fields)
+    result = []
+    for formula in formulas:
+        formula_data = {field: getattr(formula, field) for field in fields}
+        formula_data['ingredients'] = lines.get(formula.id, [])
+        result.append(formula_data)
+    return result
+
+
+def serialize_formulas(formulas):
+    """List/search representation of formulas; the ingredients of all of them take a single query"""
+    return _serialize(formulas, SUMMARY_FIELDS, INGREDIENT_FIELDS)
+
+
+def serialize_formula_detail(formula):
+    """Full representation of one formula, with ingredient descriptions"""
+    return _serialize([formula], DETAIL_FIELDS, DETAIL_INGREDIENT_FIELDS)[0]
@@ -0,0 +1,164 @@
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, exc, select
+from sqlalchemy.orm import Session
+
+from models.formula import db, Ingredient, IngredientAlias
+from services.importer import item_number_key
+from services.metadata import copy_metadata
+from services.search_index import create_search_index
+
+try:
+    import fcntl
+except ImportError:  # Windows: only serialize imports within the process
+    fcntl = None
+
+_import_lock = threading.Lock()
+_swap_lock = threading.Lock()
+
+
+def live_database_path():
+    """Absolute path of the SQLite file the app is serving"""
+    return os.path.abspath(db.engine.url.database)
+
+
+@contextmanager
+def _locked(thread_lock, suffix):
+    """Hold thread_lock and, where fcntl is available, a lock on the file next to the database with suffix"""
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(f'{live_database_path()}{suffix}', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def import_lock():
+    """Serialize imports across threads and, where fcntl is available, across worker processes"""
+    return _locked(_import_lock, '.lock')
+
+
+def swap_lock():
+    """Serialize alias writes with the end of a full import, which copies the aliases and swaps the file.
+
+    Held briefly by both, so an alias edit waits at most for a swap, never for a whole import.
+    """
+    return _locked(_swap_lock, '.swap.lock')
+
+
+def install_swap_detection(engine):
+    """Make pooled connections reconnect once the database file has been swapped.
+
+    Every connection remembers the inode of the file it opened. When a checkout finds
+    that the path now points at a different inode, the connection is discarded and the
+    pool opens a new one, so every worker process moves to the new snapshot on its own.
+    """
+    path = os.path.abspath(engine.url.database)
+
+    def inode():
+        try:
+            return os.stat(path).st_ino
+        except OSError:
+            return None
+
+    @event.listens_for(engine, 'connect')
+    def remember_inode(dbapi_connection, connection_record):
+        connection_record.info['inode'] = inode()
+
+    @event.listens_for(engine, 'checkout')
+    def check_inode(dbapi_connection, connection_record, connection_proxy):
+        if connection_record.info.get('inode') != inode():
+            raise exc.DisconnectionError('Database file was swapped')
+
+
+def copy_aliases(source, target):
+    """Copy aliases from the source session to matching ingredients (by item number, then name) in target.
+
+    Item numbers match in either form ('123' / '123.0', see item_number_key).
+    """
+    rows = source.execute(
+        select(IngredientAlias.alias, IngredientAlias.created_at, Ingredient.name, Ingredient.fing_item_number)
+        .join(Ingredient, Ingredient.id == IngredientAlias.ingredient_id)
+    ).all()
+    if not rows:
+        return 0
+
+    by_number = {}
+    by_name = {}
+    for ingredient_id, name, number in target.execute(
+            select(Ingredient.id, Ingredient.name, Ingredient.fing_item_number).order_by(Ingredient.id)):
+        by_number.setdefault(item_number_key(number), ingredient_id)
+        by_name.setdefault(name, ingredient_id)
+
+    records = []
+    seen = set()
+    for alias, created_at, name, number in rows:
+        ingredient_id = by_number.get(item_number_key(number)) or by_name.get(name)
+        if ingredient_id and (alias, ingredient_id) not in seen:
+            seen.add((alias, ingredient_id))
+            records.append({'alias': alias, 'ingredient_id': ingredient_id, 'created_at': created_at})
+
+    if records:
+        target.execute(IngredientAlias.__table__.insert(), records)
+    return len(records)
+
+
+def build_and_swap(populate, log=print, metadata=None):
+    """Build a complete replacement database with populate(session), then swap it in atomically.
+
+    Readers keep using the current file until the swap. Aliases and metadata of the current
+    database are carried over (aliases to matching ingredients), with the entries in metadata
+    overriding the old ones. Aliases are copied under swap_lock right before the swap, so alias
+    edits made during the build are kept. Returns (populate result, number of aliases copied).
+    """
+    with import_lock():
+        live_path = live_database_path()
+        shadow_path = f'{live_path}.shadow-{uuid.uuid4().hex}'
+        engine = create_engine(f'sqlite:///{shadow_path}')
+
+        @event.listens_for(engine, 'connect')
+        def fast_build(dbapi_connection, connection_record):
+            # The shadow file is thrown away on failure, so skip journaling while building it
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=OFF')
+            cursor.execute('PRAGMA synchronous=OFF')
+            cursor.close()
+
+        try:
+            db.metadata.create_all(engine)
+            with Session(engine) as session:
+                result = populate(session)
+                copy_metadata(db.session, session, metadata)
+                # Index the finished tables in one pass instead of through the triggers row by row
+                create_search_index(session.connection())
+                session.commit()
+
+            # No alias edit can land between the copy and the swap; the triggers index the copies
+            with swap_lock():
+                log("Carrying aliases over to the new database...")
+                with Session(engine) as session:
+                    aliases_copied = copy_aliases(db.session, session)
+                    session.commit()
+                engine.dispose()
+
+                # Make sure the new file is on disk before it replaces the live one
+                with open(shadow_path, 'rb') as f:
+                    os.fsync(f.fileno())
+
+                db.session.remove()
+                os.replace(shadow_path, live_path)
+                db.engine.dispose()
+            log(f"Swapped in new database ({aliases_copied} aliases carried over)")
+            return result, aliases_copied
+        except Exception:
+            engine.dispose()
+            if os.path.exists(shadow_path):
+                os.remove(shadow_path)
+            raise
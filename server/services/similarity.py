@@ -0,0 +1,114 @@
+import threading
+
+import numpy as np
+
+METRICS = ('cosine', 'jaccard')
+
+
+class CompositionMatrix:
+    """Sparse formula x ingredient matrix of composition weights, for ranking similar formulas.
+
+    An entry is the ingredient's share of the formula's total amount (equal shares when the
+    amounts add up to nothing), times the ingredient's inverse document frequency so that
+    ubiquitous ingredients like water count for less. Repeated lines of an ingredient add up.
+    The matrix is kept in CSR layout both ways: by formula, to read one formula's vector, and
+    by ingredient, to score every formula sharing an ingredient with it in one vectorized pass.
+    """
+
+    def __init__(self, index):
+        self.generation = index.generation
+        self.size = index.size
+        self.formulas = index.formulas
+        ingredient_count = len(index.indptr) - 1
+
+        # One entry per (formula, ingredient), sorted by formula then ingredient
+        keys, inverse = np.unique(
+            index.postings.astype(np.int64) * ingredient_count + index.row_ingredients,
+            return_inverse=True
+        )
+        amounts = np.bincount(inverse, weights=np.clip(np.nan_to_num(index.amounts), 0, None), minlength=len(keys))
+        formula_ids = keys // ingredient_count
+        ingredient_ids = keys % ingredient_count
+
+        totals = np.bincount(formula_ids, weights=amounts, minlength=self.size)[formula_ids]
+        counts = np.bincount(formula_ids, minlength=self.size)[formula_ids]
+        shares = np.where(totals > 0, amounts / np.where(totals > 0, totals, 1), 1 / np.maximum(counts, 1))
+        document_counts = np.bincount(ingredient_ids, minlength=ingredient_count)
+        idf = np.log((1 + self.formulas.sum()) / (1 + document_counts)) + 1
+        values = shares * idf[ingredient_ids]
+
+        self.row_indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(formula_ids, minlength=self.size), out=self.row_indptr[1:])
+        self.row_ingredients = ingredient_ids.astype(np.int32)
+        self.row_values = values
+
+        order = np.argsort(ingredient_ids, kind='stable')
+        self.col_indptr = np.zeros(ingredient_count + 1, dtype=np.int64)
+        np.cumsum(document_counts, out=self.col_indptr[1:])
+        self.col_formulas = formula_ids[order].astype(np.int32)
+        self.col_values = values[order]
+
+        self.norms = np.sqrt(np.bincount(formula_ids, weights=values ** 2, minlength=self.size))
+        self.sums = np.bincount(formula_ids, weights=values, minlength=self.size)
+
+    def similar(self, formula_id, metric='cosine', limit=10):
+        """[(formula id, score, shared ingredient count)] of the limit formulas most similar to formula_id.
+
+        cosine is the cosine of the angle between the weight vectors, jaccard the weighted
+        (Ruzicka) Jaccard index: the sum of the entrywise minimums over that of the maximums.
+        Best first; ties by id. Formulas sharing no weighted ingredient are never returned.
+        """
+        if not 0 <= formula_id < self.size:
+            return []
+        start, end = self.row_indptr[formula_id], self.row_indptr[formula_id + 1]
+        ingredients, weights = self.row_ingredients[start:end], self.row_values[start:end]
+        if not len(ingredients):
+            return []
+
+        # Concatenated postings of the formula's ingredients, each with the formula's own weight
+        starts, lengths = self.col_indptr[ingredients], self.col_indptr[ingredients + 1] - self.col_indptr[ingredients]
+        positions = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        candidates = self.col_formulas[positions]
+        values = self.col_values[positions]
+        own = np.repeat(weights, lengths)
+
+        if metric == 'cosine':
+            numerators = np.bincount(candidates, weights=values * own, minlength=self.size)
+            denominators = self.norms * np.sqrt(np.dot(weights, weights))
+        elif metric == 'jaccard':
+            numerators = np.bincount(candidates, weights=np.minimum(values, own), minlength=self.size)
+            denominators = self.sums + weights.sum() - numerators
+        else:
+            raise ValueError(f'Unknown similarity metric: {metric}')
+        scores = np.divide(numerators, denominators, out=np.zeros(self.size), where=denominators > 0)
+
+        scores[~self.formulas] = 0
+        scores[formula_id] = 0
+        matches = np.flatnonzero(scores > 0)
+        if len(matches) > limit:
+            # Everything scoring at least the limit-th best score, so ties at the cut go by id
+            threshold = np.partition(scores[matches], len(matches) - limit)[len(matches) - limit]
+            matches = matches[scores[matches] >= threshold]
+        matches = matches[np.lexsort((matches, -scores[matches]))][:limit]
+
+        shared = np.bincount(candidates, minlength=self.size)
+        return [(int(match), float(scores[match]), int(shared[match])) for match in matches]
+
+
+class CompositionMatrixHolder:
+    """Keeps the composition matrix of the formula index's generation, rebuilding it with the index"""
+
+    def __init__(self, formula_index):
+        self.formula_index = formula_index
+        self.matrix = None
+        self.lock = threading.Lock()
+
+    def current(self, session):
+        index = self.formula_index.current(session)
+        matrix = self.matrix
+        if matrix is not None and matrix.generation == index.generation:
+            return matrix
+        with self.lock:
+            if self.matrix is None or self.matrix.generation != index.generation:
+                self.matrix = CompositionMatrix(index)
+            return self.matrix
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Bump when the normalized frame layout changes so stale snapshots are ignored
+SNAPSHOT_VERSION = 3
+
+# Rows per frame when replaying a snapshot into the importer
+SNAPSHOT_CHUNK_SIZE = 50000
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of a file, read in 1MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_dir(folder, digest):
+    """Directory holding the snapshot of the workbook with the given digest"""
+    return os.path.join(folder, 'snapshots', f'{digest}-v{SNAPSHOT_VERSION}')
+
+
+def has_snapshot(directory):
+    return os.path.exists(os.path.join(directory, 'meta.json'))
+
+
+class SnapshotWriter:
+    """Collects normalized frames and writes them as a dictionary-encoded columnar snapshot.
+
+    Text columns are stored as int32 codes into a per-column dictionary of distinct
+    values, numeric (and boolean, as 0/1) columns as raw float64 arrays, one .npy file
+    per column so they can be memory-mapped on load.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.columns = None
+        self.numeric = {}  # column -> list of float arrays
+        self.codes = {}  # column -> list of int32 code arrays
+        self.dictionaries = {}  # column -> {value: code}
+        self.rows = 0
+        self.invalid_amounts = 0
+        self.rejected_rows = 0
+
+    def append(self, frame):
+        if self.columns is None:
+            self.columns = list(frame.columns)
+            for column in self.columns:
+                if pd.api.types.is_float_dtype(frame[column]) or pd.api.types.is_bool_dtype(frame[column]):
+                    self.numeric[column] = []
+                else:
+                    self.codes[column] = []
+                    self.dictionaries[column] = {}
+
+        for column, chunks in self.numeric.items():
+            chunks.append(frame[column].to_numpy(dtype=np.float64))
+
+        for column, chunks in self.codes.items():
+            # Factorize the chunk, then map its (few) distinct values onto the global dictionary
+            chunk_codes, uniques = pd.factorize(frame[column])
+            dictionary = self.dictionaries[column]
+            mapping = np.array([dictionary.setdefault(value, len(dictionary)) for value in uniques], dtype=np.int32)
+            chunks.append(mapping[chunk_codes] if len(mapping) else chunk_codes.astype(np.int32))
+
+        self.rows += len(frame)
+        self.invalid_amounts += frame.attrs.get('invalid_amounts', 0)
+        self.rejected_rows += frame.attrs.get('rejected_rows', 0)
+
+    def close(self):
+        """Write the snapshot atomically; an existing snapshot for the same key is kept"""
+        if self.columns is None or has_snapshot(self.directory):
+            return
+
+        parent = os.path.dirname(self.directory)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = f'{self.directory}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        for column, chunks in self.numeric.items():
+            np.save(os.path.join(tmp_dir, f'{column}.npy'), np.concatenate(chunks))
+        for column, chunks in self.codes.items():
+            np.save(os.path.join(tmp_dir, f'{column}.npy'), np.concatenate(chunks))
+
+        with open(os.path.join(tmp_dir, 'dictionaries.json'), 'w') as f:
+            json.dump({column: list(values) for column, values in self.dictionaries.items()}, f)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({
+                'version': SNAPSHOT_VERSION,
+                'rows': self.rows,
+                'columns': self.columns,
+                'numeric': list(self.numeric),
+                'invalid_amounts': self.invalid_amounts,
+                'rejected_rows': self.rejected_rows
+            }, f)
+
+        os.rename(tmp_dir, self.directory)
+
+        # Only the snapshot of the current workbook is worth keeping
+        for name in os.listdir(parent):
+            path = os.path.join(parent, name)
+            if path != self.directory and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def snapshot_row_count(directory):
+    """Rows of the sheet the snapshot was made from, rejected rows included"""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    return meta['rows'] + meta['rejected_rows']
+
+
+def iter_snapshot_chunks(directory, chunk_size=SNAPSHOT_CHUNK_SIZE):
+    """Yield the normalized frames stored in a snapshot, memory-mapping the column files"""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    with open(os.path.join(directory, 'dictionaries.json')) as f:
+        dictionaries = {column: np.array(values, dtype=object) for column, values in json.load(f).items()}
+
+    arrays = {
+        column: np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r')
+        for column in meta['columns']
+    }
+
+    for start in range(0, meta['rows'], chunk_size):
+        frame = pd.DataFrame({
+            column: (arrays[column][start:start + chunk_size] if column in meta['numeric']
+                     else dictionaries[column][arrays[column][start:start + chunk_size]])
+            for column in meta['columns']
+        })
+        # The invalid amount and rejected row counts cover the whole sheet, so report them once
+        frame.attrs['invalid_amounts'] = meta['invalid_amounts'] if start == 0 else 0
+        frame.attrs['rejected_rows'] = meta['rejected_rows'] if start == 0 else 0
+        yield frame
@@ -0,0 +1,92 @@
+import bisect
+from collections import defaultdict
+
+from services.ingredient_texts import IngredientTextIndex
+from services.search_index import normalize_term
+
+
+def _word_starts(text):
+    """Offsets in text of the words after the first (where a run of letters or digits begins)"""
+    return [i for i in range(1, len(text)) if text[i].isalnum() and not text[i - 1].isalnum()]
+
+
+class IngredientSuggestIndex(IngredientTextIndex):
+    """Autocomplete over ingredient names, item numbers and aliases.
+
+    Suggestions rank by where the typed text occurs: at the start of a text, at the start of a
+    later word, then anywhere inside it (from 3 characters); alphabetically within each. Whole
+    texts and the suffixes starting at each later word are kept in two sorted lists, so the first
+    two are a binary search and a scan of the matches; the last uses the trigram postings.
+    """
+
+    def __init__(self, generation):
+        super().__init__(generation)
+        # Sorted (text, key) of whole texts and sorted (suffix, key) of their later words
+        self.prefixes = ([], [])
+        # Ingredient id -> {alias id: alias}
+        self.aliases = defaultdict(dict)
+        self.pending = None
+
+    def _prefix_items(self, key, text):
+        yield 0, (text, key)
+        for start in _word_starts(text):
+            yield 1, (text[start:], key)
+
+    def _sync(self, rows):
+        # Collect the changes and merge them into the sorted lists in one pass each
+        self.pending = (([], []), (set(), set()))
+        super()._sync(rows)
+        (added, removed), self.pending = self.pending, None
+        self.prefixes = tuple(
+            sorted([item for item in items if item not in removed[i]] + added[i]) if added[i] or removed[i] else items
+            for i, items in enumerate(self.prefixes)
+        )
+
+    def _add(self, key, entry):
+        super()._add(key, entry)
+        for i, item in self._prefix_items(key, entry[0]):
+            self.pending[0][i].append(item)
+        if key[0] == 'alias':
+            self.aliases[entry[1]][key[1]] = entry[2]
+
+    def _remove(self, key, entry):
+        super()._remove(key, entry)
+        for i, item in self._prefix_items(key, entry[0]):
+            self.pending[1][i].add(item)
+        if key[0] == 'alias':
+            aliases = self.aliases[entry[1]]
+            aliases.pop(key[1], None)
+            if not aliases:
+                del self.aliases[entry[1]]
+
+    def suggest(self, term, limit):
+        """Up to limit ingredients matching term, best first, each with the text that matched"""
+        term = normalize_term(term.strip())
+        if not term:
+            return []
+        # Ingredient id -> the first (best) of its texts that matched
+        found = {}
+        with self.lock:
+            for items in self.prefixes:
+                i = bisect.bisect_left(items, (term,))
+                while i < len(items) and len(found) < limit and items[i][0].startswith(term):
+                    key = items[i][1]
+                    found.setdefault(self.entries[key][1], self.entries[key][2])
+                    i += 1
+            if len(found) < limit and len(term) >= 3:
+                for key in sorted(self._containing(term), key=lambda key: (self.entries[key][0], key)):
+                    found.setdefault(self.entries[key][1], self.entries[key][2])
+                    if len(found) == limit:
+                        break
+            return [self._suggestion(ingredient_id, match) for ingredient_id, match in found.items()]
+
+    def _suggestion(self, ingredient_id, match):
+        name = self.entries.get(('name', ingredient_id))
+        item_number = self.entries.get(('item', ingredient_id))
+        return {
+            'id': ingredient_id,
+            'name': name[2] if name else None,
+            'fing_item_number': item_number[2] if item_number else None,
+            'aliases': sorted(self.aliases.get(ingredient_id, {}).values()),
+            'match': match
+        }
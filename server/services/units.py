@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from services.search_index import normalize_term
+
+# Canonical unit and factor to it of each unit, keyed by unit_key(); amounts in other units
+# (IU, pieces, ...) and Q.S. quantities are not convertible
+UNIT_CONVERSIONS = {
+    'ng': ('mg', 0.000001),
+    'ug': ('mg', 0.001),
+    'µg': ('mg', 0.001),
+    'μg': ('mg', 0.001),
+    'mcg': ('mg', 0.001),
+    'mg': ('mg', 1.0),
+    'g': ('mg', 1000.0),
+    'kg': ('mg', 1000000.0),
+    'ul': ('ml', 0.001),
+    'µl': ('ml', 0.001),
+    'μl': ('ml', 0.001),
+    'ml': ('ml', 1.0),
+    'cl': ('ml', 10.0),
+    'dl': ('ml', 100.0),
+    'l': ('ml', 1000.0),
+    '%': ('%', 1.0),
+    '%w/w': ('%', 1.0),
+    'ppm': ('%', 0.0001),
+}
+
+CANONICAL_UNITS = ('mg', 'ml', '%')
+
+# Decimals normalized amounts are rounded to, so that e.g. 0.3 g and 300 mg compare equal
+NORMALIZED_DECIMALS = 9
+
+
+def unit_key(unit):
+    """Spelling-insensitive form of a unit: ASCII lower case without spaces or dots ('M G.' -> 'mg')"""
+    return normalize_term(unit).replace(' ', '').replace('.', '')
+
+
+def unit_conversion(unit):
+    """(canonical unit, factor) of a unit, or None if it is not convertible"""
+    return UNIT_CONVERSIONS.get(unit_key(unit)) if unit else None
+
+
+def normalize_amounts(amounts, units, parsed=None):
+    """normalized_amount, normalized_unit and amount_convertible columns of formula lines.
+
+    parsed marks the amounts that were numbers in the source; the others (Q.S., blank or
+    unreadable quantities stored as 0.0) are not convertible whatever their unit.
+    """
+    amounts = pd.Series(amounts, dtype=float).reset_index(drop=True)
+    units = pd.Series(units, dtype=object).reset_index(drop=True)
+    # Few distinct units per batch: look each up once
+    codes, uniques = pd.factorize(units.fillna(''))
+    conversions = [unit_conversion(unit) for unit in uniques]
+    canonical = np.array([conversion[0] if conversion else None for conversion in conversions] + [None], dtype=object)
+    factors = np.array([conversion[1] if conversion else np.nan for conversion in conversions] + [np.nan])
+
+    convertible = ~np.isnan(factors[codes])
+    if parsed is not None:
+        convertible &= np.asarray(parsed, dtype=bool)
+    normalized = np.round(np.where(convertible, amounts.to_numpy() * factors[codes], np.nan), NORMALIZED_DECIMALS)
+    return pd.DataFrame({
+        'normalized_amount': pd.Series(normalized).astype(object).where(convertible, None),
+        'normalized_unit': pd.Series(canonical[codes]).where(convertible, None),
+        'amount_convertible': convertible,
+    })
+
+
+def to_canonical(value, unit):
+    """(value in the canonical unit, canonical unit) of a value in unit; raises ValueError for other units"""
+    conversion = unit_conversion(unit)
+    if conversion is None:
+        raise ValueError(f"Unknown unit '{unit}'")
+    return round(value * conversion[1], NORMALIZED_DECIMALS), conversion[0]
+
+
+def normalize_amount(amount, unit, parsed=True):
+    """normalize_amounts() of a single line, as a dict"""
+    conversion = unit_conversion(unit) if parsed else None
+    return {
+        'normalized_amount': round(amount * conversion[1], NORMALIZED_DECIMALS) if conversion else None,
+        'normalized_unit': conversion[0] if conversion else None,
+        'amount_convertible': conversion is not None,
+    }
+
+
+def amount_parsed(amount, convertible=None):
+    """Whether a stored amount was a number in the source, given its amount_convertible flag if recorded.
+
+    Lines from before the flag (old exports and databases) cannot tell Q.S. and unreadable
+    quantities, stored as 0.0, from real amounts; their zero amounts count as not parsed.
+    """
+    if convertible is None:
+        return amount != 0
+    return bool(convertible)
+
+
+def backfill_normalized_amounts(connection):
+    """Fill the normalized columns of every line from its amount and unit, in SQL.
+
+    For databases that predate the columns, so no line has its flag yet: zero amounts are not
+    convertible, as in amount_parsed() (a rebuild from the workbook sets the flag exactly).
+    """
+    key = "lower(replace(replace(coalesce(unit, ''), ' ', ''), '.', ''))"
+    units = ' '.join(f"WHEN '{name}' THEN '{canonical}'" for name, (canonical, _) in UNIT_CONVERSIONS.items())
+    factors = ' '.join(f"WHEN '{name}' THEN {factor!r}" for name, (_, factor) in UNIT_CONVERSIONS.items())
+    connection.execute(text(f"""UPDATE formula_ingredient SET
+        normalized_unit = CASE WHEN amount <> 0 THEN CASE {key} {units} END END,
+        normalized_amount = CASE WHEN amount <> 0 THEN round(amount * CASE {key} {factors} END, {NORMALIZED_DECIMALS}) END"""))
+    connection.execute(text("UPDATE formula_ingredient SET amount_convertible = normalized_unit IS NOT NULL"))
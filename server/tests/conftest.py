@@ -0,0 +1,56 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+# The app keeps its database, uploads, backups and jobs under FIND_DATA_DIR; use a scratch directory
+DATA_DIR = tempfile.mkdtemp(prefix='find-tests-')
+os.environ['FIND_DATA_DIR'] = DATA_DIR
+
+import app as server  # noqa: E402
+from models.formula import db  # noqa: E402
+from services.search_index import drop_search_index, ensure_search_index  # noqa: E402
+
+from helpers import SAMPLE_ROWS, import_rows  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def app():
+    """The Flask app inside an application context, over an empty database"""
+    flask_app = server.app
+    with flask_app.app_context():
+        # Fresh connections: pooled ones remember whether their database had a search index
+        db.engine.dispose()
+        with db.engine.begin() as connection:
+            drop_search_index(connection)
+        db.drop_all()
+        db.create_all()
+        ensure_search_index(db.engine)
+        server.data_changed()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def session(app):
+    return db.session
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def sample(session):
+    """The SAMPLE_ROWS formulas imported into the database; returns the importer"""
+    return import_rows(session, SAMPLE_ROWS)
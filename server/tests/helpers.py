@@ -0,0 +1,112 @@
+"""Synaps sheets, imports and job polling shared by the tests"""
+import time
+
+import pandas as pd
+
+from services.importer import IMPORT_COLUMNS, SynapsImporter, normalize_synaps_frame
+
+
+def synaps_row(item, object_number, name=None, quantity=1.0, unit='mg', **columns):
+    """One row of a Synaps sheet; other sheet columns are given by name (FORMULA_BRAND='Alpha')"""
+    name = name or f'INGREDIENT {item}'
+    row = {
+        'FING_ITEM_NUMBER': item,
+        'FING_DESCRIPTION': name,
+        'Ingredient Description Expanded': f'{name.lower()} expanded',
+        'FING_QUANTITY': quantity,
+        'FING_UNIT': unit,
+        'OBJECT_NUMBER': object_number,
+        'LIFECYCLE_PHASE': 'Active',
+        'FORMULATION_NAME': f'Formula {object_number}',
+        'FORMULA_BRAND': 'Alpha',
+        'SBU_CATEGORY': 'Pain',
+        'DOSSIER_TYPE': 'NDA',
+        'REGULATORY_COMMENTS': None,
+        'GENERAL_COMMENTS': None,
+        'PRODUCTION_SITES_AVAILABLE': None,
+        'PREDECESSORFORMULATIONNUMBER': None,
+        'SUCCESSORFORMULATIONNUMBER': None,
+    }
+    row.update(columns)
+    return row
+
+
+def synaps_sheet(rows):
+    """A raw Synaps sheet, as read from a workbook, holding the given rows"""
+    return pd.DataFrame(rows, columns=IMPORT_COLUMNS)
+
+
+def write_workbook(path, rows):
+    path = str(path)
+    synaps_sheet(rows).to_excel(path, index=False)
+    return path
+
+
+# A handful of formulas covering amounts in several units, Q.S. lines, brands and production sites
+SAMPLE_ROWS = [
+    synaps_row('I-WATER', 'F001', 'WATER PURIFIED', 100, 'mg', FORMULA_BRAND='Alpha',
+               PRODUCTION_SITES_AVAILABLE='Berlin, Leverkusen'),
+    synaps_row('I-SALT', 'F001', 'SODIUM CHLORIDE', 5, 'mg', FORMULA_BRAND='Alpha',
+               PRODUCTION_SITES_AVAILABLE='Berlin, Leverkusen'),
+    synaps_row('I-WATER', 'F002', 'WATER PURIFIED', 2, 'g', FORMULA_BRAND='Beta',
+               PRODUCTION_SITES_AVAILABLE='Leverkusen'),
+    synaps_row('I-GLYC', 'F002', 'GLYCERIN', 1.5, 'g', FORMULA_BRAND='Beta',
+               PRODUCTION_SITES_AVAILABLE='Leverkusen'),
+    synaps_row('I-PARA', 'F003', 'PARACETAMOL', 500, 'mg', FORMULA_BRAND='Alpha',
+               PRODUCTION_SITES_AVAILABLE='Basel'),
+    synaps_row('I-WATER', 'F003', 'WATER PURIFIED', 'Q.S.', 'mg', FORMULA_BRAND='Alpha',
+               PRODUCTION_SITES_AVAILABLE='Basel'),
+    synaps_row('I-IBU', 'F004', 'IBUPROFEN', 200, 'mg', FORMULA_BRAND='Gamma', SBU_CATEGORY='Cold'),
+    synaps_row('I-TALC', 'F004', 'TALC', 10, 'mg', FORMULA_BRAND='Gamma', SBU_CATEGORY='Cold'),
+    synaps_row('I-SALT', 'F005', 'SODIUM CHLORIDE', 0.9, '%', FORMULA_BRAND='Beta',
+               PRODUCTION_SITES_AVAILABLE='Myerstown'),
+]
+
+
+def import_rows(session, rows):
+    """Import Synaps rows into the current database with SynapsImporter and commit; returns the importer"""
+    import app as server
+
+    importer = SynapsImporter(session, log=lambda message: None)
+    importer.ingest(normalize_synaps_frame(synaps_sheet(rows)))
+    session.commit()
+    server.data_changed()
+    return importer
+
+
+def wait_for_job(client, response, timeout=30):
+    """Poll the job a 202 response queued until it finishes; returns its final status"""
+    assert response.status_code == 202, response.get_json()
+    url = response.get_json()['status_url']
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(url).get_json()
+        if job['status'] in ('succeeded', 'failed'):
+            end_session()
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'job {url} did not finish')
+
+
+def search(client, **params):
+    """Object numbers of the formulas /api/formulas/search returns for the parameters"""
+    response = client.get('/api/formulas/search', query_string={'per_page': 100, **params})
+    assert response.status_code == 200, response.get_json()
+    return [formula['object_number'] for formula in response.get_json()['formulas']]
+
+
+def upload_workbook(client, path, mode='replace'):
+    """Upload a workbook through /api/upload-excel and wait for its import job; returns the job status"""
+    with open(path, 'rb') as workbook:
+        response = client.post('/api/upload-excel', data={'file': (workbook, 'upload.xlsx'), 'mode': mode})
+    return wait_for_job(client, response)
+
+
+def end_session():
+    """End the test's session, as the end of a request would, so it sees a swapped-in database.
+
+    Requests of the test client share the test's application context and with it its session.
+    """
+    from models.formula import db
+
+    db.session.remove()
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+import app as server
+from models.formula import Ingredient
+from services.cache import DataGeneration, LRUCache
+
+from helpers import search
+
+
+@pytest.fixture
+def generation(tmp_path):
+    return DataGeneration(str(tmp_path / 'generation' / 'data_generation'))
+
+
+def test_generation_is_shared_through_its_file(generation):
+    other = DataGeneration(generation.path)
+
+    assert generation.current() == other.current() == 0
+    assert generation.bump() == 1
+    assert other.bump() == 2
+    assert generation.current() == other.current() == 2
+
+
+def test_concurrent_bumps_are_not_lost(generation):
+    threads = [threading.Thread(target=lambda: [generation.bump() for _ in range(20)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert generation.current() == 80
+
+
+def test_lru_evicts_the_least_recently_used(generation):
+    cache = LRUCache(2, generation)
+    cache.get_or_set('a', lambda: 1)
+    cache.get_or_set('b', lambda: 2)
+    assert cache.get('a') == 1
+    cache.get_or_set('c', lambda: 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['size'] == 2
+
+
+def test_lru_drops_entries_of_older_generations(generation):
+    cache = LRUCache(10, generation)
+    cache.get_or_set('a', lambda: 1)
+    DataGeneration(generation.path).bump()
+
+    assert cache.get('a') is None
+    assert cache.get_or_set('a', lambda: 2) == 2
+
+
+def test_lru_skips_uncacheable_values_and_values_computed_across_a_change(generation):
+    cache = LRUCache(10, generation)
+    assert cache.get_or_set('empty', lambda: (), cacheable=bool) == ()
+    assert cache.get('empty') is None
+
+    def compute():
+        generation.bump()
+        return 'stale'
+
+    assert cache.get_or_set('a', compute) == 'stale'
+    assert cache.get('a') is None
+
+
+def test_term_resolution_follows_alias_changes(client, session, sample):
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+    assert search(client, ingredient='aqua') == []
+    assert server.resolve_ingredient_term('aqua') == ()
+
+    response = client.post(f'/api/ingredients/{water.id}/aliases', json={'alias': 'Aqua'})
+    assert response.status_code == 200
+    assert server.resolve_ingredient_term('AQUA') == (water.id,)
+    assert search(client, ingredient='aqua') == ['F001', 'F002', 'F003']
+
+    assert client.delete(f"/api/aliases/{response.get_json()['id']}").status_code == 200
+    assert search(client, ingredient='aqua') == []
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+import app as server
+import services.counts as counts
+from models.formula import Formula
+from services.counts import CountCache
+
+from helpers import import_rows, synaps_row
+
+
+@pytest.fixture
+def formulas(session):
+    """40 formulas, the first 10 of brand Alpha and the rest Beta"""
+    import_rows(session, [synaps_row('I-WATER', f'F{number:03d}', 'WATER', FORMULA_BRAND='Alpha' if number <= 10 else 'Beta')
+                          for number in range(1, 41)])
+
+
+def brand_count(brand):
+    return select(func.count(Formula.id)).where(Formula.formula_brand == brand)
+
+
+def wait_for_count(cache, key):
+    deadline = time.time() + 10
+    while cache.get(key) is None:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return cache.get(key)
+
+
+@pytest.fixture
+def cache(app):
+    cache = CountCache(app, 16, server.data_generation)
+    yield cache
+    cache.executor.shutdown(wait=True)
+
+
+def test_exact_counts_are_cached(cache, formulas, monkeypatch):
+    assert cache.total('alpha', brand_count('Alpha')) == (10, True)
+
+    monkeypatch.setattr(counts.db.session, 'execute', None)
+    assert cache.total('alpha', brand_count('Alpha')) == (10, True)
+    assert cache.total('alpha', brand_count('Alpha'), estimated=True) == (10, True)
+
+
+def test_counts_are_dropped_after_a_change(cache, session, formulas):
+    assert cache.total('alpha', brand_count('Alpha')) == (10, True)
+    session.add(Formula(object_number='F100', formulation_name='Formula F100', formula_brand='Alpha'))
+    session.commit()
+    server.data_changed()
+
+    assert cache.get('alpha') is None
+    assert cache.total('alpha', brand_count('Alpha')) == (11, True)
+
+
+def test_estimates_extrapolate_a_sample_and_refine_in_the_background(cache, formulas, monkeypatch):
+    monkeypatch.setattr(counts, 'ESTIMATE_SAMPLE_SIZE', 20)
+
+    # 10 of the first 20 formulas, times 40 / 20
+    assert cache.total('alpha', brand_count('Alpha'), estimated=True) == (20, False)
+    assert wait_for_count(cache, 'alpha') == 10
+    assert cache.total('alpha', brand_count('Alpha'), estimated=True) == (10, True)
+    # Estimates never go below the results known to exist
+    assert cache.total('beta', brand_count('Beta'), estimated=True, at_least=35) == (35, False)
+
+
+def test_small_tables_are_counted_exactly(cache, formulas):
+    assert cache.total('alpha', brand_count('Alpha'), estimated=True) == (10, True)
+
+
+@pytest.mark.parametrize('url, params', [
+    ('/api/formulas', {'brand': 'Alpha'}),
+    ('/api/formulas/search', {'brand': 'Alpha', 'ingredient': 'water', 'engine': 'sql'}),
+])
+def test_estimated_count_parameter(client, formulas, monkeypatch, url, params):
+    monkeypatch.setattr(counts, 'ESTIMATE_SAMPLE_SIZE', 20)
+    query = {**params, 'count': 'estimated', 'per_page': 5}
+
+    first = client.get(url, query_string=query).get_json()['pagination']
+    assert (first['total'], first['total_exact']) == (20, False)
+
+    deadline = time.time() + 10
+    while True:
+        pagination = client.get(url, query_string=query).get_json()['pagination']
+        if pagination['total_exact'] or time.time() > deadline:
+            break
+        time.sleep(0.01)
+    assert (pagination['total'], pagination['total_exact']) == (10, True)
@@ -0,0 +1,74 @@
+import pytest
+
+from services.cursor import decode_cursor, encode_cursor
+
+from helpers import import_rows, synaps_row
+
+
+@pytest.fixture
+def formulas(session):
+    """25 formulas of one brand and 5 of another"""
+    rows = [synaps_row('I-WATER', f'F{number:03d}', 'WATER',
+                      FORMULA_BRAND='Alpha' if number <= 25 else 'Beta')
+            for number in range(1, 31)]
+    import_rows(session, rows)
+
+
+def walk(client, url, **params):
+    """Object numbers of every page reached by following next_cursor, and the pagination of each page"""
+    numbers, pages, cursor = [], [], ''
+    while cursor is not None:
+        response = client.get(url, query_string={'per_page': 10, 'cursor': cursor, **params})
+        assert response.status_code == 200, response.get_json()
+        data = response.get_json()
+        numbers += [formula['object_number'] for formula in data['formulas']]
+        pages.append(data['pagination'])
+        cursor = data['pagination']['next_cursor']
+    return numbers, pages
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42)) == 42
+    assert decode_cursor('') == 0
+    assert '=' not in encode_cursor(1)
+
+
+@pytest.mark.parametrize('cursor', ['x', encode_cursor(1)[:-2], 'eyJhZnRlciI6dHJ1ZX0', 'eyJhZnRlciI6IjEifQ'])
+def test_invalid_cursors(client, cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+    response = client.get('/api/formulas', query_string={'cursor': cursor})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+
+def test_cursor_pages_cover_every_formula_once(client, formulas):
+    numbers, pages = walk(client, '/api/formulas')
+
+    assert numbers == [f'F{number:03d}' for number in range(1, 31)]
+    # Only the first page is counted
+    assert [page['total'] for page in pages] == [30, None, None]
+    assert [page['has_next'] for page in pages] == [True, True, False]
+
+
+def test_cursor_pages_keep_filters(client, formulas):
+    numbers, pages = walk(client, '/api/formulas', brand='Beta')
+
+    assert numbers == [f'F{number:03d}' for number in range(26, 31)]
+    assert pages[0]['total'] == 5
+
+
+def test_last_page_by_offset_matches_cursor_pages(client, formulas):
+    numbers, _ = walk(client, '/api/formulas', brand='Alpha')
+    data = client.get('/api/formulas', query_string={'per_page': 10, 'page': 3, 'brand': 'Alpha'}).get_json()
+
+    assert data['pagination']['pages'] == 3
+    assert data['pagination']['total'] == 25
+    assert [formula['object_number'] for formula in data['formulas']] == numbers[20:]
+
+
+def test_search_cursor_pages(client, formulas):
+    numbers, pages = walk(client, '/api/formulas/search', brand='Alpha', ingredients='WATER')
+
+    assert numbers == [f'F{number:03d}' for number in range(1, 26)]
+    assert pages[0]['total'] == 25
@@ -0,0 +1,103 @@
+from models.formula import Formula, FormulaIngredient, Ingredient, IngredientAlias
+from services.importer import DeltaImporter, normalize_synaps_frame
+
+from helpers import SAMPLE_ROWS, import_rows, synaps_row, synaps_sheet, upload_workbook, write_workbook
+
+
+def apply_delta(session, rows):
+    importer = DeltaImporter(session, log=lambda message: None)
+    importer.ingest(normalize_synaps_frame(synaps_sheet(rows)))
+    importer.apply()
+    session.commit()
+    return importer
+
+
+def line_ids(session, object_number):
+    formula = session.query(Formula).filter_by(object_number=object_number).one()
+    return sorted(line.id for line in formula.ingredients)
+
+
+def all_lines(session):
+    """Every formula line as comparable tuples"""
+    return sorted(
+        session.query(Formula.object_number, Ingredient.fing_item_number, FormulaIngredient.amount, FormulaIngredient.unit)
+        .join(FormulaIngredient, FormulaIngredient.formula_id == Formula.id)
+        .join(Ingredient, Ingredient.id == FormulaIngredient.ingredient_id)
+        .all()
+    )
+
+
+def test_same_data_writes_nothing(session, sample):
+    before = all_lines(session)
+    importer = apply_delta(session, SAMPLE_ROWS)
+
+    assert all_lines(session) == before
+    assert {key: value for key, value in importer.counts.items() if value and key != 'formula_ingredients_total'} == {}
+
+
+def test_changes_touch_only_changed_rows(session, sample):
+    kept = line_ids(session, 'F002')
+    formula_ids = dict(session.query(Formula.object_number, Formula.id))
+    rows = [row for row in SAMPLE_ROWS if row['OBJECT_NUMBER'] != 'F005']
+    rows = [dict(row, FING_QUANTITY=250.0) if (row['OBJECT_NUMBER'], row['FING_ITEM_NUMBER']) == ('F001', 'I-WATER') else row
+            for row in rows]
+    rows = [dict(row, FORMULA_BRAND='Delta') if row['OBJECT_NUMBER'] == 'F003' else row for row in rows]
+    rows.append(synaps_row('I-NEW', 'F006', 'NEW'))
+
+    counts = apply_delta(session, rows).counts
+
+    assert counts['formulas_added'] == 1
+    assert counts['formulas_updated'] == 1
+    assert counts['formulas_deleted'] == 1
+    # F001's water changed, F005 lost its lines and F006 gained some
+    assert counts['formulas_rewritten'] == 3
+    assert line_ids(session, 'F002') == kept
+    assert dict(session.query(Formula.object_number, Formula.id).filter(Formula.object_number != 'F006')) == \
+        {number: formula_id for number, formula_id in formula_ids.items() if number != 'F005'}
+    assert session.query(Formula).filter_by(object_number='F003').one().formula_brand == 'Delta'
+    assert ('F001', 'I-WATER', 250.0, 'mg') in all_lines(session)
+
+
+def test_repeated_lines_are_compared_as_multisets(session):
+    rows = [synaps_row('I-A', 'F1'), synaps_row('I-A', 'F1'), synaps_row('I-B', 'F2')]
+    import_rows(session, rows)
+
+    assert apply_delta(session, rows).counts['formulas_rewritten'] == 0
+
+    counts = apply_delta(session, rows[1:]).counts
+    assert counts['formulas_rewritten'] == 1
+    assert all_lines(session) == [('F1', 'I-A', 1.0, 'mg'), ('F2', 'I-B', 1.0, 'mg')]
+
+
+def test_removed_ingredients_are_deleted_with_their_aliases(session, sample):
+    talc = session.query(Ingredient).filter_by(fing_item_number='I-TALC').one()
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+    session.add_all([IngredientAlias(alias='talcum', ingredient_id=talc.id),
+                     IngredientAlias(alias='aqua', ingredient_id=water.id)])
+    session.commit()
+
+    counts = apply_delta(session, [row for row in SAMPLE_ROWS if row['FING_ITEM_NUMBER'] != 'I-TALC']).counts
+
+    assert counts['ingredients_deleted'] == 1
+    assert [alias.alias for alias in session.query(IngredientAlias)] == ['aqua']
+
+
+def test_rejected_rows_count_as_errors(session, sample):
+    importer = apply_delta(session, SAMPLE_ROWS + [synaps_row(None, 'F001')])
+
+    assert importer.errors == 1
+    assert importer.stats()['errors'] == 1
+
+
+def test_delta_upload_keeps_aliases(client, session, sample, tmp_path):
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+    session.add(IngredientAlias(alias='aqua', ingredient_id=water.id))
+    session.commit()
+    path = write_workbook(tmp_path / 'delta.xlsx', SAMPLE_ROWS + [synaps_row('I-NEW', 'F001')])
+
+    job = upload_workbook(client, path, mode='delta')
+
+    assert job['status'] == 'succeeded', job['error']
+    assert job['result']['delta']['formulas_rewritten'] == 1
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+    assert [alias.alias for alias in water.aliases] == ['aqua']
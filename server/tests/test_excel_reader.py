@@ -0,0 +1,106 @@
+import math
+
+import pandas as pd
+import pytest
+
+from models.formula import Ingredient, IngredientAlias
+from services.excel_reader import count_excel_rows, iter_excel_chunks, read_excel_header
+from services.importer import IMPORT_COLUMNS, DeltaImporter, item_number_key, normalize_synaps_frame
+
+from helpers import import_rows, synaps_row, synaps_sheet, upload_workbook, write_workbook
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    rows = [
+        synaps_row(10107, 'F1', quantity=12.5, FORMULA_BRAND='NA'),
+        synaps_row(None, 'F1', quantity='Q.S.'),
+        synaps_row(10024, 'F2', quantity=3, FORMULA_BRAND='Beta'),
+        synaps_row('A-7', 'F2', quantity=None),
+    ]
+    path = write_workbook(tmp_path / 'sheet.xlsx', rows)
+    # A blank row in the middle is kept, trailing blank rows are dropped
+    sheet = pd.read_excel(path, dtype=object)
+    sheet = pd.concat([sheet.iloc[:2], pd.DataFrame([{}]), sheet.iloc[2:], pd.DataFrame([{}, {}])], ignore_index=True)
+    sheet.to_excel(path, index=False)
+    return path
+
+
+def test_header_and_row_count(workbook):
+    assert read_excel_header(workbook) == IMPORT_COLUMNS
+    # From the sheet dimensions, which count the trailing blank rows too (a progress estimate)
+    assert count_excel_rows(workbook) == 7
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 1000])
+def test_chunks_match_read_excel_with_object_dtype(workbook, chunk_size):
+    chunks = list(iter_excel_chunks(workbook, IMPORT_COLUMNS, chunk_size=chunk_size))
+    streamed = pd.concat(chunks, ignore_index=True)
+    expected = pd.read_excel(workbook, dtype=object)[IMPORT_COLUMNS]
+
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+    assert streamed.shape == expected.shape == (5, len(IMPORT_COLUMNS))
+    for column in IMPORT_COLUMNS:
+        assert [str(value) for value in streamed[column]] == [str(value) for value in expected[column]], column
+
+
+def test_integer_codes_in_columns_with_blanks(workbook):
+    frame = normalize_synaps_frame(pd.concat(iter_excel_chunks(workbook, IMPORT_COLUMNS), ignore_index=True))
+
+    # pd.read_excel without dtype=object would give '10107.0': the column has a blank cell
+    assert list(frame['fing_item_number']) == ['10107', '10024', 'A-7']
+    assert math.isnan(pd.read_excel(workbook)['FING_ITEM_NUMBER'][1])
+    # Default NA strings are missing values, as with pd.read_excel
+    assert frame['formula_brand'][0] == 'nan'
+    assert frame.attrs['rejected_rows'] == 2
+
+
+def test_only_requested_columns(workbook):
+    chunk = next(iter_excel_chunks(workbook, ['OBJECT_NUMBER', 'NOT_A_COLUMN']))
+    assert list(chunk.columns) == ['OBJECT_NUMBER']
+
+
+def test_item_number_key():
+    assert item_number_key('123.0') == item_number_key('123') == '123'
+    assert item_number_key('123.5') == '123.5'
+    assert item_number_key('A-1.0') == 'A-1.0'
+
+
+def add_alias(session, number, alias):
+    ingredient = session.query(Ingredient).filter_by(fing_item_number=number).one()
+    session.add(IngredientAlias(alias=alias, ingredient_id=ingredient.id))
+    session.commit()
+    return ingredient.id
+
+
+def test_delta_keeps_ingredients_stored_with_old_codes(session):
+    # A database an older version loaded from a column with blanks
+    import_rows(session, [synaps_row('123.0', 'F1', 'WATER'), synaps_row('456.0', 'F1', 'SALT')])
+    water_id = add_alias(session, '123.0', 'aqua')
+
+    importer = DeltaImporter(session, log=lambda message: None)
+    importer.ingest(normalize_synaps_frame(synaps_sheet([synaps_row(123, 'F1', 'WATER'), synaps_row('789', 'F1', 'SUGAR')])))
+    counts = importer.apply()
+    session.commit()
+
+    water = session.get(Ingredient, water_id)
+    assert water.fing_item_number == '123'
+    assert [alias.alias for alias in water.aliases] == ['aqua']
+    assert counts['ingredients_renumbered'] == 1
+    assert counts['ingredients_added'] == 1
+    assert counts['ingredients_deleted'] == 1
+    assert sorted(number for (number,) in session.query(Ingredient.fing_item_number)) == ['123', '789']
+
+
+def test_full_import_carries_aliases_over_old_codes(client, session, tmp_path):
+    import_rows(session, [synaps_row('123.0', 'F1', 'WATER')])
+    add_alias(session, '123.0', 'aqua')
+
+    # Renamed as well, so only the item number can match it
+    path = write_workbook(tmp_path / 'new.xlsx', [synaps_row(123, 'F1', 'PURIFIED WATER'), synaps_row(None, 'F2')])
+    job = upload_workbook(client, path)
+
+    assert job['status'] == 'succeeded', job
+    assert job['result']['aliases_restored'] == 1
+    ingredient = session.query(Ingredient).one()
+    assert (ingredient.fing_item_number, [alias.alias for alias in ingredient.aliases]) == ('123', ['aqua'])
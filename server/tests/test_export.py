@@ -0,0 +1,79 @@
+import gzip
+import json
+
+import services.exporter as exporter
+from models.formula import Formula, Ingredient
+from services.exporter import FORMULA_COLUMNS, INGREDIENT_COLUMNS, LINE_COLUMNS, gzip_chunks, iter_database_json
+
+
+def expected_document(session):
+    """The export built from the ORM objects, one formula at a time"""
+    return {
+        'ingredients': [{column: getattr(ingredient, column) for column in INGREDIENT_COLUMNS}
+                        for ingredient in session.query(Ingredient).order_by(Ingredient.id)],
+        'formulas': [
+            {**{column: getattr(formula, column) for column in FORMULA_COLUMNS},
+             'ingredients': [{column: getattr(line, column) for column in LINE_COLUMNS} for line in formula.ingredients]}
+            for formula in session.query(Formula).order_by(Formula.id)
+        ],
+    }
+
+
+def export(client, **kwargs):
+    """(response, body) of an export; the streamed response is closed, which ends its request context"""
+    response = client.get('/api/export-database', **kwargs)
+    body = response.get_data()
+    response.close()
+    return response, body
+
+
+def test_json_export_matches_the_database(client, session, sample):
+    response, body = export(client)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    assert json.loads(body) == expected_document(session)
+
+
+def test_export_is_sent_in_chunks(session, sample, monkeypatch):
+    monkeypatch.setattr(exporter, 'FLUSH_SIZE', 100)
+    monkeypatch.setattr(exporter, 'FETCH_SIZE', 2)
+
+    chunks = list(iter_database_json(session))
+
+    assert len(chunks) > 3
+    assert json.loads(b''.join(chunks)) == expected_document(session)
+
+
+def test_ndjson_export(client, session, sample):
+    response, body = export(client, query_string={'format': 'ndjson'})
+    records = [json.loads(line) for line in body.splitlines()]
+    document = expected_document(session)
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert [record.pop('type') for record in records] == ['ingredient'] * 6 + ['formula'] * 5
+    assert records == document['ingredients'] + document['formulas']
+
+
+def test_gzip_export(client, session, sample):
+    encoded, encoded_body = export(client, query_string={'gzip': '1'}, headers={'Accept-Encoding': 'gzip'})
+    download, download_body = export(client, query_string={'gzip': 'true'})
+
+    assert encoded.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(encoded_body)) == expected_document(session)
+    assert download.mimetype == 'application/gzip'
+    assert 'database.json.gz' in download.headers['Content-Disposition']
+    assert json.loads(gzip.decompress(download_body)) == expected_document(session)
+
+
+def test_gzip_chunks_round_trip():
+    chunks = [b'first ', b'', b'second']
+
+    assert gzip.decompress(b''.join(gzip_chunks(iter(chunks)))) == b'first second'
+
+
+def test_invalid_export_format(client):
+    response = client.get('/api/export-database', query_string={'format': 'xml'})
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid export format: xml'}
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+import services.formula_index as formula_index
+from services.cache import DataGeneration
+from services.formula_index import FormulaIndex, FormulaIndexHolder
+
+from helpers import import_rows, search, synaps_row
+
+
+def index_of(lines, formula_ids=None):
+    """FormulaIndex over (ingredient_id, formula_id, amount) lines"""
+    lines = np.array(lines, dtype=np.float64).reshape(-1, 3)
+    if formula_ids is None:
+        formula_ids = np.unique(lines[:, 1])
+    return FormulaIndex(0, np.asarray(formula_ids, dtype=np.int32), lines[:, 0].astype(np.int32),
+                        lines[:, 1].astype(np.int32), lines[:, 2])
+
+
+def ids(bitmap):
+    return np.flatnonzero(bitmap).tolist()
+
+
+def test_containing_any_of_the_ingredients():
+    index = index_of([(1, 10, 5), (1, 11, 7), (2, 11, 1), (3, 12, 1)])
+
+    assert ids(index.containing([1])) == [10, 11]
+    assert ids(index.containing([2, 3])) == [11, 12]
+    assert ids(index.containing([])) == []
+    # Unknown ingredients match nothing
+    assert ids(index.containing([-1, 99])) == []
+
+
+def test_bitmaps_combine_with_and_not():
+    index = index_of([(1, 10, 5), (1, 11, 7), (2, 11, 1), (3, 12, 1), (1, 12, 2)])
+
+    assert ids(index.containing([1]) & index.containing([3])) == [12]
+    assert ids(index.containing([1]) & ~index.containing([2])) == [10, 12]
+    assert ids(index.all() & ~index.containing([1])) == []
+
+
+def test_deleted_formulas_are_left_out_of_all():
+    index = index_of([(1, 10, 5), (1, 11, 7)], formula_ids=[10])
+
+    assert ids(index.all()) == [10]
+    assert ids(index.from_ids([10, 11, 1000])) == [10, 11]
+
+
+def test_holder_rebuilds_after_a_change(session, tmp_path):
+    generation = DataGeneration(str(tmp_path / 'data_generation'))
+    holder = FormulaIndexHolder(generation)
+    import_rows(session, [synaps_row('I1', 'F1')])
+    first = holder.current(session)
+
+    assert holder.current(session) is first
+    import_rows(session, [synaps_row('I2', 'F2')])
+    generation.bump()
+    assert holder.current(session) is not first
+    assert len(ids(holder.current(session).all())) == 2
+
+
+@pytest.mark.parametrize('params, expected', [
+    ({'ingredient1': 'water', 'ingredient2': 'chloride'}, ['F001']),
+    ({'ingredient1': 'water', 'exclude_ingredient1': 'chloride'}, ['F002', 'F003']),
+    ({'exclude_ingredient1': 'water'}, ['F004', 'F005']),
+    ({'ingredient1': 'water', 'exclude_ingredient1': 'water'}, []),
+    ({'ingredient1': 'nothing like it'}, []),
+])
+def test_bitmap_search_matches_sql(client, sample, params, expected):
+    assert search(client, engine='bitmap', **params) == expected
+    assert search(client, engine='sql', **params) == expected
+
+
+@pytest.mark.parametrize('slice_limit', [0, 64])
+def test_amount_ranges_match_a_scan(monkeypatch, slice_limit):
+    monkeypatch.setattr(formula_index, 'SLICE_LIMIT', slice_limit)
+    random = np.random.default_rng(7)
+    lines = np.column_stack([random.integers(0, 20, 2000), random.integers(0, 300, 2000), random.integers(0, 50, 2000)])
+    lines = lines.astype(np.float64)
+    lines[::17, 2] = np.nan
+    index = index_of(lines)
+
+    for ingredient_ids, low, high in [([3], 10, 20), ([3, 4, 5], None, 7), ([0], 49, None), (range(20), 12.5, 12.5),
+                                      ([8], 30, 10)]:
+        in_range = np.isin(lines[:, 0], list(ingredient_ids))
+        if low is not None:
+            in_range &= lines[:, 2] >= low
+        if high is not None:
+            in_range &= lines[:, 2] <= high
+        expected = sorted(set(lines[in_range, 1].astype(int).tolist()))
+        assert ids(index.containing(ingredient_ids, low, high)) == expected
+
+
+def test_null_amounts_only_match_without_a_range():
+    index = index_of([(1, 10, np.nan), (1, 11, 0)])
+
+    assert ids(index.containing([1])) == [10, 11]
+    assert ids(index.containing([1], min_amount=0)) == [11]
+    assert ids(index.containing([1], max_amount=1e9)) == [11]
+
+
+@pytest.mark.parametrize('engine', ['bitmap', 'sql'])
+def test_amount_range_search(client, sample, engine):
+    assert search(client, ingredient='water', min_amount=100, max_amount=100, engine=engine) == ['F001']
+    assert search(client, ingredient='water', max_amount=2, engine=engine) == ['F002', 'F003']
+    assert search(client, ingredient1='water', min_amount1=50, ingredient2='chloride', max_amount2=5,
+                  engine=engine) == ['F001']
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+import app as server
+from models.formula import Ingredient, IngredientAlias
+from services.fuzzy_match import FuzzyIngredientIndex, edit_distance, max_distance
+
+from helpers import search
+
+
+def substring_distance(pattern, text, anchored=False):
+    """Textbook dynamic programming version of edit_distance's distance"""
+    previous = list(range(len(pattern) + 1))
+    best = previous[-1]
+    for j, char in enumerate(text, start=1):
+        current = [j if anchored else 0]
+        for i, pattern_char in enumerate(pattern, start=1):
+            current.append(min(previous[i] + 1, current[i - 1] + 1, previous[i - 1] + (pattern_char != char)))
+        previous = current
+        best = min(best, current[-1])
+    return best
+
+
+@pytest.mark.parametrize('anchored', [False, True])
+def test_edit_distance_matches_dynamic_programming(anchored):
+    generator = random.Random(5)
+    for _ in range(500):
+        pattern = ''.join(generator.choice('abc ') for _ in range(generator.randint(1, 12)))
+        text = ''.join(generator.choice('abcd ') for _ in range(generator.randint(0, 20)))
+        assert edit_distance(pattern, text, anchored)[0] == substring_distance(pattern, text, anchored), (pattern, text)
+
+
+def test_edit_distance_examples():
+    assert edit_distance('paracetamole', 'paracetamol 500 mg')[0] == 1
+    assert edit_distance('acd', 'ascorbic acid') == (1, 11)
+    assert edit_distance('', 'anything') == (0, 0)
+    assert [max_distance(length) for length in (3, 4, 5, 8, 9)] == [1, 1, 2, 2, 3]
+
+
+@pytest.fixture
+def index(session, sample):
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+    session.add(IngredientAlias(alias='Aqua purificata', ingredient_id=water.id))
+    session.commit()
+    server.data_changed()
+    return FuzzyIngredientIndex(server.data_generation).current(session)
+
+
+def ingredient_id(session, number):
+    return session.query(Ingredient).filter_by(fing_item_number=number).one().id
+
+
+def test_search_ranks_the_closest_ingredients(session, index):
+    assert index.search('paracetamole', 5) == [(ingredient_id(session, 'I-PARA'), 1)]
+    assert index.search('aqua purifcata', 5) == [(ingredient_id(session, 'I-WATER'), 1)]
+    assert index.search('I-WATR', 5, kinds=('item',)) == [(ingredient_id(session, 'I-WATER'), 1)]
+    assert index.search('glycrin', 5)[0] == (ingredient_id(session, 'I-GLYC'), 1)
+    assert index.search('zz', 5) == []
+    assert index.search('nothing close', 5) == []
+
+
+def test_correct_returns_whole_words(index):
+    assert index.correct('sodim') == 'sodium'
+    assert index.correct('sodium chlorid') == 'sodium chloride'
+    assert index.correct('purifcata') == 'purificata'
+    assert index.correct('xylophone') is None
+
+
+def test_index_follows_alias_changes(session, index):
+    talc = ingredient_id(session, 'I-TALC')
+    session.add(IngredientAlias(alias='Magnesium silicate', ingredient_id=talc))
+    session.commit()
+    server.data_changed()
+
+    assert index.current(session).search('magnesium silicta', 5) == [(talc, 1)]
+
+    session.query(IngredientAlias).filter_by(alias='Magnesium silicate').delete()
+    session.commit()
+    server.data_changed()
+    assert index.current(session).search('magnesium silicta', 5) == []
+
+
+def test_fuzzy_search_reports_corrections(client, index):
+    response = client.get('/api/formulas/search', query_string={'ingredient': 'paracetamole', 'fuzzy': '1'})
+
+    assert response.get_json()['corrections'] == {'paracetamole': 'paracetamol'}
+    assert [formula['object_number'] for formula in response.get_json()['formulas']] == ['F003']
+    assert search(client, ingredient='paracetamole') == []
+    # Terms that match as they are stay as they are
+    assert 'corrections' not in client.get('/api/formulas/search', query_string={'ingredient': 'water', 'fuzzy': '1'}).get_json()
+
+
+def test_fuzzy_ingredient_listing(client, index):
+    data = client.get('/api/ingredients', query_string={'search': 'ibuprofn', 'fuzzy': '1'}).get_json()
+
+    assert [(ingredient['name'], ingredient['distance']) for ingredient in data['ingredients']] == [('IBUPROFEN', 1)]
+    assert data['pagination']['total'] == 1
@@ -0,0 +1,79 @@
+import math
+
+import pandas as pd
+
+from models.formula import Formula, FormulaIngredient, Ingredient
+from services.importer import SynapsImporter, normalize_synaps_frame
+
+from helpers import SAMPLE_ROWS, import_rows, synaps_row, synaps_sheet
+
+
+def test_normalize_types_and_amounts():
+    frame = normalize_synaps_frame(synaps_sheet([
+        synaps_row(10107, 'F1', quantity='12.5'),
+        synaps_row('I2', 'F1', quantity='Q.S.'),
+        synaps_row('I3', 'F1', quantity='abc', unit=None),
+    ]))
+
+    assert list(frame['fing_item_number']) == ['10107', 'I2', 'I3']
+    assert list(frame['amount']) == [12.5, 0.0, 0.0]
+    assert list(frame['amount_parsed']) == [True, False, False]
+    assert list(frame['unit']) == ['mg', 'mg', '']
+    # Q.S. is expected; only the unparseable amount is invalid
+    assert frame.attrs['invalid_amounts'] == 1
+    assert frame.attrs['rejected_rows'] == 0
+
+
+def test_normalize_rejects_rows_without_keys():
+    frame = normalize_synaps_frame(synaps_sheet([
+        synaps_row('I1', 'F1'),
+        synaps_row(None, 'F1'),
+        synaps_row('I2', '  '),
+        synaps_row(math.nan, None),
+    ]))
+
+    assert list(frame['fing_item_number']) == ['I1']
+    assert frame.attrs['rejected_rows'] == 3
+
+
+def test_ingest_deduplicates_across_chunks(session):
+    importer = SynapsImporter(session, log=lambda message: None)
+    importer.ingest(normalize_synaps_frame(synaps_sheet(SAMPLE_ROWS[:4])))
+    importer.ingest(normalize_synaps_frame(synaps_sheet(SAMPLE_ROWS[4:])))
+    session.commit()
+
+    assert session.query(Ingredient).count() == 6
+    assert session.query(Formula).count() == 5
+    assert session.query(FormulaIngredient).count() == len(SAMPLE_ROWS)
+    assert importer.stats() == {
+        'ingredients_created': 6,
+        'formulas_created': 5,
+        'formula_ingredients_created': len(SAMPLE_ROWS),
+        'errors': 0,
+    }
+
+    # Lines keep the first ingredient and formula ids handed out
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+    formulas = {line.formula.object_number for line in session.query(FormulaIngredient).filter_by(ingredient_id=water.id)}
+    assert formulas == {'F001', 'F002', 'F003'}
+
+
+def test_ingest_counts_rejected_rows_as_errors(session):
+    importer = import_rows(session, [
+        synaps_row('I1', 'F1'),
+        synaps_row(None, 'F1'),
+        synaps_row('I1', None),
+    ])
+
+    assert importer.rows_processed == 3
+    assert importer.errors == 2
+    assert session.query(FormulaIngredient).count() == 1
+
+
+def test_ingest_only_rejected_rows(session):
+    importer = SynapsImporter(session, log=lambda message: None)
+    importer.ingest(normalize_synaps_frame(pd.DataFrame([synaps_row(None, None)])))
+
+    assert importer.rows_processed == 1
+    assert importer.errors == 1
+    assert session.query(Formula).count() == 0
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+
+import pytest
+
+from services.jobs import JobRunner
+
+from helpers import SAMPLE_ROWS, synaps_row, upload_workbook, write_workbook
+
+
+@pytest.fixture
+def runner(app, tmp_path):
+    runner = JobRunner(app, str(tmp_path / 'jobs'))
+    yield runner
+    runner.executor.shutdown(wait=True)
+
+
+def finish(runner, job):
+    deadline = time.time() + 10
+    while runner.get(job.id)['status'] not in ('succeeded', 'failed'):
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return runner.get(job.id)
+
+
+def test_job_result_and_progress(runner):
+    def work(job, rows):
+        job.progress(total_rows=rows)
+        job.log('Halfway')
+        job.progress(rows, errors=1)
+        return {'rows': rows}
+
+    state = finish(runner, runner.submit('test', work, 10))
+
+    assert state['type'] == 'test'
+    assert state['status'] == 'succeeded'
+    assert state['result'] == {'rows': 10}
+    assert (state['rows_processed'], state['total_rows'], state['errors']) == (10, 10, 1)
+    assert state['message'] == 'Completed'
+    assert state['elapsed_seconds'] >= 0
+
+
+def test_failed_job_reports_its_error(runner):
+    def work(job):
+        raise ValueError('broken file')
+
+    state = finish(runner, runner.submit('test', work))
+
+    assert (state['status'], state['error'], state['message']) == ('failed', 'broken file', 'Failed')
+
+
+def test_running_job_is_visible_from_its_file(runner):
+    started, release = threading.Event(), threading.Event()
+
+    def work(job):
+        started.set()
+        release.wait(10)
+
+    job = runner.submit('test', work)
+    started.wait(10)
+    # Another worker process only has the job file
+    other = JobRunner(runner.app, runner.jobs_dir)
+    try:
+        assert other.get(job.id)['status'] == 'running'
+        assert [state['id'] for state in other.list()] == [job.id]
+    finally:
+        release.set()
+        other.executor.shutdown()
+    assert finish(runner, job)['status'] == 'succeeded'
+
+
+def test_unknown_and_invalid_job_ids(runner, client):
+    assert runner.get('0' * 32) is None
+    assert runner.get('../etc') is None
+    assert client.get('/api/jobs/' + '0' * 32).status_code == 404
+
+
+def test_old_jobs_are_cleaned_up(runner):
+    job = finish(runner, runner.submit('test', lambda job: None))
+    path = os.path.join(runner.jobs_dir, f"{job['id']}.json")
+    old = time.time() - 2 * 24 * 60 * 60
+    runner.jobs[job['id']].finished_at = old
+    os.utime(path, (old, old))
+
+    runner.cleanup()
+
+    assert runner.get(job['id']) is None
+
+
+def test_upload_reports_rows_and_errors(client, tmp_path):
+    path = write_workbook(tmp_path / 'upload.xlsx', SAMPLE_ROWS + [synaps_row(None, 'F001')])
+
+    job = upload_workbook(client, path)
+
+    assert job['status'] == 'succeeded', job['error']
+    assert job['type'] == 'upload-excel'
+    assert job['rows_processed'] == len(SAMPLE_ROWS) + 1
+    assert job['errors'] == 1
+    assert any(state['id'] == job['id'] for state in client.get('/api/jobs').get_json()['jobs'])
@@ -0,0 +1,101 @@
+import io
+import json
+import os
+
+import pytest
+
+import app as server
+import services.json_stream as json_stream
+from models.formula import Formula, FormulaIngredient, Ingredient
+from services.json_stream import iter_json_array, json_array_keys
+
+from helpers import wait_for_job
+
+
+def write_json(tmp_path, text):
+    path = tmp_path / 'database.json'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def export(client):
+    response = client.get('/api/export-database')
+    assert response.status_code == 200
+    data = response.get_data()
+    response.close()
+    return data
+
+
+def job_count(client):
+    return len(client.get('/api/jobs').get_json()['jobs'])
+
+
+def upload(client, data, mode='replace'):
+    return client.post('/api/upload-database', data={'file': (io.BytesIO(data), 'database.json'), 'mode': mode})
+
+
+@pytest.mark.parametrize('read_size', [1, 7, 1024 * 1024])
+def test_iter_json_array_streams_one_key(tmp_path, monkeypatch, read_size):
+    monkeypatch.setattr(json_stream, 'READ_SIZE', read_size)
+    path = write_json(tmp_path, ' { "meta": {"a": [1, 2]}, "skipped": [[1], {"b": "]"}],\n'
+                                '"formulas": [{"id": 1}, 12345, "x"], "ingredients": [] } ')
+
+    assert list(iter_json_array(path, 'formulas')) == [{'id': 1}, 12345, 'x']
+    assert list(iter_json_array(path, 'ingredients')) == []
+    assert json_array_keys(path) == ['skipped', 'formulas', 'ingredients']
+    with pytest.raises(KeyError):
+        list(iter_json_array(path, 'missing'))
+
+
+@pytest.mark.parametrize('text', ['', '[]', '{"formulas": [1,, 2]}', '{"formulas": []', '{1: []}', '{} x'])
+def test_json_array_keys_rejects_invalid_json(tmp_path, text):
+    with pytest.raises(ValueError):
+        json_array_keys(write_json(tmp_path, text))
+
+
+@pytest.mark.parametrize('document', [
+    {'formulas': []},
+    {'ingredients': []},
+    {'ingredients': [], 'formulas': {}},
+    {},
+])
+def test_upload_without_arrays_is_rejected_before_queuing(client, document):
+    jobs = job_count(client)
+    response = upload(client, json.dumps(document).encode())
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid JSON format: missing ingredients or formulas'}
+    assert job_count(client) == jobs
+    assert not [name for name in os.listdir(server.app.config['UPLOAD_FOLDER']) if name.endswith('.json')]
+
+
+def test_malformed_upload_is_rejected_before_queuing(client):
+    jobs = job_count(client)
+    response = upload(client, b'{"ingredients": [], "formulas": [')
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid JSON file'}
+    assert job_count(client) == jobs
+
+
+def test_exported_database_imports_back(client, session, sample):
+    data = export(client)
+    lines = session.query(FormulaIngredient).count()
+
+    job = wait_for_job(client, upload(client, data))
+
+    assert job['status'] == 'succeeded', job['error']
+    assert job['result']['formulas_count'] == 5
+    assert session.query(Formula).count() == 5
+    assert session.query(Ingredient).count() == 6
+    assert session.query(FormulaIngredient).count() == lines
+
+
+def test_delta_upload_applies_changes(client, session, sample):
+    document = json.loads(export(client))
+    document['formulas'] = [formula for formula in document['formulas'] if formula['object_number'] != 'F005']
+
+    job = wait_for_job(client, upload(client, json.dumps(document).encode(), mode='delta'))
+
+    assert job['status'] == 'succeeded', job['error']
+    assert sorted(number for (number,) in session.query(Formula.object_number)) == ['F001', 'F002', 'F003', 'F004']
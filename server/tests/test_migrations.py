@@ -0,0 +1,59 @@
+from sqlalchemy import text
+
+from models.formula import FormulaProductionSite, db
+from services.migrations import (
+    QUERY_PLAN_SAMPLES, add_missing_tables, create_missing_indexes, missing_indexes, query_plan_report, query_plans
+)
+
+DROPPED = ['ix_formula_ingredient_ingredient_amount', 'ix_formula_brand', 'ix_ingredient_alias_ingredient_id']
+
+
+def drop_indexes(names):
+    with db.engine.begin() as connection:
+        for name in names:
+            connection.execute(text(f'DROP INDEX {name}'))
+
+
+def test_new_database_has_every_index(app):
+    with db.engine.connect() as connection:
+        assert missing_indexes(connection) == []
+    assert create_missing_indexes(db.engine, log=lambda message: None) == []
+
+
+def test_missing_indexes_are_created(app, sample):
+    drop_indexes(DROPPED)
+    with db.engine.connect() as connection:
+        assert sorted(index.name for index in missing_indexes(connection)) == sorted(DROPPED)
+
+    assert sorted(create_missing_indexes(db.engine, log=lambda message: None)) == sorted(DROPPED)
+    with db.engine.connect() as connection:
+        assert missing_indexes(connection) == []
+
+
+def test_hot_queries_use_the_indexes(app, sample):
+    plans = query_plans(db.engine)
+
+    assert set(plans) == {name for name, _ in QUERY_PLAN_SAMPLES}
+    assert any('ix_formula_ingredient_ingredient_amount' in detail
+               for detail in plans['ingredient filter with an amount range'])
+    assert any('ix_formula_brand' in detail for detail in plans['brand filter, one page in id order'])
+
+
+def test_query_plan_report(app, sample):
+    drop_indexes(['ix_formula_brand'])
+    before = query_plans(db.engine)
+    create_missing_indexes(db.engine, log=lambda message: None)
+    report = query_plan_report(before, query_plans(db.engine))
+
+    section = report.split('brand filter, one page in id order:\n')[1].split('\n')
+    brand = section[:next(i for i, line in enumerate(section + ['end']) if not line.startswith('  '))]
+    assert brand[0].startswith('  before: SCAN formula')
+    assert any(line.startswith('  after:  ') and 'ix_formula_brand' in line for line in brand)
+
+
+def test_missing_tables_are_created_and_filled(app, session, sample):
+    links = session.query(FormulaProductionSite).count()
+    FormulaProductionSite.__table__.drop(db.engine)
+
+    assert add_missing_tables(db.engine, log=lambda message: None) == ['formula_production_site']
+    assert session.query(FormulaProductionSite).count() == links == 5
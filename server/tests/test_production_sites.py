@@ -0,0 +1,65 @@
+import pytest
+
+from models.formula import Formula, FormulaProductionSite, ProductionSite
+from services.production_sites import ProductionSiteLinker, split_production_sites
+
+from helpers import search
+
+
+def test_split_production_sites():
+    assert split_production_sites('Berlin, Leverkusen,Berlin, ') == ['Berlin', 'Leverkusen']
+    assert split_production_sites('') == []
+    assert split_production_sites(None) == []
+
+
+def site_names(session, object_number):
+    formula = session.query(Formula).filter_by(object_number=object_number).one()
+    return sorted(
+        name for (name,) in session.query(ProductionSite.name).join(FormulaProductionSite)
+        .filter(FormulaProductionSite.formula_id == formula.id)
+    )
+
+
+def test_import_links_sites(session, sample):
+    assert [name for (name,) in session.query(ProductionSite.name).order_by(ProductionSite.name)] == \
+        ['Basel', 'Berlin', 'Leverkusen', 'Myerstown']
+    assert site_names(session, 'F001') == ['Berlin', 'Leverkusen']
+    assert site_names(session, 'F004') == []
+
+
+def test_filter_options_list_sites(client, sample):
+    assert client.get('/api/filter-options').get_json()['productionSites'] == \
+        ['Basel', 'Berlin', 'Leverkusen', 'Myerstown']
+
+
+def test_sync_relinks_changed_formulas_and_prune_drops_unused_sites(session, sample):
+    ids = dict(session.query(Formula.object_number, Formula.id))
+    linker = ProductionSiteLinker(session)
+    relinked = linker.sync([
+        (ids['F001'], 'Berlin, Leverkusen'),
+        (ids['F002'], 'Basel'),
+        (ids['F003'], 'Basel'),
+        (ids['F004'], None),
+    ])
+    linker.prune()
+
+    # F002 changed and F005 is gone; the others keep their links
+    assert relinked == 2
+    assert site_names(session, 'F002') == ['Basel']
+    assert session.query(FormulaProductionSite).filter_by(formula_id=ids['F005']).count() == 0
+    assert session.query(ProductionSite).filter_by(name='Myerstown').count() == 0
+
+
+@pytest.mark.parametrize('engine', ['bitmap', 'sql'])
+@pytest.mark.parametrize('value, expected', [
+    ('leverkusen', ['F001', 'F002']),
+    ('erl', ['F001']),
+    # Values that can span two sites of the list match the joined text
+    ('Berlin, Lev', ['F001']),
+    ('n%L', ['F001']),
+    ('Berli_,', ['F001']),
+    (' Leverkusen', ['F001']),
+    ('Nowhere', []),
+])
+def test_search_by_production_site(client, sample, engine, value, expected):
+    assert search(client, production_site=value, engine=engine) == expected
@@ -0,0 +1,74 @@
+import pytest
+
+import app as server
+import services.counts as counts
+from models.formula import Ingredient
+
+from helpers import search
+
+
+def hits():
+    return server.response_cache.stats()['hits']
+
+
+def get(client, url, **params):
+    response = client.get(url, query_string=params)
+    return response.status_code, response.get_json()
+
+
+def test_same_search_is_served_from_the_cache(client, sample):
+    first = get(client, '/api/formulas/search', ingredient1='water', ingredient2='chloride', brand='Alpha')
+    before = hits()
+
+    # Parameter order, filter order and term case don't matter
+    second = get(client, '/api/formulas/search', brand='Alpha', ingredient1='CHLORIDE', ingredient2='Water')
+
+    assert hits() == before + 1
+    assert second == first
+
+
+@pytest.mark.parametrize('other', [{'page': 2}, {'per_page': 1}, {'engine': 'sql'}, {'brand': 'Beta'}])
+def test_other_requests_are_not_shared(client, sample, other):
+    get(client, '/api/formulas/search', ingredient='water', per_page=2)
+    before = hits()
+
+    get(client, '/api/formulas/search', **{'ingredient': 'water', 'per_page': 2, **other})
+
+    assert hits() == before
+
+
+def test_listing_is_cached(client, sample):
+    first = get(client, '/api/formulas', brand='Beta')
+    before = hits()
+
+    assert get(client, '/api/formulas', brand='Beta') == first
+    assert hits() == before + 1
+
+
+def test_writes_invalidate_cached_responses(client, session, sample):
+    assert search(client, ingredient='aqua') == []
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+
+    assert client.post(f'/api/ingredients/{water.id}/aliases', json={'alias': 'aqua'}).status_code == 200
+    assert search(client, ingredient='aqua') == ['F001', 'F002', 'F003']
+
+
+def test_errors_are_not_cached(client, sample):
+    get(client, '/api/formulas/search', ingredient='water', min_amount='abc')
+    before = hits()
+
+    status, _ = get(client, '/api/formulas/search', ingredient='water', min_amount='abc')
+
+    assert (status, hits()) == (400, before)
+
+
+def test_estimated_totals_are_not_cached(client, sample, monkeypatch):
+    monkeypatch.setattr(counts, 'ESTIMATE_SAMPLE_SIZE', 2)
+    monkeypatch.setattr(server.count_cache, '_refine', lambda key, statement: None)
+    _, first = get(client, '/api/formulas', count='estimated')
+    before = hits()
+
+    _, second = get(client, '/api/formulas', count='estimated')
+
+    assert first['pagination']['total_exact'] is False
+    assert (second, hits()) == (first, before)
@@ -0,0 +1,55 @@
+import pytest
+
+import services.search_index as search_index
+from models.formula import Ingredient, IngredientAlias
+from services.search_index import has_search_index, ingredient_ids_matching
+
+from helpers import search
+
+TERMS = ['water', 'WAT', 'ter', 'wa', 'i-sa', 'acid', 'a%d', 'gl_c', 'paracetamol', 'ß', '', 'xyz']
+
+
+def scan(monkeypatch, term, include_item_number=False):
+    """Ids the plain ilike query finds for term"""
+    with monkeypatch.context() as patched:
+        patched.setattr(search_index, 'has_search_index', lambda connection: False)
+        return sorted(ingredient_ids_matching(term, include_item_number))
+
+
+@pytest.fixture
+def aliases(session, sample):
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+    salt = session.query(Ingredient).filter_by(fing_item_number='I-SALT').one()
+    session.add_all([IngredientAlias(alias='Aqua purificata', ingredient_id=water.id),
+                     IngredientAlias(alias='Hydrochloric acid salt', ingredient_id=salt.id)])
+    session.commit()
+
+
+def test_index_exists(session):
+    assert has_search_index(session.connection())
+
+
+@pytest.mark.parametrize('include_item_number', [False, True])
+@pytest.mark.parametrize('term', TERMS)
+def test_index_matches_the_scan(aliases, monkeypatch, term, include_item_number):
+    assert sorted(ingredient_ids_matching(term, include_item_number)) == scan(monkeypatch, term, include_item_number)
+
+
+def test_triggers_keep_the_index_current(session, aliases, monkeypatch):
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+    water.name = 'PURIFIED H2O'
+    alias = session.query(IngredientAlias).filter_by(alias='Aqua purificata').one()
+    alias.alias = 'Eau distillee'
+    session.add(Ingredient(name='LACTOSE MONOHYDRATE', fing_item_number='I-LAC'))
+    session.delete(session.query(IngredientAlias).filter_by(alias='Hydrochloric acid salt').one())
+    session.commit()
+
+    for term in ['water', 'h2o', 'aqua', 'distill', 'lactose', 'acid']:
+        assert sorted(ingredient_ids_matching(term)) == scan(monkeypatch, term), term
+    assert ingredient_ids_matching('distill') == [water.id]
+    assert ingredient_ids_matching('acid') == []
+
+
+@pytest.mark.parametrize('engine', ['bitmap', 'sql'])
+def test_search_by_alias_substring(client, aliases, engine):
+    assert search(client, ingredient='purific', engine=engine) == ['F001', 'F002', 'F003']
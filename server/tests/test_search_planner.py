@@ -0,0 +1,89 @@
+from io import BytesIO
+
+import openpyxl
+import pytest
+
+import app as server
+from services.search_planner import IngredientFilter, SearchQuery, parse_search
+
+from helpers import search
+
+
+@pytest.mark.parametrize('a, b', [
+    ({'ingredient': 'Water', 'min_amount': '5'}, {'ingredient1': 'water', 'min_amount1': '5.0'}),
+    ({'ingredient1': 'water', 'ingredient2': 'salt'}, {'ingredient1': 'SALT', 'ingredient2': 'water'}),
+    ({'ingredientFilters[0][name]': 'water', 'ingredientFilters[0][maxAmount]': '2', 'ingredientFilters[0][unit]': 'g'},
+     {'ingredient': 'water', 'max_amount': '2000', 'unit': 'mg'}),
+    ({'ingredient': 'water', 'unit': 'g'}, {'ingredient': 'water'}),
+    ({'exclude_ingredient1': 'Talc', 'exclude_ingredient2': 'salt'},
+     {'exclude_ingredient1': 'salt', 'exclude_ingredient2': 'talc', 'exclude_ingredient3': ''}),
+    ({'brand': 'Alpha', 'formulation_name': 'Tablet'}, {'formulation_name': 'tablet', 'brand': 'Alpha'}),
+])
+def test_equal_searches_have_one_canonical_query(a, b):
+    assert parse_search(a) == parse_search(b)
+    assert hash(parse_search(a)) == hash(parse_search(b))
+
+
+def test_exact_attributes_keep_their_case():
+    assert parse_search({'brand': 'Alpha'}) != parse_search({'brand': 'alpha'})
+
+
+def test_parsed_query():
+    query = parse_search({'ingredient1': 'Water', 'min_amount1': '1', 'max_amount1': '2', 'unit1': 'g',
+                          'ingredient2': 'salt', 'exclude_ingredient1': 'Talc', 'category': 'Pain'})
+
+    assert query == SearchQuery(
+        (IngredientFilter('salt', None, None, None), IngredientFilter('water', 1000.0, 2000.0, 'mg')),
+        ('talc',),
+        (('category', 'Pain'),),
+    )
+
+
+def test_plan_drops_filters_implied_by_ranged_ones(app, sample):
+    plan = server.search_planner.plan(parse_search({'ingredient1': 'water', 'ingredient2': 'water', 'min_amount2': '1'}))
+
+    assert plan.query.includes == (IngredientFilter('water', 1.0, None, None),)
+
+
+def test_plan_spots_contradictions_and_empty_ranges(app, sample):
+    planner = server.search_planner
+
+    assert planner.plan(parse_search({'ingredient': 'water', 'exclude_ingredient1': 'water'})).contradictory
+    assert planner.plan(parse_search({'ingredient': 'water', 'min_amount': '5', 'max_amount': '1'})).no_includes_match
+    assert planner.plan(parse_search({'ingredient': 'no such ingredient'})).no_includes_match
+
+
+def test_plans_are_memoized(app, sample):
+    query = parse_search({'ingredient': 'water'})
+
+    assert server.search_planner.plan(query) is server.search_planner.plan(parse_search({'ingredient': 'WATER'}))
+
+
+def exported(client, **params):
+    response = client.get('/api/formulas/export', query_string=params)
+    assert response.status_code == 200
+    data = response.get_data()
+    response.close()
+    if not data:
+        return []
+    rows = openpyxl.load_workbook(BytesIO(data)).active.iter_rows(min_row=2, values_only=True)
+    return [row[0] for row in rows]
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'ingredient': 'water'},
+    {'ingredient': 'water', 'min_amount': '1', 'max_amount': '3', 'unit': 'g'},
+    {'ingredient1': 'water', 'exclude_ingredient1': 'paracetamol', 'brand': 'Beta'},
+    {'exclude_ingredient1': 'water', 'production_site': 'town'},
+    {'ingredient': 'no such ingredient'},
+])
+def test_export_has_the_search_results(client, sample, params):
+    assert exported(client, **params) == search(client, **params)
+
+
+def test_export_rejects_what_search_rejects(client, sample):
+    params = {'ingredient': 'water', 'min_amount': '1', 'unit': 'lbs'}
+
+    assert client.get('/api/formulas/export', query_string=params).status_code == 400
+    assert client.get('/api/formulas/search', query_string=params).status_code == 400
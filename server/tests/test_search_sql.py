@@ -0,0 +1,68 @@
+import pytest
+
+import app as server
+import services.search_planner as search_planner
+from services.search_planner import parse_search
+from services.search_sql import count_formulas_sql, includes_match_nothing, search_formulas_sql
+
+QUERIES = [
+    {},
+    {'ingredient': 'water'},
+    {'ingredient1': 'water', 'ingredient2': 'chloride'},
+    {'ingredient': 'water', 'exclude_ingredient1': 'paracetamol'},
+    {'exclude_ingredient1': 'water', 'exclude_ingredient2': 'talc'},
+    {'ingredient': 'water', 'min_amount': 1, 'max_amount': 200},
+    {'ingredient': 'water', 'min_amount': 1, 'max_amount': 3, 'unit': 'g'},
+    {'ingredient': 'water', 'brand': 'Alpha'},
+    {'ingredient': 'nothing like it'},
+    {'ingredient': 'nothing like it', 'brand': 'Alpha'},
+    {'brand': 'Gamma', 'category': 'Cold'},
+    {'formulation_name': 'formula f00'},
+]
+
+
+def response(client, engine, params, page):
+    return client.get('/api/formulas/search', query_string={**params, 'engine': engine, 'page': page, 'per_page': 2})
+
+
+@pytest.mark.parametrize('page', [1, 2, 5])
+@pytest.mark.parametrize('params', QUERIES)
+def test_sql_engine_answers_like_the_bitmap_engine(client, sample, params, page):
+    bitmap = response(client, 'bitmap', params, page)
+    sql = response(client, 'sql', params, page)
+
+    assert (sql.status_code, sql.get_json()) == (bitmap.status_code, bitmap.get_json())
+
+
+def test_single_statement_search(app, sample):
+    query = parse_search({'ingredient': 'water', 'exclude_ingredient1': 'chloride'})
+
+    formulas, total = search_formulas_sql(query, 1, 1)
+    assert ([formula.object_number for formula in formulas], total) == (['F002'], 2)
+    # Past the last page the total is still counted
+    assert search_formulas_sql(query, 3, 1) == ([], 2)
+    assert search_formulas_sql(query, 1, 10, with_total=False)[1] is None
+    assert count_formulas_sql(query) == 2
+
+
+def test_includes_match_nothing(app, sample):
+    assert includes_match_nothing(parse_search({'ingredient': 'nothing like it', 'brand': 'Alpha'}))
+    assert includes_match_nothing(parse_search({'ingredient1': 'paracetamol', 'ingredient2': 'ibuprofen'}))
+    assert not includes_match_nothing(parse_search({'ingredient': 'water', 'brand': 'Gamma'}))
+
+
+def test_plan_checks_its_includes_only_for_empty_results(app, sample, monkeypatch):
+    checks = []
+    monkeypatch.setattr(search_planner, 'includes_match_nothing', lambda query: checks.append(query) or False)
+
+    plan = server.search_planner.plan(parse_search({'ingredient': 'water', 'brand': 'Gamma'}))
+    assert not plan.includes_match_nothing(3)
+    assert checks == []
+    assert not plan.includes_match_nothing(0)
+    assert not plan.includes_match_nothing(0)
+    assert checks == [plan.query]
+
+    # With only ingredient filters, an empty result is enough
+    assert server.search_planner.plan(parse_search({'ingredient': 'water', 'min_amount': 10000})).includes_match_nothing(0)
+    assert not server.search_planner.plan(parse_search({'brand': 'Nobody'})).includes_match_nothing(0)
+    assert len(checks) == 1
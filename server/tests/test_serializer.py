@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy import event
+
+from models.formula import Formula, Ingredient, db
+from services.serializer import (
+    DETAIL_FIELDS, DETAIL_INGREDIENT_FIELDS, INGREDIENT_FIELDS, SUMMARY_FIELDS, serialize_formula_detail,
+    serialize_formulas
+)
+
+from helpers import import_rows, synaps_row
+
+
+def orm_serialized(formula, fields, ingredient_fields):
+    """A formula serialized one lazy-loaded line and ingredient at a time"""
+    return {
+        **{field: getattr(formula, field) for field in fields},
+        'ingredients': [
+            {**{field: getattr(db.session.get(Ingredient, line.ingredient_id), field) for field in ingredient_fields},
+             'amount': line.amount, 'unit': line.unit}
+            for line in formula.ingredients
+        ],
+    }
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self.count_statement)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self.count_statement)
+
+    def count_statement(self, *args):
+        self.count += 1
+
+
+def test_formulas_match_their_rows(session, sample):
+    formulas = session.query(Formula).order_by(Formula.id).all()
+
+    assert serialize_formulas(formulas) == [orm_serialized(formula, SUMMARY_FIELDS, INGREDIENT_FIELDS)
+                                            for formula in formulas]
+    assert serialize_formula_detail(formulas[0]) == orm_serialized(formulas[0], DETAIL_FIELDS, DETAIL_INGREDIENT_FIELDS)
+
+
+@pytest.mark.parametrize('formula_count', [1, 50])
+def test_ingredients_take_one_query(session, formula_count):
+    import_rows(session, [synaps_row(f'I{line}', f'F{number}') for number in range(formula_count) for line in range(3)])
+    formulas = session.query(Formula).all()
+
+    with StatementCounter() as counter:
+        result = serialize_formulas(formulas)
+
+    assert counter.count == 1
+    assert sum(len(formula['ingredients']) for formula in result) == 3 * formula_count
+
+
+def test_formulas_without_lines(session):
+    assert serialize_formulas([]) == []
+    session.add(Formula(object_number='F1', formulation_name='Empty'))
+    session.commit()
+
+    assert serialize_formulas(session.query(Formula).all())[0]['ingredients'] == []
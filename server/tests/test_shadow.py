@@ -0,0 +1,77 @@
+import threading
+
+import services.shadow as shadow
+from models.formula import Formula, Ingredient, IngredientAlias
+from services.importer import SynapsImporter, normalize_synaps_frame
+from services.metadata import get_metadata, set_metadata
+from services.shadow import build_and_swap, live_database_path, swap_lock
+
+from helpers import SAMPLE_ROWS, import_rows, synaps_row, synaps_sheet
+
+
+def populate_with(rows):
+    def populate(session):
+        importer = SynapsImporter(session, log=lambda message: None)
+        importer.ingest(normalize_synaps_frame(synaps_sheet(rows)))
+        return importer
+    return populate
+
+
+def alias_of(session, number, alias):
+    ingredient = session.query(Ingredient).filter_by(fing_item_number=number).one()
+    return IngredientAlias(alias=alias, ingredient_id=ingredient.id)
+
+
+def test_swap_replaces_the_database_and_carries_aliases_over(session, sample):
+    session.add(alias_of(session, 'I-WATER', 'aqua'))
+    set_metadata(session, 'note', 'kept')
+    session.commit()
+    path = live_database_path()
+
+    importer, aliases_copied = build_and_swap(
+        populate_with([synaps_row('I-WATER', 'F100', 'WATER'), synaps_row('I-NEW', 'F100')]),
+        log=lambda message: None, metadata={'source': 'test'}
+    )
+
+    assert live_database_path() == path
+    assert importer.stats()['formulas_created'] == 1
+    assert aliases_copied == 1
+    assert [number for (number,) in session.query(Formula.object_number)] == ['F100']
+    assert [alias.alias for alias in session.query(IngredientAlias)] == ['aqua']
+    assert (get_metadata(session, 'note'), get_metadata(session, 'source')) == ('kept', 'test')
+
+
+def test_alias_edits_while_the_new_database_is_indexed_are_kept(session, sample, monkeypatch):
+    session.add(alias_of(session, 'I-SALT', 'brine'))
+    session.commit()
+    create_search_index = shadow.create_search_index
+
+    def edit_aliases_meanwhile(connection):
+        # An alias endpoint writing to the live database while the import finishes
+        session.add(alias_of(session, 'I-WATER', 'aqua'))
+        session.query(IngredientAlias).filter_by(alias='brine').delete()
+        session.commit()
+        return create_search_index(connection)
+
+    monkeypatch.setattr(shadow, 'create_search_index', edit_aliases_meanwhile)
+    build_and_swap(populate_with(SAMPLE_ROWS), log=lambda message: None)
+
+    assert [alias.alias for alias in session.query(IngredientAlias)] == ['aqua']
+
+
+def test_alias_endpoints_wait_for_a_swap(client, session, sample):
+    ingredient_id = session.query(Ingredient.id).filter_by(fing_item_number='I-WATER').scalar()
+    responses = []
+
+    def add_alias():
+        responses.append(client.post(f'/api/ingredients/{ingredient_id}/aliases', json={'alias': 'aqua'}))
+
+    with swap_lock():
+        writer = threading.Thread(target=add_alias)
+        writer.start()
+        writer.join(0.3)
+        assert writer.is_alive()
+    writer.join(5)
+
+    assert responses[0].status_code == 200
+    assert session.query(IngredientAlias).filter_by(alias='aqua').count() == 1
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from services.formula_index import FormulaIndex
+from services.similarity import CompositionMatrix
+
+from helpers import import_rows, synaps_row
+
+
+def random_index(seed, formulas=60, ingredients=15, lines=400):
+    random = np.random.default_rng(seed)
+    ingredient_ids = random.integers(0, ingredients, lines).astype(np.int32)
+    formula_ids = random.integers(1, formulas, lines).astype(np.int32)
+    amounts = random.choice([0.0, 1.0, 2.5, 10.0, np.nan], lines)
+    return FormulaIndex(0, np.unique(formula_ids), ingredient_ids, formula_ids, amounts)
+
+
+def dense_weights(index):
+    """(weights, present) of the composition computed directly from the definition, as dense matrices"""
+    ingredient_count = len(index.indptr) - 1
+    amounts = np.zeros((index.size, ingredient_count))
+    present = np.zeros((index.size, ingredient_count), dtype=bool)
+    np.add.at(amounts, (index.postings, index.row_ingredients), np.clip(np.nan_to_num(index.amounts), 0, None))
+    present[index.postings, index.row_ingredients] = True
+
+    totals = amounts.sum(axis=1, keepdims=True)
+    counts = present.sum(axis=1, keepdims=True)
+    shares = np.where(totals > 0, amounts / np.where(totals > 0, totals, 1), present / np.maximum(counts, 1))
+    idf = np.log((1 + index.formulas.sum()) / (1 + present.sum(axis=0))) + 1
+    return shares * idf * present, present
+
+
+def dense_similar(weights, formula_id, metric, limit):
+    own = weights[formula_id]
+    if metric == 'cosine':
+        norms = np.linalg.norm(weights, axis=1) * np.linalg.norm(own)
+        scores = np.divide(weights @ own, norms, out=np.zeros(len(weights)), where=norms > 0)
+    else:
+        maximums = np.maximum(weights, own).sum(axis=1)
+        scores = np.divide(np.minimum(weights, own).sum(axis=1), maximums, out=np.zeros(len(weights)), where=maximums > 0)
+    scores[formula_id] = 0
+    ranked = sorted((-score, candidate) for candidate, score in enumerate(scores) if score > 1e-12)
+    return [candidate for _, candidate in ranked[:limit]], scores
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'jaccard'])
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_similar_matches_the_dense_definition(metric, seed):
+    index = random_index(seed)
+    matrix = CompositionMatrix(index)
+    weights, present = dense_weights(index)
+
+    for formula_id in np.flatnonzero(index.formulas)[:15]:
+        expected, scores = dense_similar(weights, formula_id, metric, 5)
+        result = matrix.similar(int(formula_id), metric, 5)
+        assert [scores[candidate] for candidate, _, _ in result] == pytest.approx([scores[c] for c in expected])
+        for candidate, score, shared in result:
+            assert score == pytest.approx(scores[candidate])
+            # Ingredients in both formulas, lines weighing nothing included
+            assert shared == np.count_nonzero(present[candidate] & present[formula_id])
+
+
+def test_unknown_formulas_and_metrics():
+    matrix = CompositionMatrix(random_index(1))
+
+    assert matrix.similar(-1) == []
+    assert matrix.similar(10 ** 6) == []
+    with pytest.raises(ValueError):
+        matrix.similar(int(np.flatnonzero(matrix.formulas)[0]), 'euclidean')
+
+
+@pytest.fixture
+def family(session):
+    import_rows(session, [
+        synaps_row('I-API', 'F1', quantity=100), synaps_row('I-FILL', 'F1', quantity=50), synaps_row('I-WATER', 'F1'),
+        synaps_row('I-API', 'F2', quantity=100), synaps_row('I-FILL', 'F2', quantity=60), synaps_row('I-WATER', 'F2'),
+        synaps_row('I-API', 'F3', quantity=10), synaps_row('I-OTHER', 'F3', quantity=90), synaps_row('I-WATER', 'F3'),
+        synaps_row('I-ELSE', 'F4'),
+    ])
+
+
+def similar(client, object_number, **params):
+    response = client.get(f'/api/formulas/{object_number}/similar', query_string=params)
+    return response.status_code, response.get_json()
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'jaccard'])
+def test_similar_endpoint_ranks_closest_first(client, family, metric):
+    status, data = similar(client, 'F1', metric=metric)
+
+    assert status == 200
+    assert (data['object_number'], data['metric']) == ('F1', metric)
+    assert [formula['object_number'] for formula in data['formulas']] == ['F2', 'F3']
+    assert [formula['shared_ingredients'] for formula in data['formulas']] == [3, 2]
+    assert 1 >= data['formulas'][0]['similarity'] > data['formulas'][1]['similarity'] > 0
+    assert len(data['formulas'][0]['ingredients']) == 3
+
+
+def test_similar_endpoint_limits_and_errors(client, family):
+    assert [formula['object_number'] for formula in similar(client, 'F1', limit=1)[1]['formulas']] == ['F2']
+    assert len(similar(client, 'F1', limit=0)[1]['formulas']) == 1
+    assert similar(client, 'F4')[1]['formulas'] == []
+    assert similar(client, 'F1', metric='euclidean')[0] == 400
+    assert similar(client, 'F999')[0] == 404
@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+
+import app as server
+from models.formula import Formula, FormulaIngredient
+from services.importer import normalize_synaps_frame
+from services.snapshot import (
+    SnapshotWriter, file_digest, has_snapshot, iter_snapshot_chunks, snapshot_dir, snapshot_row_count
+)
+
+from helpers import SAMPLE_ROWS, end_session, synaps_row, synaps_sheet, write_workbook
+
+
+def frames_of(rows, size):
+    return [normalize_synaps_frame(synaps_sheet(rows[start:start + size])) for start in range(0, len(rows), size)]
+
+
+def write_snapshot(directory, frames):
+    writer = SnapshotWriter(directory)
+    for frame in frames:
+        writer.append(frame)
+    writer.close()
+
+
+def test_snapshot_round_trip(tmp_path):
+    rows = SAMPLE_ROWS + [synaps_row(None, 'F009'), synaps_row('I-X', 'F009', quantity='abc')]
+    frames = frames_of(rows, 4)
+    directory = snapshot_dir(str(tmp_path), 'digest')
+    write_snapshot(directory, frames)
+
+    assert has_snapshot(directory)
+    assert snapshot_row_count(directory) == len(rows)
+
+    chunks = list(iter_snapshot_chunks(directory, chunk_size=3))
+    expected = pd.concat(frames, ignore_index=True)
+    loaded = pd.concat(chunks, ignore_index=True)
+    assert list(loaded.columns) == list(expected.columns)
+    for column in expected.columns:
+        assert list(loaded[column]) == list(expected[column]), column
+    # Counts cover the whole sheet and are reported on the first chunk only
+    assert [chunk.attrs['rejected_rows'] for chunk in chunks] == [1] + [0] * (len(chunks) - 1)
+    assert sum(chunk.attrs['invalid_amounts'] for chunk in chunks) == 1
+
+
+def test_snapshot_keeps_existing_and_prunes_others(tmp_path):
+    old = snapshot_dir(str(tmp_path), 'old')
+    current = snapshot_dir(str(tmp_path), 'current')
+    write_snapshot(old, frames_of(SAMPLE_ROWS, 100))
+    write_snapshot(current, frames_of(SAMPLE_ROWS[:2], 100))
+    write_snapshot(current, frames_of(SAMPLE_ROWS, 100))
+
+    assert not os.path.exists(old)
+    assert snapshot_row_count(current) == 2
+
+
+def test_empty_writer_writes_nothing(tmp_path):
+    directory = snapshot_dir(str(tmp_path), 'digest')
+    SnapshotWriter(directory).close()
+
+    assert not has_snapshot(directory)
+
+
+def test_startup_import_reuses_the_snapshot(app, session, tmp_path, monkeypatch):
+    path = write_workbook(tmp_path / 'startup.xlsx', SAMPLE_ROWS)
+    monkeypatch.setattr(server, 'STARTUP_EXCEL_PATH', path)
+    snapshot = snapshot_dir(app.config['UPLOAD_FOLDER'], file_digest(path))
+
+    assert server.initialize_database_from_excel()
+    end_session()
+    assert has_snapshot(snapshot)
+    lines = session.query(FormulaIngredient).count()
+
+    # The second load reads the snapshot, not the workbook
+    monkeypatch.setattr(server, 'iter_excel_chunks', None)
+    assert server.initialize_database_from_excel()
+    end_session()
+    assert session.query(Formula).count() == 5
+    assert session.query(FormulaIngredient).count() == lines == len(SAMPLE_ROWS)
@@ -0,0 +1,63 @@
+import os
+
+import app as server
+from models.formula import DatabaseMetadata, db
+from services.metadata import (
+    SCHEMA_VERSION, SCHEMA_VERSION_KEY, SOURCE_STAT_KEY, file_stat, get_metadata, rebuild_reason, set_metadata
+)
+
+from helpers import SAMPLE_ROWS, end_session, synaps_row, write_workbook
+
+
+def load(monkeypatch, path):
+    monkeypatch.setattr(server, 'STARTUP_EXCEL_PATH', path)
+    assert server.initialize_database_from_excel()
+    end_session()
+
+
+def test_empty_database_needs_a_rebuild(app, tmp_path):
+    path = write_workbook(tmp_path / 'startup.xlsx', SAMPLE_ROWS)
+
+    assert rebuild_reason(path) == f'schema version None does not match {SCHEMA_VERSION}'
+
+
+def test_loaded_database_is_current(app, session, tmp_path, monkeypatch):
+    path = write_workbook(tmp_path / 'startup.xlsx', SAMPLE_ROWS)
+    load(monkeypatch, path)
+
+    assert get_metadata(session, SCHEMA_VERSION_KEY) == str(SCHEMA_VERSION)
+    assert rebuild_reason(path) is None
+    # Without a workbook there is nothing to rebuild from
+    assert rebuild_reason(str(tmp_path / 'missing.xlsx')) is None
+
+
+def test_touched_workbook_is_hashed_once(app, session, tmp_path, monkeypatch):
+    path = write_workbook(tmp_path / 'startup.xlsx', SAMPLE_ROWS)
+    load(monkeypatch, path)
+    os.utime(path, ns=(1, 1))
+
+    assert rebuild_reason(path) is None
+    assert get_metadata(session, SOURCE_STAT_KEY) == file_stat(path)
+
+
+def test_changed_workbook_needs_a_rebuild(app, tmp_path, monkeypatch):
+    path = write_workbook(tmp_path / 'startup.xlsx', SAMPLE_ROWS)
+    load(monkeypatch, path)
+    write_workbook(path, SAMPLE_ROWS + [synaps_row('I-NEW', 'F009')])
+
+    assert rebuild_reason(path) == 'source workbook changed'
+
+
+def test_schema_version_change_needs_a_rebuild(app, session, tmp_path, monkeypatch):
+    path = write_workbook(tmp_path / 'startup.xlsx', SAMPLE_ROWS)
+    load(monkeypatch, path)
+    set_metadata(session, SCHEMA_VERSION_KEY, SCHEMA_VERSION - 1)
+    session.commit()
+
+    assert rebuild_reason(path) == f'schema version {SCHEMA_VERSION - 1} does not match {SCHEMA_VERSION}'
+
+
+def test_database_without_metadata_needs_a_rebuild(app, tmp_path):
+    DatabaseMetadata.__table__.drop(db.engine)
+
+    assert rebuild_reason(str(tmp_path / 'startup.xlsx')) == 'database has no metadata table'
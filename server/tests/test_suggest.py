@@ -0,0 +1,63 @@
+import pytest
+
+import app as server
+from models.formula import Ingredient, IngredientAlias
+from services.suggest import IngredientSuggestIndex
+
+
+@pytest.fixture
+def index(session, sample):
+    water = session.query(Ingredient).filter_by(fing_item_number='I-WATER').one()
+    session.add_all([IngredientAlias(alias='Aqua purificata', ingredient_id=water.id),
+                     IngredientAlias(alias='Sterile water', ingredient_id=water.id)])
+    session.commit()
+    server.data_changed()
+    return IngredientSuggestIndex(server.data_generation).current(session)
+
+
+def matches(suggestions):
+    return [(suggestion['name'], suggestion['match']) for suggestion in suggestions]
+
+
+def test_prefixes_rank_before_later_words_and_substrings(index):
+    assert matches(index.suggest('s', 10)) == [('SODIUM CHLORIDE', 'SODIUM CHLORIDE'), ('WATER PURIFIED', 'Sterile water')]
+    assert matches(index.suggest('chlor', 10)) == [('SODIUM CHLORIDE', 'SODIUM CHLORIDE')]
+    assert matches(index.suggest('ceta', 10)) == [('PARACETAMOL', 'PARACETAMOL')]
+    # Substrings need 3 characters
+    assert index.suggest('ce', 10) == []
+
+
+def test_each_ingredient_once_with_its_best_match(index):
+    suggestions = index.suggest('wat', 10)
+
+    assert matches(suggestions) == [('WATER PURIFIED', 'WATER PURIFIED')]
+    assert suggestions[0]['aliases'] == ['Aqua purificata', 'Sterile water']
+    assert suggestions[0]['fing_item_number'] == 'I-WATER'
+
+
+def test_item_numbers_and_limits(index):
+    assert [suggestion['fing_item_number'] for suggestion in index.suggest('i-', 3)] == ['I-GLYC', 'I-IBU', 'I-PARA']
+    assert index.suggest('  ', 10) == []
+    assert index.suggest('xyz', 10) == []
+
+
+def test_index_follows_changes(session, index):
+    talc = session.query(Ingredient).filter_by(fing_item_number='I-TALC').one()
+    session.add(IngredientAlias(alias='Soapstone', ingredient_id=talc.id))
+    session.query(IngredientAlias).filter_by(alias='Sterile water').delete()
+    session.commit()
+    server.data_changed()
+    index.current(session)
+
+    assert matches(index.suggest('soap', 10)) == [('TALC', 'Soapstone')]
+    assert matches(index.suggest('sterile', 10)) == []
+    assert index.suggest('soap', 10)[0]['aliases'] == ['Soapstone']
+
+
+def test_suggest_endpoint(client, index):
+    response = client.get('/api/ingredients/suggest', query_string={'search': 'para', 'limit': 500})
+
+    assert response.status_code == 200
+    assert matches(response.get_json()['ingredients']) == [('PARACETAMOL', 'PARACETAMOL')]
+    assert client.get('/api/ingredients/suggest').get_json() == {'ingredients': []}
+    assert len(client.get('/api/ingredients/suggest', query_string={'search': 'i-', 'limit': 0}).get_json()['ingredients']) == 1
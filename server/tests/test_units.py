@@ -0,0 +1,121 @@
+import pytest
+
+from models.formula import FormulaIngredient
+from services.importer import DatabaseJsonImporter, DeltaImporter, database_json_frames
+from services.units import (
+    amount_parsed, backfill_normalized_amounts, normalize_amount, normalize_amounts, to_canonical, unit_key
+)
+
+from helpers import search
+
+
+def test_unit_key():
+    assert unit_key(' M G. ') == 'mg'
+    assert unit_key('%W/W') == '%w/w'
+
+
+def test_normalize_amounts():
+    normalized = normalize_amounts([0.3, 300, 5, 2, 0.0, 7], ['g', 'MG', 'IU', 'l', 'mg', None],
+                                   [True, True, True, True, False, True])
+
+    assert list(normalized['normalized_amount']) == [300.0, 300.0, None, 2000.0, None, None]
+    units = zip(normalized['normalized_unit'], normalized['amount_convertible'])
+    assert [unit if convertible else None for unit, convertible in units] == ['mg', 'mg', None, 'ml', None, None]
+    assert list(normalized['amount_convertible']) == [True, True, False, True, False, False]
+
+
+def test_normalize_amount_matches_normalize_amounts():
+    assert normalize_amount(1.5, 'ug') == {'normalized_amount': 0.0015, 'normalized_unit': 'mg', 'amount_convertible': True}
+    assert normalize_amount(1.5, 'ug', parsed=False) == \
+        {'normalized_amount': None, 'normalized_unit': None, 'amount_convertible': False}
+
+
+def test_to_canonical():
+    assert to_canonical(2, 'kg') == (2000000.0, 'mg')
+    with pytest.raises(ValueError, match="Unknown unit 'furlong'"):
+        to_canonical(1, 'furlong')
+
+
+def test_amount_parsed_without_a_flag():
+    assert amount_parsed(0.0) is False
+    assert amount_parsed(2.5) is True
+    assert amount_parsed(0.0, True) is True
+    assert amount_parsed(2.5, False) is False
+
+
+# Lines of an exported database: (amount, unit, amount_convertible or missing)
+EXPORTED_LINES = [(0.0, 'mg', None), (5.0, 'g', None), (0.0, 'mg', True), (3.0, 'mg', False), (4.0, 'IU', None)]
+
+
+def exported_database():
+    ingredients = [{'id': 7, 'fing_item_number': 'I1', 'name': 'WATER'}]
+    lines = []
+    for amount, unit, convertible in EXPORTED_LINES:
+        line = {'ingredient_id': 7, 'amount': amount, 'unit': unit}
+        if convertible is not None:
+            line['amount_convertible'] = convertible
+        lines.append(line)
+    return ingredients, [{'object_number': 'F1', 'formulation_name': 'Formula F1', 'ingredients': lines}]
+
+
+def normalized_lines(session):
+    """(normalized_amount, normalized_unit, amount_convertible) of the lines, in EXPORTED_LINES order"""
+    return [
+        (line.normalized_amount, line.normalized_unit, line.amount_convertible)
+        for line in session.query(FormulaIngredient).order_by(FormulaIngredient.id)
+    ]
+
+
+def test_lines_without_a_flag_normalize_alike_on_every_load_path(session):
+    ingredients, formulas = exported_database()
+
+    importer = DatabaseJsonImporter(session, log=lambda message: None)
+    importer.add_ingredients(ingredients)
+    importer.add_formulas(formulas)
+    session.commit()
+    full_import = normalized_lines(session)
+    assert full_import == [
+        (None, None, False),
+        (5000.0, 'mg', True),
+        (0.0, 'mg', True),
+        (None, None, False),
+        (None, None, False),
+    ]
+
+    session.query(FormulaIngredient).delete()
+    delta = DeltaImporter(session, log=lambda message: None)
+    delta.add(*database_json_frames(ingredients, formulas))
+    delta.apply()
+    session.commit()
+    assert normalized_lines(session) == full_import
+
+    # A database from before the normalized columns, where no line has a flag
+    session.query(FormulaIngredient).update(
+        {'normalized_amount': None, 'normalized_unit': None, 'amount_convertible': True}
+    )
+    backfill_normalized_amounts(session.connection())
+    session.commit()
+    unflagged = [convertible is None for _, _, convertible in EXPORTED_LINES]
+    assert [line for line, keep in zip(normalized_lines(session), unflagged) if keep] == \
+        [line for line, keep in zip(full_import, unflagged) if keep]
+
+
+@pytest.mark.parametrize('engine', ['bitmap', 'sql'])
+def test_search_range_across_units(client, sample, engine):
+    # WATER: 100 mg in F001, 2 g in F002 and Q.S. in F003
+    assert search(client, ingredient='water', min_amount=50, max_amount=3000, unit='mg', engine=engine) == ['F001', 'F002']
+    assert search(client, ingredient='water', min_amount=0.05, max_amount=0.2, unit='g', engine=engine) == ['F001']
+    assert search(client, ingredient='water', min_amount=0, unit='mg', engine=engine) == ['F001', 'F002']
+    # Without a unit the range applies to the amounts as entered
+    assert search(client, ingredient='water', min_amount=1, max_amount=3, engine=engine) == ['F002']
+
+
+@pytest.mark.parametrize('path', ['/api/formulas/search', '/api/formulas/export'])
+@pytest.mark.parametrize('params, error', [
+    ({'ingredient1': 'water', 'min_amount1': 1, 'unit1': 'furlong'}, "Unknown unit 'furlong'"),
+    ({'ingredient1': 'water', 'min_amount1': 'abc'}, "Invalid amount 'abc'"),
+])
+def test_invalid_filter_values_are_client_errors(client, sample, path, params, error):
+    response = client.get(path, query_string=params)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}